@@ -0,0 +1,83 @@
+"""
+Benchmark: rescue team allocation
+Times the greedy whole-set plan at 1000 incidents x 200 teams (target:
+under 50 ms) and incremental assign() per arriving incident, then
+compares greedy against the exact Hungarian plan on small instances.
+
+Run:  python benchmarks/bench_allocation.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.allocation import Allocator, Incident, Team, SUPPLIES
+
+RISKS = ("HIGH", "CRITICAL")
+
+
+def make_teams(rng, count, size_km=20.0):
+    return [Team(f"T{i}", tuple(rng.random(2) * size_km), float(rng.uniform(30, 60)),
+                 int(rng.integers(1, 4)), int(rng.integers(0, 8)) | SUPPLIES)
+            for i in range(count)]
+
+
+def make_incidents(rng, count, size_km=20.0):
+    return [Incident(i, f"Zone_{i}", tuple(rng.random(2) * size_km),
+                     RISKS[int(rng.integers(0, 2))], float(rng.uniform(0, 10)))
+            for i in range(count)]
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rng = np.random.default_rng(42)
+
+    teams = make_teams(rng, 200)
+    incidents = make_incidents(rng, 1000)
+    allocator = Allocator(teams)
+    plan = best_of(lambda: allocator.plan(incidents))
+    print(f"greedy plan, 1000 incidents x 200 teams: {plan * 1000:8.2f} ms")
+
+    def arrive():
+        live = Allocator(teams)
+        for incident in incidents:
+            live.assign(incident)
+    per = best_of(arrive) / len(incidents)
+    print(f"incremental assign(), per incident:      {per * 1e6:8.1f} us")
+
+    # Greedy vs exact on instances small enough for the Hungarian solver
+    print()
+    print(f"{'incidents':>10} {'teams':>6} {'greedy':>10} {'optimal':>10} "
+          f"{'gap':>7} {'exact ms':>9}")
+    for n_inc, n_team in [(4, 3), (6, 4), (8, 6), (8, 3)]:
+        gaps, exact = [], []
+        for _ in range(50):
+            teams = make_teams(rng, n_team)
+            incidents = make_incidents(rng, n_inc)
+            greedy = Allocator(teams, optimal_limit=0)
+            optimal = Allocator(teams, optimal_limit=n_inc)
+            g = greedy.total_cost(incidents, greedy.plan(incidents))
+            start = time.perf_counter()
+            o = optimal.total_cost(incidents, optimal.plan(incidents))
+            exact.append(time.perf_counter() - start)
+            gaps.append((g, o))
+        g = sum(x for x, _ in gaps)
+        o = sum(y for _, y in gaps)
+        print(f"{n_inc:>10} {n_team:>6} {g:>10.1f} {o:>10.1f} {(g - o) / o:>6.1%} "
+              f"{np.mean(exact) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
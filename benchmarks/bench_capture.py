@@ -0,0 +1,124 @@
+"""
+Benchmark: capture write, read and replay rates
+Writes N sensor-reading INFORMs (64 zones, lab4's metadata) to a capture
+and reports the cost per message and bytes per message next to one JSON
+line per message (the runtime's wire format). Reads the capture back
+streamed in chunks and through mmap, with the peak memory tracemalloc
+sees while reading, which should not depend on N. Then replays the first
+REPLAYED readings at full speed (speed=0) into lab4's RiskAgent,
+CoordinatorAgent and RescueAgent on a LocalBus and reports readings/s.
+
+Run:  python benchmarks/bench_capture.py [messages]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+
+import lab4_fipa_acl as lab4
+from common import runtime
+from common.capture import CaptureReader, CaptureWriter, ReplayAgent, message
+from common.schema import SENSOR_READING
+from common.transport import LocalBus
+
+ZONES = 64
+REPLAYED = 50_000
+BODIES = 4096
+
+
+def write(path, n):
+    random.seed(1)
+    bodies = [SENSOR_READING.encode(lab4.read_sensors()) for _ in range(BODIES)]
+    metadata = [{"performative": "inform", "ontology": "sensor-reading",
+                 "language": "disaster-sl", "zone": f"Zone_{zone}"} for zone in range(ZONES)]
+    senders = [f"takyisky.sensor4-{zone}@xmpp.jp" for zone in range(ZONES)]
+    writer = CaptureWriter(path)
+    start = time.perf_counter()
+    for i in range(n):
+        zone = i % ZONES
+        writer.append(i * 4.0 / ZONES, senders[zone], "takyisky.risk4@xmpp.jp", metadata[zone],
+                      bodies[i % BODIES], f"sensor4-{zone}-{i}")
+    writer.close()
+    return time.perf_counter() - start
+
+
+def read(path, mmap):
+    start = time.perf_counter()
+    n = sum(1 for _ in CaptureReader(path, mmap=mmap))
+    return time.perf_counter() - start, n
+
+
+def peak_memory(path, mmap):
+    tracemalloc.start()
+    for _ in CaptureReader(path, mmap=mmap):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def json_bytes(path, n):
+    sample = [runtime.encode(message(rec)) for rec, _ in zip(CaptureReader(path), range(n))]
+    return sum(map(len, sample)) / len(sample)
+
+
+async def replay(path, results):
+    bus = LocalBus()
+    agents = [lab4.RescueAgent("takyisky.rescue4@xmpp.jp", "rescue123", bus=bus),
+              lab4.CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123", bus=bus),
+              lab4.RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus)]
+    for agent in agents:
+        await agent.start()
+    replayer = ReplayAgent("takyisky.replay4@xmpp.jp", "replay123", bus=bus, path=path, speed=0)
+    start = time.perf_counter()
+    await replayer.start()
+    await replayer.done.wait()
+    while bus.backlog("takyisky.risk4@xmpp.jp"):
+        await asyncio.sleep(0.001)
+    results["replay"] = (time.perf_counter() - start, replayer.sent)
+    for agent in [replayer, *agents]:
+        await agent.stop()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    logging.getLogger("flood").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.cap")
+        seconds = write(path, n)
+        size = os.path.getsize(path)
+        print(f"{n:,} messages, {size / 2**20:,.1f} MiB")
+        print(f"write            {seconds / n * 1e6:6.2f} µs/msg  {size / n:6.1f} B/msg "
+              f"(JSON lines: {json_bytes(path, 10_000):.1f} B/msg)")
+        for name, mmap in (("read streamed", False), ("read mmap", True)):
+            seconds, count = read(path, mmap)
+            peak = peak_memory(path, mmap) / 2**10
+            print(f"{name:<16} {seconds / count * 1e6:6.2f} µs/msg  "
+                  f"{count / seconds:>10,.0f} msg/s  peak {peak:,.0f} KiB")
+
+        short = os.path.join(tmp, "replay.cap")
+        write(short, REPLAYED)
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            spade.run(replay(short, results))
+        seconds, sent = results["replay"]
+        print(f"replay speed=0   {sent:,} readings into lab4 in {seconds:.1f}s: "
+              f"{sent / seconds:,.0f} readings/s")
+
+
+if __name__ == "__main__":
+    main()
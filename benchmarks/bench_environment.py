@@ -0,0 +1,60 @@
+"""
+Benchmark: DisasterEnvironment.update() ticks/sec
+Compares the original dict-of-dicts loop against the array-backed store
+at 3, 10k and 1M zones. The array version also spreads fire and damage
+between neighbouring cells each tick, which the original did not do.
+
+Run:  python benchmarks/bench_environment.py
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab2"))
+
+from environment import DisasterEnvironment
+
+SIZES = [3, 10_000, 1_000_000]
+
+
+def legacy_update(zones):
+    # The original per-zone loop, kept here as the baseline
+    for zone_name in zones:
+        zone = zones[zone_name]
+        if zone['fire']:
+            zone['damage'] += random.uniform(0.3, 0.8)
+        else:
+            zone['damage'] += random.uniform(0.1, 0.3)
+        if zone['damage'] > 10:
+            zone['damage'] = 10
+
+
+def ticks_per_sec(step, budget=1.0):
+    # Run `step` repeatedly for about `budget` seconds
+    ticks = 0
+    start = time.perf_counter()
+    while True:
+        step()
+        ticks += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return ticks / elapsed
+
+
+def main():
+    print(f"{'zones':>10} {'dict loop':>14} {'numpy':>14} {'speedup':>9}")
+    for size in SIZES:
+        env = DisasterEnvironment.generate(size, seed=42)
+        zones = {name: dict(data) for name, data in env.get_status().items()}
+
+        legacy = ticks_per_sec(lambda: legacy_update(zones))
+        vector = ticks_per_sec(env.update)
+        print(f"{size:>10,} {legacy:>10,.1f} t/s {vector:>10,.1f} t/s {vector / legacy:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
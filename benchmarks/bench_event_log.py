@@ -0,0 +1,43 @@
+"""
+Benchmark: EventLog append throughput
+Measures events/sec through append() with the background writer streaming
+to a rotating file, and how long the final flush takes.
+
+Run:  python benchmarks/bench_event_log.py
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lab2"))
+
+from event_log import EventLog, EventRecord
+
+EVENTS = 500_000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "event_log.txt")
+        log = EventLog(path, keep_last=1000, max_bytes=10_000_000, backup_count=3)
+
+        start = time.perf_counter()
+        for i in range(EVENTS):
+            log.append(EventRecord(time.time(), f"Zone_{i % 1000}", 'CRITICAL',
+                                   7.5, f"CRITICAL: Zone_{i % 1000} damage level is 7.5"))
+        appended = time.perf_counter() - start
+        log.close()
+        total = time.perf_counter() - start
+
+        files = sorted(Path(tmp).iterdir())
+        print(f"append:  {EVENTS / appended:,.0f} events/sec "
+              f"({appended * 1e6 / EVENTS:.2f} µs/event)")
+        print(f"on disk: {EVENTS / total:,.0f} events/sec including final flush")
+        print(f"files:   {', '.join(f.name for f in files)}")
+        print(f"memory:  {len(log.recent)} records kept in the ring buffer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: sensor fleet time-to-ready
+Brings up 100, 1k and 10k sensors on a LocalBus three ways and reports
+the time from nothing to every sensor running:
+
+    serial   one SensorAgent per sensor, built and started one at a time
+             (what lab4 main() used to do)
+    fleet    fleet.launch(): concurrent starts, one TLS context to connect with
+    virtual  fleet.launch() with 100 sensors per VirtualSensorAgent
+
+There is no XMPP server here, so this measures the local CPU cost of an
+agent start; over XMPP each start also waits for a login round trip,
+which the serial path pays once per agent and the fleet overlaps.
+Locally the two cost about the same: most of a start is spade building
+the client's own TLS context, which every agent still does.
+Serial 10k is skipped (it takes over ten minutes).
+
+Run:  python benchmarks/bench_fleet.py [sizes...]
+"""
+
+import contextlib
+import io
+import logging
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+
+import lab4_fipa_acl as lab4
+from common import fleet
+from common.transport import LocalBus
+
+SIZES = [100, 1_000, 10_000]
+SERIAL_MAX = 1_000
+PER_AGENT = 100
+PERIOD = 3600       # ready is what is measured; keep the sensors quiet
+
+
+async def serial(n, bus):
+    agents = [lab4.SensorAgent(f"takyisky.sensor4-{i}@xmpp.jp", "sensor123", bus=bus,
+                               period=PERIOD, zone=f"Zone_{i}") for i in range(n)]
+    for agent in agents:
+        await agent.start()
+    return agents
+
+
+async def concurrent(n, bus):
+    spec = fleet.FleetSpec(lab4.SensorAgent, n, "takyisky.sensor4-{}@xmpp.jp", "sensor123", PERIOD)
+    return await fleet.launch(spec, bus=bus)
+
+
+async def virtual(n, bus):
+    spec = fleet.FleetSpec(lab4.VirtualSensorAgent, n, "takyisky.sensor4-{}@xmpp.jp",
+                           "sensor123", PERIOD, per_agent=PER_AGENT)
+    return await fleet.launch(spec, bus=bus)
+
+
+async def run(sizes, results):
+    for n in sizes:
+        for name, bring_up in (("serial", serial), ("fleet", concurrent), ("virtual", virtual)):
+            if name == "serial" and n > SERIAL_MAX:
+                continue
+            bus = LocalBus()
+            start = time.perf_counter()
+            agents = await bring_up(n, bus)
+            results[n, name] = (time.perf_counter() - start, len(agents))
+            await fleet.stop(agents)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    results = {}
+    logging.getLogger("flood").setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(run(sizes, results))
+
+    print(f"{'sensors':>8} {'mode':>8} {'agents':>7} {'ready in':>10} {'per sensor':>11}")
+    for (n, name), (seconds, agents) in results.items():
+        print(f"{n:>8,} {name:>8} {agents:>7,} {seconds:>9.2f}s {seconds / n * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
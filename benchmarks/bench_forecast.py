@@ -0,0 +1,71 @@
+"""
+Benchmark: ensemble forecasts
+Runs forecast() with 1000 members 60 ticks ahead (three minutes of lab2
+time) on 3-zone, 10k-zone and 100k-zone maps, in process and on a
+process pool with one worker per CPU, against the obvious alternative:
+one DisasterEnvironment copy per member stepped with update() (timed on
+a few members and scaled up).
+
+Run:  python benchmarks/bench_forecast.py [members] [ticks] [sizes...]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab2"))
+
+from environment import DisasterEnvironment
+from forecast import forecast
+
+SIZES = [3, 10_000, 100_000]
+COPIES = 5
+
+
+def make_env(size):
+    return DisasterEnvironment(seed=1) if size == 3 else DisasterEnvironment.generate(size, seed=1)
+
+
+def per_copy(size, ticks):
+    """Seconds to step one copy of the map ticks times with update()"""
+    copies = [make_env(size) for _ in range(COPIES)]
+    start = time.perf_counter()
+    for member in copies:
+        for _ in range(ticks):
+            member.update()
+    return (time.perf_counter() - start) / COPIES
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    sizes = [int(arg) for arg in sys.argv[3:]] or SIZES
+    workers = os.cpu_count()
+    print(f"{members} members x {ticks} ticks, pool of {workers}")
+    print(f"{'zones':>8} {'copies':>9} {'ensemble':>9} {'pool':>9} {'zone-ticks/s':>13} "
+          f"{'speedup':>8}")
+    with ProcessPoolExecutor(workers) as pool:
+        for size in sizes:
+            env = make_env(size)
+            naive = per_copy(size, ticks) * members
+            batched, result = timed(lambda: forecast(env, members, ticks, seed=1))
+            pooled, _ = timed(lambda: forecast(env, members, ticks, seed=1, executor=pool))
+            best = min(batched, pooled)
+            print(f"{size:>8,} {naive:>8.2f}s {batched:>8.2f}s {pooled:>8.2f}s "
+                  f"{size * members * ticks / best:>13,.0f} {naive / best:>7.1f}x")
+            print(f"{'':>8} {len(result.at_risk(0.8)):,} zones at least 80% likely "
+                  f"to go CRITICAL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: lab3 RescueAgent FSM throughput under a message flood
+Queues N disaster-event messages in the RescueAgent's mailbox at once and
+times how long the table-driven FSM takes to consume them, draining one
+message per wakeup (max_drain=1, as the old one-receive-per-state FSM
+did) and up to 10 / 100 per wakeup. Rescue operations are no-ops so the
+FSM itself is what is measured; logging is at WARNING.
+
+Run:  python benchmarks/bench_fsm.py [messages]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab3"))
+
+import spade
+from spade.message import Message
+
+import lab3_fsm as lab3
+from common.fsm import DRAIN, EVENTS, TRANSITIONS
+from common.schema import DISASTER_EVENT, SEVERITIES, DisasterEvent
+from common.transport import LocalBus
+
+DRAINS = [1, 10, 100]
+
+
+class IdleRescue(lab3.RescueAgent):
+    async def rescue_operation(self):
+        pass
+
+
+def flood(n):
+    messages = []
+    for i in range(n):
+        msg = Message(to="takyisky.rescue@xmpp.jp", thread=f"flood-{i}")
+        msg.set_metadata("performative", "inform")
+        msg.set_metadata("ontology", DISASTER_EVENT.ontology)
+        msg.body = DISASTER_EVENT.encode(DisasterEvent(random.choice(SEVERITIES), 5, 100, 40))
+        messages.append(msg)
+    return messages
+
+
+async def run_once(max_drain, messages):
+    bus = LocalBus()
+    rescue = IdleRescue("takyisky.rescue@xmpp.jp", "rescue123", bus=bus,
+                        max_in_flight=64, max_drain=max_drain)
+    await rescue.start()
+    before = EVENTS.get(rescue.name)
+    wakeups = DRAIN.count(rescue.name)
+
+    start = time.perf_counter()
+    for msg in messages:
+        bus.deliver(rescue, msg)
+    while EVENTS.get(rescue.name) - before < len(messages):
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    await rescue.stop()
+    return len(messages) / elapsed, DRAIN.count(rescue.name) - wakeups
+
+
+async def run(n, results):
+    random.seed(0)
+    messages = flood(n)
+    for max_drain in DRAINS:
+        results[max_drain] = await run_once(max_drain, messages)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    results = {}
+    logging.getLogger("flood").setLevel(logging.WARNING)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(run(n, results))
+
+    base = results[DRAINS[0]][0]
+    print(f"{n:,} queued disaster-events")
+    print(f"{'max_drain':>9} {'events/s':>10} {'wakeups':>8} {'speedup':>8}")
+    for max_drain, (rate, wakeups) in results.items():
+        print(f"{max_drain:>9} {rate:>10,.0f} {wakeups:>8} {rate / base:>7.2f}x")
+    taken = sorted(((n, src, dst) for (_, src, dst), n in TRANSITIONS.values.items()), reverse=True)
+    print("transitions: " + ", ".join(f"{src}→{dst} {int(n)}" for n, src, dst in taken))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: per-message cost of the lab4 receive loops
+Feeds prebuilt messages straight to RiskAgent.AssessBehaviour.handle()
+(sensor-reading INFORMs from 64 zones, every HIGH/CRITICAL reading
+escalated: request_ttl=0) and CoordinatorAgent.CoordinateBehaviour.handle()
+(risk-assessment REQUESTs from four RiskAgent shards, one rescue-status
+INFORM for every two requests). Replies and tasks go out on a LocalBus
+to agents with no behaviours, so what is measured is the handler and
+Behaviour.send(), not a recipient. Logging is at WARNING.
+
+Reports µs per message (best of five passes) and, under tracemalloc,
+the peak memory a message allocates while it is handled and what it
+leaves behind.
+
+Run:  python benchmarks/bench_hot_path.py [messages]
+"""
+
+import contextlib
+import io
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+from spade.message import Message
+
+import lab4_fipa_acl as lab4
+from common.risk import ACTIONS, LEVELS
+from common.schema import RISK_ASSESSMENT, SENSOR_READING, RiskAssessment
+from common.transport import BusAgent, LocalBus
+
+ZONES = 64
+SHARDS = [f"takyisky.risk4-{i}@xmpp.jp" for i in range(4)]
+TRACED = 2_000
+
+
+class Sink(BusAgent):
+    """Takes delivery of nothing"""
+
+
+def readings(n):
+    messages = []
+    for i in range(n):
+        msg = Message(to="takyisky.risk4@xmpp.jp", sender=f"takyisky.sensor4-{i % ZONES}@xmpp.jp",
+                      thread=f"sensor4-{i}")
+        msg.set_metadata("performative", "inform")
+        msg.set_metadata("ontology", "sensor-reading")
+        msg.set_metadata("language", "disaster-sl")
+        msg.set_metadata("zone", f"Zone_{i % ZONES}")
+        msg.body = SENSOR_READING.encode(lab4.read_sensors())
+        messages.append(msg)
+    return messages
+
+
+def requests(n, rng):
+    messages = []
+    for i in range(n):
+        if i % 3 == 2:
+            msg = Message(to="takyisky.coordinator4@xmpp.jp", sender="takyisky.rescue4@xmpp.jp")
+            msg.set_metadata("performative", "inform")
+            msg.set_metadata("ontology", "rescue-status")
+            msg.set_metadata("team", "Alpha")
+            msg.set_metadata("incident", str(i // 3 + 1))
+            msg.body = "[0,0,3]"
+        else:
+            code = rng.randrange(len(LEVELS))
+            msg = Message(to="takyisky.coordinator4@xmpp.jp", sender=rng.choice(SHARDS),
+                          thread=f"sensor4-{i}")
+            msg.set_metadata("performative", "request")
+            msg.set_metadata("ontology", "risk-assessment")
+            msg.set_metadata("language", "disaster-sl")
+            msg.set_metadata("zone", f"Zone_{rng.randrange(ZONES)}")
+            msg.body = RISK_ASSESSMENT.encode(RiskAssessment(
+                LEVELS[code], ACTIONS[code], rng.randint(0, 10), rng.randint(0, 200)))
+        messages.append(msg)
+    return messages
+
+
+async def per_message(behaviour, messages):
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for msg in messages:
+            await behaviour.handle(msg)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages)
+
+
+async def allocations(behaviour, messages):
+    """(mean peak bytes while handling one message, bytes retained per message)"""
+    tracemalloc.start()
+    try:
+        peak = 0
+        base = tracemalloc.get_traced_memory()[0]
+        for msg in messages:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await behaviour.handle(msg)
+            peak += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return peak / len(messages), retained / len(messages)
+
+
+async def measure(agent, messages):
+    await agent.start()
+    behaviour = next(iter(agent.behaviours))
+    seconds = await per_message(behaviour, messages)
+    peak, retained = await allocations(behaviour, messages[:TRACED])
+    await agent.stop()
+    return seconds, peak, retained
+
+
+async def run(n, results):
+    rng = random.Random(1)
+    random.seed(1)
+    bus = LocalBus()
+    sinks = [Sink(jid, "sink123", bus=bus) for jid in
+             ["takyisky.coordinator4@xmpp.jp", "takyisky.rescue4@xmpp.jp", *SHARDS]]
+    for sink in sinks:
+        await sink.start()
+
+    risk = lab4.RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus, request_ttl=0)
+    results["RiskAgent (sensor-reading)"] = await measure(risk, readings(n))
+
+    bus.unregister(sinks[0])
+    coordinator = lab4.CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123", bus=bus)
+    results["Coordinator (request/status)"] = await measure(coordinator, requests(n, rng))
+
+    for sink in sinks:
+        await sink.stop()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    results = {}
+    logging.getLogger("flood").setLevel(logging.WARNING)
+    logging.getLogger("flood.transport").setLevel(logging.ERROR)
+    logging.getLogger("spade").setLevel(logging.WARNING)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(run(n, results))
+
+    print(f"{n:,} messages per handler, {TRACED:,} traced")
+    print(f"{'handler':<30} {'µs/msg':>8} {'peak B/msg':>11} {'kept B/msg':>11}")
+    for name, (seconds, peak, retained) in results.items():
+        print(f"{name:<30} {seconds * 1e6:>8.2f} {peak:>11,.0f} {retained:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
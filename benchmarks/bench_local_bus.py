@@ -0,0 +1,68 @@
+"""
+Benchmark: lab4 Sensor→Risk→Coordinator→Rescue chain on the LocalBus
+The sensor publishes as fast as the loop allows (period=0) and we count
+messages delivered by the bus. Agent console output is discarded so the
+number reflects messaging cost, not terminal speed.
+
+Run:  python benchmarks/bench_local_bus.py [seconds]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+
+import lab4_fipa_acl as lab4
+from common.transport import LocalBus
+
+
+class FloodSensor(lab4.SensorAgent):
+    async def setup(self):
+        self.add_behaviour(self.BroadcastBehaviour(period=0))
+
+
+async def run(seconds, results):
+    bus = LocalBus()
+    agents = [
+        lab4.RescueAgent("takyisky.rescue4@xmpp.jp", "rescue123", bus=bus),
+        lab4.CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123", bus=bus),
+        lab4.RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus),
+        FloodSensor("takyisky.sensor4@xmpp.jp", "sensor123", bus=bus),
+    ]
+    for agent in agents:
+        await agent.start()
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    results["elapsed"] = time.perf_counter() - start
+    results["delivered"] = bus.delivered
+    results["undeliverable"] = bus.undeliverable
+    for agent in reversed(agents):
+        await agent.stop()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    results = {}
+    # Rescue tasks still in flight at shutdown report to a stopped
+    # coordinator; that is expected here, so keep the bus quiet
+    logging.getLogger("flood.transport").setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(run(seconds, results))
+
+    elapsed = results["elapsed"]
+    print(f"delivered:     {results['delivered']:,} messages in {elapsed:.1f}s")
+    print(f"throughput:    {results['delivered'] / elapsed:,.0f} msg/s")
+    print(f"undeliverable: {results['undeliverable']:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: cost of one log line on the event loop thread
+Compares the old print(f"[{ts()}] ...") helper, block-buffered and
+line-buffered (as on a terminal: one write() per line), with the queued
+logger at INFO (record handed to the writer thread) and at WARNING
+(record discarded before formatting). Output goes to /dev/null, so the
+time a slow terminal would block print() is not included.
+
+Run:  python benchmarks/bench_logging.py
+"""
+
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import logs
+
+N = 100_000
+BODY = "[0,3,9,180]"
+
+
+def per_call(fn):
+    start = time.perf_counter()
+    for _ in range(N):
+        fn()
+    return (time.perf_counter() - start) / N
+
+
+def main():
+    devnull = open(os.devnull, "w")
+    tty_like = open(os.devnull, "w", buffering=1)
+    logger = logging.getLogger("flood.bench")
+
+    def legacy(out=devnull):
+        ts = datetime.now().strftime("%H:%M:%S")
+        print(f"[{ts}] [RiskAgent] → <REQUEST> → CoordinatorAgent | {BODY}", file=out)
+
+    def queued():
+        logger.info("[%s]%s <%s> → CoordinatorAgent | %s", "RiskAgent", " →", "REQUEST", BODY)
+
+    results = {"print + strftime": per_call(legacy),
+               "print + strftime, line-buf": per_call(lambda: legacy(tty_like))}
+
+    logs.setup("INFO", stream=devnull, max_queue=N + 1)
+    results["logger, INFO (queued)"] = per_call(queued)
+    logs.shutdown()
+
+    logs.setup("WARNING", stream=devnull)
+    results["logger, WARNING (filtered)"] = per_call(queued)
+    logs.shutdown()
+
+    base = results["print + strftime"]
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds * 1e6:7.2f} us/line  {base / seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: RiskAgent pool throughput at 1, 2, 4 and 8 shards
+64 sensors (one zone each) flood the pool over the LocalBus. Each
+assessment is given SERVICE_MS of simulated async latency (model lookup,
+database write, ...), which is what a single RiskAgent serialises on and
+what sharding overlaps. All agents share one event loop here, so pure CPU
+work does not scale with shards; see the multi-process runtime for that.
+
+Run:  python benchmarks/bench_risk_shards.py [seconds-per-run]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+
+import lab4_fipa_acl as lab4
+from common.sharding import ShardPool
+from common.transport import LocalBus
+
+SHARDS = [1, 2, 4, 8]
+SENSORS = 64
+SENSOR_PERIOD = 0.005
+SERVICE_MS = 2
+
+
+class TimedRiskAgent(lab4.RiskAgent):
+    assessed = 0
+
+    class AssessBehaviour(lab4.RiskAgent.AssessBehaviour):
+        async def receive(self, timeout=None):
+            msg = await super().receive(timeout)
+            if msg is not None:
+                TimedRiskAgent.assessed += 1
+                await asyncio.sleep(SERVICE_MS / 1000)
+            return msg
+
+
+async def run_once(shards, seconds):
+    bus = LocalBus()
+    coordinator = lab4.CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123", bus=bus)
+    rescue = lab4.RescueAgent("takyisky.rescue4@xmpp.jp", "rescue123", bus=bus)
+    pool = ShardPool(lambda jid: TimedRiskAgent(jid, "risk123", bus=bus),
+                     "takyisky.risk4-{}@xmpp.jp")
+    sensors = [lab4.SensorAgent(f"takyisky.sensor4-{i}@xmpp.jp", "sensor123", bus=bus,
+                                period=SENSOR_PERIOD, zone=f"Zone_{i}", risk_pool=pool)
+               for i in range(SENSORS)]
+
+    await rescue.start()
+    await coordinator.start()
+    for _ in range(shards):
+        await pool.add_shard()
+    for sensor in sensors:
+        await sensor.start()
+
+    TimedRiskAgent.assessed = 0
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    rate = TimedRiskAgent.assessed / (time.perf_counter() - start)
+
+    for sensor in sensors:
+        await sensor.stop()
+    await pool.stop()
+    await coordinator.stop()
+    await rescue.stop()
+    return rate
+
+
+async def run(seconds, results):
+    for shards in SHARDS:
+        results[shards] = await run_once(shards, seconds)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    results = {}
+    logging.getLogger("flood.transport").setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(run(seconds, results))
+
+    base = results[SHARDS[0]]
+    print(f"{SENSORS} sensors, {SERVICE_MS} ms simulated latency per assessment")
+    print(f"{'shards':>6} {'readings/s':>12} {'speedup':>8}")
+    for shards, rate in results.items():
+        print(f"{shards:>6} {rate:>12,.0f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: multi-process runtime throughput at 1, 2, 4 and 8 RiskAgent processes
+Each RiskAgent shard runs in its own worker process and burns WORK_MS of
+CPU per reading (pure Python, so it holds the GIL: the case sharding on
+one event loop cannot speed up; compare bench_risk_shards.py). 64 sensors
+in a separate worker offer more readings than the largest pool can take,
+and coordinator and rescue share a third. Readings/s is measured from
+the workers' metrics once all of them are up. Expect near-linear gains
+up to the number of free cores, and none past it.
+
+Then kills one RiskAgent worker with SIGKILL and reports how long the
+supervisor takes to have it back and assessing.
+
+Run:  python benchmarks/bench_runtime.py [seconds-per-run]
+"""
+
+import logging
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import lab4_fipa_acl as lab4
+from common.runtime import Supervisor
+
+PROCESSES = [1, 2, 4, 8]
+SENSORS = 64
+SENSOR_PERIOD = 0.01
+WORK_MS = 2
+
+
+class BusyRiskAgent(lab4.RiskAgent):
+    class AssessBehaviour(lab4.RiskAgent.AssessBehaviour):
+        async def receive(self, timeout=None):
+            msg = await super().receive(timeout)
+            if msg is not None:
+                end = time.perf_counter() + WORK_MS / 1000
+                while time.perf_counter() < end:
+                    pass
+            return msg
+
+
+def topology(processes):
+    shards = [f"takyisky.risk4-{i}@xmpp.jp" for i in range(processes)]
+    workers = {
+        "core": [{"agent": "lab4_fipa_acl:RescueAgent", "jid": "takyisky.rescue4@xmpp.jp"},
+                 {"agent": "lab4_fipa_acl:CoordinatorAgent",
+                  "jid": "takyisky.coordinator4@xmpp.jp"}],
+        "sensors": [{"agent": "lab4_fipa_acl:SensorAgent", "jid": f"takyisky.sensor4-{i}@xmpp.jp",
+                     "kwargs": {"period": SENSOR_PERIOD, "zone": f"Zone_{i}"},
+                     "routes": {"risk_pool": shards}}
+                    for i in range(SENSORS)],
+    }
+    for i, jid in enumerate(shards):
+        workers[f"risk-{i}"] = [{"agent": "bench_runtime:BusyRiskAgent", "jid": jid}]
+    return {"path": ["benchmarks", "lab4"], "workers": workers}
+
+
+def assessed(supervisor):
+    shards = [spec["jid"].split("@")[0] for worker, specs in supervisor.topology["workers"].items()
+              if worker.startswith("risk-") for spec in specs]
+    return sum(supervisor.total("flood_handling_seconds_count", agent=name, performative="inform")
+               for name in shards)
+
+
+def rate(supervisor, seconds):
+    before, start = assessed(supervisor), time.monotonic()
+    while time.monotonic() - start < seconds:
+        time.sleep(0.1)
+        supervisor.poll()
+    return (assessed(supervisor) - before) / (time.monotonic() - start)
+
+
+def run_once(processes, seconds):
+    supervisor = Supervisor(topology(processes), log_level="ERROR", metrics_every=0.25).start()
+    try:
+        ready = supervisor.wait_ready()
+        time.sleep(1.0)     # let the sensors ramp up
+        return ready, rate(supervisor, seconds)
+    finally:
+        supervisor.stop()
+        supervisor.cleanup()
+
+
+def crash_recovery(seconds):
+    supervisor = Supervisor(topology(4), log_level="ERROR", metrics_every=0.25).start()
+    try:
+        supervisor.wait_ready()
+        time.sleep(1.0)
+        steady = rate(supervisor, seconds)
+        victim = supervisor.processes["risk-0"]
+        metrics = Path(supervisor.run_dir) / "risk-0.prom"
+        metrics.unlink()
+        killed = time.monotonic()
+        os.kill(victim.pid, signal.SIGKILL)
+        # Back once the new process has written its first metrics
+        while not metrics.exists():
+            supervisor.poll()
+            time.sleep(0.05)
+        back = time.monotonic() - killed
+        return steady, back, rate(supervisor, seconds)
+    finally:
+        supervisor.stop()
+        supervisor.cleanup()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    logging.getLogger("flood.runtime").setLevel(logging.ERROR)
+    print(f"{SENSORS} sensors at {1 / SENSOR_PERIOD:g} Hz, {WORK_MS} ms CPU per assessment, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'processes':>9} {'startup':>8} {'readings/s':>11} {'speedup':>8}")
+    base = None
+    for processes in PROCESSES:
+        ready, readings = run_once(processes, seconds)
+        base = base or readings
+        print(f"{processes:>9} {ready:>7.1f}s {readings:>11,.0f} {readings / base:>7.2f}x")
+
+    steady, back, after = crash_recovery(seconds)
+    print(f"SIGKILL one of 4 RiskAgent workers: back in {back:.1f}s, "
+          f"{steady:,.0f} readings/s before, {after:,.0f} after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark: adaptive sensor sampling against a fixed period
+Simulates ZONES lab4 sensors (4 s period) for an hour on an event clock,
+no agents. Most zones are calm: water around 1 m with a little noise.
+FLOODING of them flood once: water rises at 1-6 m per minute from a
+random time to 9 m, holds, then falls back. Each sensor is sampled:
+
+    fixed     every 4 s, as lab4 does without --sample-budget
+    adaptive  AdaptiveSampler(period=4)
+    budget    AdaptiveSampler sharing a SampleBudget of BUDGET readings/s
+
+The samplers' levels come from each zone's RiskModel trend, as in the
+labs' sensors.
+
+Reports readings sent, readings per second at the busiest minute after
+the first (which has every sensor's first reading in it), and
+how long after a zone's water crossed HIGH (4 m) and CRITICAL (7 m) its
+sensor first reported it (mean and worst), plus the cost of observe().
+
+Run:  python benchmarks/bench_sampling.py [zones]
+"""
+
+import heapq
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from common.risk import CRITICAL_WATER, HIGH_WATER, RiskModel
+from common.sampling import AdaptiveSampler, SampleBudget, savings
+
+PERIOD = 4
+HOUR = 3600
+FLOODING = 0.05
+BUDGET_PER_ZONE = 0.05      # readings/s per zone; fixed-rate sampling is 0.25
+
+
+class Zone:
+    def __init__(self, rng):
+        self.base = rng.uniform(0.5, 1.5)
+        self.rng = rng
+        self.flood = None
+        if rng.random() < FLOODING:
+            start = rng.uniform(0, HOUR * 0.7)
+            rise = rng.uniform(1, 6) / 60                   # m/s
+            peak = start + (9 - self.base) / rise
+            self.flood = (start, rise, peak, peak + rng.uniform(120, 600))
+
+    def water(self, t):
+        level = self.base
+        if self.flood is not None:
+            start, rise, peak, fall = self.flood
+            if start <= t < peak:
+                level += rise * (t - start)
+            elif peak <= t < fall:
+                level = 9
+            elif t >= fall:
+                level = max(self.base, 9 - rise * (t - fall))
+        return level + self.rng.uniform(-0.2, 0.2)
+
+    def crossing(self, threshold):
+        if self.flood is None:
+            return None
+        start, rise, _, _ = self.flood
+        return start + (threshold - self.base) / rise
+
+
+def simulate(zones, make_sampler):
+    """(readings, busiest minute's rate, delays to report HIGH, CRITICAL,
+    samplers)"""
+    samplers = [make_sampler() for _ in zones]
+    model = RiskModel()
+    heap = [(random.uniform(0, PERIOD), i) for i in range(len(zones))]
+    heapq.heapify(heap)
+    readings = 0
+    per_minute = Counter()
+    seen = {}
+    while heap:
+        t, i = heapq.heappop(heap)
+        if t >= HOUR:
+            continue
+        water = zones[i].water(t)
+        rain = 20 + 15 * water
+        readings += 1
+        per_minute[int(t // 60)] += 1
+        for threshold in (HIGH_WATER, CRITICAL_WATER):
+            if water >= threshold and (i, threshold) not in seen:
+                seen[i, threshold] = t
+        sampler = samplers[i]
+        if sampler is None:
+            period = PERIOD
+        else:
+            code, _ = model.update(i, water, rain, t)
+            period = sampler.observe(code, (water, rain), t)
+        heapq.heappush(heap, (t + period, i))
+
+    delays = {}
+    for threshold in (HIGH_WATER, CRITICAL_WATER):
+        delays[threshold] = [seen[i, threshold] - zone.crossing(threshold)
+                             for i, zone in enumerate(zones)
+                             if (i, threshold) in seen and zone.crossing(threshold) < HOUR]
+    peak = max(n for minute, n in per_minute.items() if minute > 0) / 60
+    return readings, peak, delays, [s for s in samplers if s]
+
+
+def observe_cost(n=200_000):
+    sampler = AdaptiveSampler(PERIOD, budget=SampleBudget(1.0))
+    rng = random.Random(1)
+    values = [(rng.randint(0, 10), rng.randint(0, 200)) for _ in range(1024)]
+    start = time.perf_counter()
+    for k in range(n):
+        sampler.observe(k % 3, values[k & 1023], k)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    rng = random.Random(1)
+    zones = [Zone(rng) for _ in range(n)]
+    flooding = sum(zone.flood is not None for zone in zones)
+    budget = SampleBudget(BUDGET_PER_ZONE * n)
+    print(f"{n:,} zones, {flooding} flooding, one hour; budget {budget.rate:g} readings/s")
+    print(f"{'sampling':<10} {'readings':>9} {'vs fixed':>9} {'peak/s':>7} "
+          f"{'HIGH mean/worst s':>18} {'CRITICAL mean/worst s':>22}")
+    fixed = None
+    for name, make in (("fixed", lambda: None),
+                       ("adaptive", lambda: AdaptiveSampler(PERIOD)),
+                       ("budget", lambda: AdaptiveSampler(PERIOD, budget=budget))):
+        random.seed(2)
+        readings, peak, delays, samplers = simulate(zones, make)
+        fixed = fixed or readings
+        cells = []
+        for threshold in (HIGH_WATER, CRITICAL_WATER):
+            d = delays[threshold]
+            cells.append(f"{sum(d) / len(d):.1f} / {max(d):.1f}")
+        print(f"{name:<10} {readings:>9,} {readings / fixed - 1:>+9.0%} {peak:>7.1f} "
+              f"{cells[0]:>18} {cells[1]:>22}")
+        if samplers:
+            print(f"{'':<10} {savings(samplers)}")
+    print(f"\nobserve(): {observe_cost() * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Benchmark: end-to-end scenarios on the LocalBus
+Drives the lab4 Sensor→Risk→Coordinator→Rescue chain and the lab3
+Sensor→RescueAgent FSM at a configurable event rate. Every message is
+timestamped with a monotonic clock as it enters the bus and grouped by
+conversation id (Message.thread), giving per-hop and end-to-end latency
+percentiles, throughput, and what became of each event: completed,
+unfinished, dropped, refused as low risk, coalesced into an open
+incident by the coordinator, suppressed as a repeat by the RiskAgent,
+timed out or failed.
+
+Results are printed and can be written as JSON; --compare checks them
+against an earlier JSON file and exits 1 if p95 latency or throughput
+got worse by more than --tolerance.
+
+Run:  python benchmarks/bench_scenario.py [--scenario lab4|lab3|all]
+          [--rate 4] [--sensors 4] [--duration 10] [--json out.json]
+          [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab3"))
+sys.path.insert(0, str(ROOT / "lab4"))
+
+import spade
+from spade.container import Container
+
+import lab3_fsm as lab3
+import lab4_fipa_acl as lab4
+from common.schema import RESCUE_STATUS, SENSOR_BATCH, DISASTER_BATCH, MessageError
+from common.stats import percentiles
+from common.transport import LocalBus
+
+# Conversation stages in pipeline order; a hop is two consecutive stages
+LAB4_HOPS = [
+    ("sensor→risk",        "sensor-reading",  "risk-assessment"),
+    ("risk→coordinator",   "risk-assessment", "agree"),
+    ("coordinator→rescue", "agree",           "rescue-task"),
+    ("rescue",             "rescue-task",     "rescue-status"),
+]
+LAB3_HOPS = [
+    ("sensor→fsm",  "disaster-event", "dispatched"),
+    ("rescue",      "dispatched",     "rescue-done"),
+]
+
+
+class TracingBus(LocalBus):
+    """LocalBus that notes when each conversation reaches each stage"""
+
+    def __init__(self):
+        super().__init__()
+        self.marks = defaultdict(dict)   # conversation id -> {stage: perf_counter()}
+        self.counts = Counter()
+
+    async def send(self, msg, behaviour):
+        ontology = msg.get_metadata("ontology")
+        if ontology == "task-confirmation":
+            stage = msg.get_metadata("performative")
+            if stage == "refuse":
+                self.counts["refused_full" if "QUEUE_FULL" in msg.body else "refused_low"] += 1
+            elif "COALESCED" in msg.body:
+                # Folded into an open incident: never dispatched on its own
+                stage = "coalesced"
+        elif ontology == SENSOR_BATCH:
+            stage = "sensor-reading"
+        elif ontology == DISASTER_BATCH:
+            stage = "disaster-event"
+        else:
+            stage = ontology
+        if stage == "disaster-event":
+            # The lab3 FSM only dispatches HIGH; the rest it just monitors
+            report = lab3.read_report(msg)
+            if report is not None and not lab3.is_high(None, report):
+                self.counts["refused_low"] += 1
+        if ontology == "rescue-status":
+            try:
+                self.counts[RESCUE_STATUS.decode(msg.body).status] += 1
+            except MessageError:
+                self.counts["unreadable"] += 1
+        self.counts[stage] += 1
+        self.mark(msg.thread, stage)
+        await super().send(msg, behaviour)
+
+    def mark(self, thread, stage):
+        if thread is not None:
+            self.marks[thread].setdefault(stage, time.perf_counter())
+
+    def when(self, thread, stage):
+        # Batched readings fan out as <batch id>/<index>; earlier stages
+        # were marked on the batch id
+        marks = self.marks.get(thread, {})
+        if stage in marks:
+            return marks[stage]
+        return self.marks.get(thread.split("/", 1)[0], {}).get(stage)
+
+    def latencies(self, hops):
+        """{hop: [seconds]} plus "end_to_end" (first stage to last)"""
+        out = {name: [] for name, _, _ in hops}
+        out["end_to_end"] = []
+        first, last = hops[0][1], hops[-1][2]
+        for thread in self.marks:
+            for name, start, end in hops:
+                a, b = self.when(thread, start), self.marks[thread].get(end)
+                if a is not None and b is not None:
+                    out[name].append(b - a)
+            a, b = self.when(thread, first), self.marks[thread].get(last)
+            if a is not None and b is not None:
+                out["end_to_end"].append(b - a)
+        return out
+
+
+# ── lab4 ────────────────────────────────────────────────────────
+class TimedRescue4(lab4.RescueAgent):
+    rescue_seconds = 1.5
+
+    async def execute(self, task, team=None):
+        await asyncio.sleep(self.rescue_seconds)
+
+
+async def run_lab4(cfg, bus, results):
+    TimedRescue4.rescue_seconds = cfg.rescue_ms / 1000
+    period = cfg.sensors / cfg.rate
+    risk = lab4.RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus)
+    agents = [
+        TimedRescue4("takyisky.rescue4@xmpp.jp", "rescue123", bus=bus,
+                     max_in_flight=cfg.rescue_workers),
+        lab4.CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123", bus=bus,
+                              queue_limit=cfg.queue_limit),
+        risk,
+    ] + [
+        lab4.SensorAgent(f"takyisky.sensor4-{i}@xmpp.jp", "sensor123", bus=bus, period=period,
+                         batch_size=cfg.batch_size, zone=f"Zone_{i}")
+        for i in range(cfg.sensors)
+    ]
+    await timed(agents, cfg.duration, results)
+    # REQUESTs the RiskAgent folded into one it sent recently (common.coalesce)
+    # never reach the bus
+    results["suppressed"] = risk.requested.coalesced
+
+
+# ── lab3 ────────────────────────────────────────────────────────
+class TracedRescue3(lab3.RescueAgent):
+    rescue_seconds = 2.0
+
+    async def rescue_operation(self):
+        await asyncio.sleep(self.rescue_seconds)
+
+    async def rescue_done(self, status, context):
+        _, thread, _ = context
+        self.bus.mark(thread, "rescue-done")
+        self.bus.counts[status] += 1
+
+    async def setup(self):
+        await super().setup()
+        submit = self.pool.submit
+
+        def traced(make_job, priority=0, context=None):
+            self.bus.mark(context[1], "dispatched")
+            submit(make_job, priority, context)
+        self.pool.submit = traced
+
+
+async def run_lab3(cfg, bus, results):
+    TracedRescue3.rescue_seconds = cfg.rescue_ms / 1000
+    agents = [
+        TracedRescue3("takyisky.rescue@xmpp.jp", "rescue123", bus=bus,
+                      max_in_flight=cfg.rescue_workers),
+        lab3.SensorAgent("takyisky.sensor@xmpp.jp", "sensor123", bus=bus,
+                         period=1 / cfg.rate, batch_size=cfg.batch_size),
+    ]
+    await timed(agents, cfg.duration, results)
+
+
+async def timed(agents, duration, results):
+    for agent in agents:
+        await agent.start()
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    results["elapsed"] = time.perf_counter() - start
+    # Senders stop first; work still in flight is reported as unfinished
+    for agent in reversed(agents):
+        await agent.stop()
+
+
+# name -> (runner, hops, stage at which an event is accepted for rescue)
+SCENARIOS = {
+    "lab4": (run_lab4, LAB4_HOPS, "agree"),
+    "lab3": (run_lab3, LAB3_HOPS, "dispatched"),
+}
+
+
+def run_scenario(name, cfg):
+    runner, hops, accepted = SCENARIOS[name]
+    bus = TracingBus()
+    results = {}
+    # spade.run() closes the container's loop when it returns; give each
+    # scenario a fresh one
+    container = Container()
+    if container.loop.is_closed():
+        container.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(container.loop)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spade.run(runner(cfg, bus, results))
+
+    elapsed = results["elapsed"]
+    latencies = bus.latencies(hops)
+    first, last = hops[0][1], hops[-1][2]
+    started = sum(1 for marks in bus.marks.values() if accepted in marks)
+    finished = sum(1 for marks in bus.marks.values() if last in marks)
+    return {
+        "config": {k: v for k, v in vars(cfg).items()
+                   if k not in ("json", "compare", "scenario", "tolerance", "min_delta_ms")},
+        "elapsed_s": round(elapsed, 3),
+        "throughput": {
+            "events_per_s":   round(bus.counts[first] / elapsed, 2),
+            "completed_per_s": round(finished / elapsed, 2),
+            "messages_per_s": round(bus.delivered / elapsed, 2),
+        },
+        "latency_ms": {
+            hop: {f"p{p}": round(v * 1000, 3) for p, v in percentiles(samples).items()}
+            for hop, samples in latencies.items()
+        },
+        "counts": {
+            "events": bus.counts[first],
+            "completed": finished,
+            "unfinished": max(0, started - finished),
+            "dropped": bus.undeliverable + bus.counts["refused_full"],
+            "refused_low_risk": bus.counts["refused_low"],
+            "coalesced": bus.counts["coalesced"],
+            "suppressed": results.get("suppressed", 0),
+            "timed_out": bus.counts["TIMEOUT"],
+            "failed": bus.counts["FAILED"],
+        },
+    }
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """Regressions of current against baseline, as readable strings.
+    Latency changes under min_delta_ms are scheduling noise and ignored."""
+    problems = []
+    for name, now in current["scenarios"].items():
+        then = baseline.get("scenarios", {}).get(name)
+        if then is None:
+            continue
+        for hop, pcts in now["latency_ms"].items():
+            old = then["latency_ms"].get(hop, {}).get("p95")
+            new = pcts.get("p95")
+            if old and new and new > old * (1 + tolerance) and new - old >= min_delta_ms:
+                problems.append(f"{name} {hop} p95 {old:.1f} → {new:.1f} ms")
+        old = then["throughput"]["completed_per_s"]
+        new = now["throughput"]["completed_per_s"]
+        if old and new < old * (1 - tolerance):
+            problems.append(f"{name} throughput {old:.2f} → {new:.2f} completed/s")
+    return problems
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end scenario benchmark")
+    parser.add_argument("--scenario", choices=["lab4", "lab3", "all"], default="all")
+    parser.add_argument("--rate", type=float, default=4, help="sensor events per second, total")
+    parser.add_argument("--sensors", type=int, default=4, help="lab4 SensorAgents")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--rescue-workers", type=int, default=4)
+    parser.add_argument("--rescue-ms", type=float, default=200,
+                        help="simulated rescue time (the labs use 1500/2000)")
+    parser.add_argument("--queue-limit", type=int, default=100)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed relative slowdown before --compare fails")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore latency changes smaller than this")
+    cfg = parser.parse_args()
+
+    # Tasks still in flight at shutdown report to stopped agents; expected here
+    logging.getLogger("flood.transport").setLevel(logging.ERROR)
+
+    names = ["lab4", "lab3"] if cfg.scenario == "all" else [cfg.scenario]
+    report = {"version": git_version(), "scenarios": {}}
+    for name in names:
+        result = report["scenarios"][name] = run_scenario(name, cfg)
+        print(f"── {name}: {result['throughput']}")
+        for hop, pcts in result["latency_ms"].items():
+            print(f"   {hop:<20} " + "  ".join(f"{p}={v:9.2f} ms" for p, v in pcts.items()))
+        print(f"   {result['counts']}")
+
+    if cfg.json:
+        Path(cfg.json).write_text(json.dumps(report, indent=2))
+        print(f"results written to {cfg.json}")
+
+    if cfg.compare:
+        problems = compare(report, json.loads(Path(cfg.compare).read_text()),
+                           cfg.tolerance, cfg.min_delta_ms)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {cfg.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Microbenchmark: message body encode/decode
+Compares the schema codec (compact and text-fallback paths) with the
+f-string + split-based parsing the agents used before.
+
+Run:  python benchmarks/bench_schema.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.schema import RISK_ASSESSMENT, RiskAssessment
+
+N = 200_000
+rec = RiskAssessment("CRITICAL", "DISPATCH_RESCUE", 7, 160)
+compact = RISK_ASSESSMENT.encode(rec)
+text = RISK_ASSESSMENT.encode_text(rec)
+
+
+def legacy_encode():
+    return f"RISK:{rec.risk};ACTION:{rec.action};WATER:{rec.water};RAIN:{rec.rain}"
+
+
+def legacy_decode():
+    parts = dict(p.split(":") for p in text.split(";") if ":" in p)
+    return (parts.get("RISK", "LOW"), parts.get("ACTION"),
+            int(parts.get("WATER", 0)), int(parts.get("RAIN", 0)))
+
+
+CASES = [
+    ("encode  f-string (old)",     legacy_encode),
+    ("encode  schema compact",     lambda: RISK_ASSESSMENT.encode(rec)),
+    ("decode  split+int (old)",    legacy_decode),
+    ("decode  schema compact",     lambda: RISK_ASSESSMENT.decode(compact)),
+    ("decode  schema text body",   lambda: RISK_ASSESSMENT.decode(text)),
+]
+
+
+def main():
+    print(f"body sizes: compact={len(compact)}B {compact!r}  text={len(text)}B")
+    for name, fn in CASES:
+        secs = min(timeit.repeat(fn, number=N, repeat=3))
+        print(f"{name:<28} {secs / N * 1e6:6.2f} µs/msg")
+
+
+if __name__ == "__main__":
+    main()
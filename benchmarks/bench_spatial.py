@@ -0,0 +1,60 @@
+"""
+Benchmark: zone spatial index
+k-nearest and radius queries over 10k, 100k and 1M grid zones, against a
+brute-force NumPy distance scan over every zone.
+
+Run:  python benchmarks/bench_spatial.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab2"))
+
+import numpy as np
+
+from environment import DisasterEnvironment
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERIES = 1000
+K = 8
+RADIUS_KM = 10.0
+
+
+def per_query(fn, points):
+    start = time.perf_counter()
+    for p in points:
+        fn(p)
+    return (time.perf_counter() - start) / len(points) * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'zones':>10} {'query':>12} {'index':>10} {'scan':>11} {'speedup':>8}")
+    for size in SIZES:
+        env = DisasterEnvironment.generate(size, seed=1)
+        positions = env.positions
+        points = rng.random((QUERIES, 2)) * positions.max(axis=0)
+
+        def scan_knn(p):
+            d = np.hypot(positions[:, 0] - p[0], positions[:, 1] - p[1])
+            part = np.argpartition(d, K)[:K]
+            return part[np.argsort(d[part])]
+
+        def scan_radius(p):
+            d = np.hypot(positions[:, 0] - p[0], positions[:, 1] - p[1])
+            return np.flatnonzero(d <= RADIUS_KM)
+
+        for name, index_fn, scan_fn in (
+                (f"{K}-nearest", lambda p: env.spatial.nearest(p, K), scan_knn),
+                (f"r={RADIUS_KM:g} km", lambda p: env.spatial.within(p, RADIUS_KM), scan_radius)):
+            fast = per_query(index_fn, points)
+            slow = per_query(scan_fn, points[:100])
+            print(f"{size:>10,} {name:>12} {fast:>7.1f} us {slow:>8.1f} us {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
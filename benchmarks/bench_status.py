@@ -0,0 +1,154 @@
+"""
+Benchmark: status endpoint cost per refresh and event loop stalls
+A StatusServer publishing a 100k-zone DisasterEnvironment. Times one
+refresh (compare with what was published, build and serialise the
+delta) when nothing changed, when 1% of zones changed and after a full
+update() tick, against serialising every zone each refresh, the way a
+poll of get_status() would.
+
+Then, with a WebSocket client connected, reports the longest a 1 ms
+timer on the same loop was held up while the client received its
+snapshot and a full-tick delta, against one json.dumps of the whole map.
+
+Run:  python benchmarks/bench_status.py [zones]
+"""
+
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "lab2"))
+
+from common.status import StatusServer
+from environment import DisasterEnvironment
+
+
+def full_dump(env):
+    return json.dumps(dict(zip(env.names, zip(np.round(env.damage, 1).tolist(),
+                                              env.fire.tolist()))))
+
+
+async def refresh(server):
+    """Seconds for one publish and the zones it carried"""
+    start = time.perf_counter()
+    changed, sections = server._changes()
+    parts = server._zone_parts(changed, server._damage, server._fire)
+    async for _ in server._frames("delta", 0, len(changed), parts, sections):
+        pass
+    return time.perf_counter() - start, len(changed)
+
+
+async def best(fn, repeat=5):
+    return min([await fn() for _ in range(repeat)])
+
+
+class Stalls:
+    """Longest gap past a 1 ms timer on this loop"""
+
+    def __init__(self):
+        self.worst = 0.0
+        self.task = asyncio.ensure_future(self._tick())
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(0.001)
+            self.worst = max(self.worst, loop.time() - before - 0.001)
+
+    def reset(self):
+        self.worst = 0.0
+
+
+def client(port, done):
+    """Reads a snapshot and one delta over /ws, in a process of its own so
+    its parsing does not count against the server's loop; puts each
+    frame type on done once all its parts are in"""
+    async def frames(ws):
+        frame = json.loads((await ws.receive()).data)
+        for _ in range(frame["parts"] - 1):
+            await ws.receive()
+        return frame["type"]
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"http://127.0.0.1:{port}/ws", max_msg_size=0) as ws:
+                done.put("connected")
+                for _ in range(2):
+                    done.put(await frames(ws))
+
+    asyncio.run(run())
+
+
+async def run(n):
+    env = DisasterEnvironment.generate(n, seed=1)
+    rng = np.random.default_rng(1)
+    server = StatusServer(port=0, interval=3600)
+    server.add_zones(env)
+    print(f"{n:,} zones")
+    print(f"{'refresh':<22} {'zones sent':>10} {'ms':>9}")
+
+    async def unchanged():
+        return await refresh(server)
+
+    async def some():
+        env.damage[rng.choice(n, n // 100, replace=False)] += 0.5
+        return await refresh(server)
+
+    async def tick():
+        env.update()
+        return await refresh(server)
+
+    async def baseline():
+        start = time.perf_counter()
+        full_dump(env)
+        return time.perf_counter() - start, n
+
+    for name, fn in (("nothing changed", unchanged), ("1% changed", some),
+                     ("full tick", tick), ("every zone, each time", baseline)):
+        seconds, sent = await best(fn)
+        print(f"{name:<22} {sent:>10,} {seconds * 1e3:>9.2f}")
+
+    server.interval = 0.05
+    await server.start()
+    stalls = Stalls()
+    loop = asyncio.get_running_loop()
+    done = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=client, args=(server.port, done))
+    reader.start()
+    print(f"\n{'with a client connected':<30} {'worst stall ms':>14}")
+    await loop.run_in_executor(None, done.get)
+    stalls.reset()
+    await loop.run_in_executor(None, done.get)
+    print(f"{'snapshot':<30} {stalls.worst * 1e3:>14.2f}")
+    env.update()
+    await asyncio.sleep(0.002)      # not the update's own time
+    stalls.reset()
+    await loop.run_in_executor(None, done.get)
+    print(f"{'full-tick delta':<30} {stalls.worst * 1e3:>14.2f}")
+    await loop.run_in_executor(None, reader.join)
+
+    stalls.reset()
+    await asyncio.sleep(0.01)
+    full_dump(env)
+    await asyncio.sleep(0.01)
+    print(f"{'one json.dumps of every zone':<30} {stalls.worst * 1e3:>14.2f}")
+    stalls.task.cancel()
+    await server.stop()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    asyncio.run(run(n))
+
+
+if __name__ == "__main__":
+    main()
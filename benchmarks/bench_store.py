@@ -0,0 +1,93 @@
+"""
+Benchmark: SQLite incident store
+Writes N incidents (about 2% left open) and N events across 50 zones and
+four risk levels, spread over 24 hours, through the store's write queue.
+Reports the caller-side cost of a write (what an agent behaviour pays),
+the writer thread's rows/s, and the latency of the indexed queries the
+coordinator and reports use, e.g. "open CRITICAL incidents in zone X in
+the last 10 minutes".
+
+Run:  python benchmarks/bench_store.py [rows] [db path]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.store import BATCH, IncidentStore
+
+ZONES = [f"Zone_{i}" for i in range(50)]
+RISKS = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+QUERY_RUNS = 200
+
+
+async def timed(make_query, runs=QUERY_RUNS):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = await make_query()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, max(samples) * 1000, len(rows)
+
+
+async def run(n, path):
+    store = IncidentStore(path, max_pending=3 * n + 1).start()
+    now = time.time()
+    random.seed(0)
+
+    start = time.perf_counter()
+    for i in range(1, n + 1):
+        when = now - random.random() * 86_400
+        zone, risk = random.choice(ZONES), random.choice(RISKS)
+        store.record_event(risk, zone, 5, 100, 40, source="bench", when=when)
+        store.open_incident(i, risk, zone, "EVACUATE", 5, 100, when=when)
+        if random.random() > 0.02:
+            store.close_incident(i, "COMPLETE", when=when + 60)
+        if i % 10_000 == 0:
+            await asyncio.sleep(0)    # let the loop breathe, as agents would
+    queued = time.perf_counter() - start
+    writes = n * 3
+    await store.flush()
+    written = time.perf_counter() - start
+
+    print(f"{n:,} incidents + {n:,} events, {writes:,} writes")
+    print(f"  enqueue   {queued / writes * 1e6:6.2f} us/write on the caller")
+    print(f"  commit    {writes / written:10,.0f} rows/s  "
+          f"(mean batch {BATCH.mean():.0f} rows, {BATCH.count()} transactions)")
+
+    queries = {
+        "open CRITICAL in a zone, last 10 min":
+            lambda: store.open_incidents(zone=random.choice(ZONES), risk="CRITICAL", within=600),
+        "open in a zone, any risk":
+            lambda: store.open_incidents(zone=random.choice(ZONES)),
+        "open HIGH, all zones, last hour":
+            lambda: store.open_incidents(risk="HIGH", within=3600),
+        "events in a zone, last 10 min":
+            lambda: store.events(zone=random.choice(ZONES), within=600),
+        "latest 100 CRITICAL events":
+            lambda: store.events(risk="CRITICAL", limit=100),
+    }
+    print(f"  {'query':<38} {'median':>9} {'max':>9} {'rows':>6}")
+    for name, make_query in queries.items():
+        median, worst, rows = await timed(make_query)
+        print(f"  {name:<38} {median:6.2f} ms {worst:6.2f} ms {rows:>6}")
+    await store.close()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    if len(sys.argv) > 2:
+        asyncio.run(run(n, sys.argv[2]))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(n, Path(tmp) / "bench.db"))
+
+
+if __name__ == "__main__":
+    main()
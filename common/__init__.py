@@ -0,0 +1 @@
+"""Modules shared by the lab3/lab4 flood-response agents."""
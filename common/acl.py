@@ -0,0 +1,42 @@
+"""
+Precomputed shapes for the ACL messages agents send over and over.
+
+Building a spade Message field by field costs more than most handlers
+spend on the work itself: each set_metadata() call type-checks, each
+str JID is parsed, and Behaviour.send() parses the agent's own JID again
+(and formats a debug line with the whole message, logged or not) when
+the sender is left empty. A Template holds what every message of one
+kind shares, performative, ontology, language and the recipient when it
+is fixed, with the JID parsed once:
+
+    REQUEST = Template("request", "risk-assessment", "disaster-sl",
+                       to="takyisky.coordinator4@xmpp.jp")
+    msg = REQUEST.make(self.agent.jid, body, thread, zone=zone)
+    await behaviour.send(msg)
+
+The sender is the agent's JID object, so send() has nothing to fill in.
+A reply passes to=msg.sender, the incoming message's JID, as it is.
+"""
+
+from spade.message import Message
+from slixmpp import JID
+
+
+class Template:
+    __slots__ = ("to", "metadata")
+
+    def __init__(self, performative, ontology, language=None, to=None):
+        self.to = JID(to) if to is not None else None
+        self.metadata = {"performative": performative, "ontology": ontology}
+        if language is not None:
+            self.metadata["language"] = language
+
+    @property
+    def performative(self):
+        return self.metadata["performative"]
+
+    def make(self, sender, body, thread=None, to=None, **metadata):
+        """A new Message of this kind; metadata (strings) is added to the
+        template's"""
+        return Message(to=self.to if to is None else to, sender=sender, body=body,
+                       thread=thread, metadata={**self.metadata, **metadata})
@@ -0,0 +1,233 @@
+"""
+Rescue team allocation.
+
+Teams have a position, a speed, a number of incidents they can work at
+once (capacity) and a set of skills (boat, medic, supplies). Incidents
+have a position, a risk level and a water level, which decide both the
+skills they need and how much a minute of delay costs (their weight).
+
+The Allocator keeps track of which team is working which incident and
+answers two kinds of question:
+
+  assign(incident)   incremental: best free team for one new incident,
+                     used as requests arrive; walks teams nearest-first
+                     through a spatial index and stops once no team
+                     further out could arrive sooner
+  plan(incidents)    whole-set re-plan minimising total weighted response
+                     time: exact (Hungarian) for small sets, greedy by
+                     weight over a NumPy cost matrix otherwise; commit()
+                     then gives each incident its planned team
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from common.spatial import GridIndex
+
+BOAT, MEDIC, SUPPLIES = 1, 2, 4
+SKILL_NAMES = {BOAT: "boat", MEDIC: "medic", SUPPLIES: "supplies"}
+
+RISK_WEIGHT = {"CRITICAL": 4.0, "HIGH": 2.0, "MEDIUM": 1.0, "LOW": 0.5}
+
+# Cost of leaving an incident unassigned, in hours of response time
+UNASSIGNED_HOURS = 24.0
+
+Team = namedtuple("Team", "id pos speed capacity skills")          # pos in km, speed in km/h
+Incident = namedtuple("Incident", "id zone pos risk water")
+
+
+def needs(incident):
+    """Skill bitmask an incident requires"""
+    mask = SUPPLIES
+    if incident.water >= 4:
+        mask |= BOAT
+    if incident.risk == "CRITICAL":
+        mask |= MEDIC
+    return mask
+
+
+def weight(incident):
+    return RISK_WEIGHT.get(incident.risk, 1.0) * (1 + incident.water / 10)
+
+
+def skill_names(mask):
+    return "+".join(name for bit, name in SKILL_NAMES.items() if mask & bit)
+
+
+class Allocator:
+    def __init__(self, teams, optimal_limit=8):
+        self.teams = list(teams)
+        self.optimal_limit = optimal_limit
+        self.pos = np.array([t.pos for t in self.teams], dtype=np.float64).reshape(-1, 2)
+        self.speed = np.array([t.speed for t in self.teams], dtype=np.float64)
+        self.skills = np.array([t.skills for t in self.teams], dtype=np.int64)
+        self.free = np.array([t.capacity for t in self.teams], dtype=np.int64)
+        self.assigned = {}   # incident id -> team index
+        self.by_id = {t.id: k for k, t in enumerate(self.teams)}
+        self.index = GridIndex(self.pos)
+        self.max_speed = float(self.speed.max()) if len(self.teams) else 0.0
+
+    @property
+    def free_slots(self):
+        return int(self.free.sum())
+
+    def costs(self, incidents):
+        """(incidents x teams) weighted response time in hours; inf where
+        the team lacks a skill the incident needs"""
+        pos = np.array([i.pos for i in incidents], dtype=np.float64).reshape(-1, 2)
+        need = np.array([needs(i) for i in incidents], dtype=np.int64)
+        w = np.array([weight(i) for i in incidents], dtype=np.float64)
+
+        dist = np.hypot(pos[:, None, 0] - self.pos[None, :, 0],
+                        pos[:, None, 1] - self.pos[None, :, 1])
+        cost = w[:, None] * dist / self.speed[None, :]
+        cost[(self.skills[None, :] & need[:, None]) != need[:, None]] = np.inf
+        return cost, w
+
+    def can_serve(self, incident):
+        """True if some team has the skills, busy or not"""
+        need = needs(incident)
+        return bool(((self.skills & need) == need).any())
+
+    # ── incremental ─────────────────────────────────────────────
+    def assign(self, incident):
+        """Commit the free team that can arrive soonest; None if no free
+        team has the skills"""
+        need = needs(incident)
+        available = ((self.skills & need) == need) & (self.free > 0)
+        best, best_eta, k = None, np.inf, 4
+        while True:
+            idx, dist = self.index.nearest(incident.pos, k, mask=available)
+            eta = dist / self.speed[idx]
+            if len(idx) and eta.min() < best_eta:
+                pick = int(np.argmin(eta))
+                best, best_eta = int(idx[pick]), float(eta[pick])
+            # Teams further out than the k-th cannot beat best_eta even at top speed
+            if len(idx) < k or dist[-1] / self.max_speed >= best_eta:
+                break
+            k *= 2
+        if best is None:
+            return None
+        self.free[best] -= 1
+        self.assigned[incident.id] = best
+        return self.teams[best]
+
+    def commit(self, incident, team):
+        """Give incident to team (from plan()); returns team, or None if
+        the plan left the incident unassigned"""
+        if team is None:
+            return None
+        best = self.by_id[team.id]
+        self.free[best] -= 1
+        self.assigned[incident.id] = best
+        return team
+
+    def release(self, incident_id):
+        """The team working incident_id is free again"""
+        best = self.assigned.pop(incident_id, None)
+        if best is not None:
+            self.free[best] += 1
+
+    def eta_hours(self, incident, team):
+        dx = incident.pos[0] - team.pos[0]
+        dy = incident.pos[1] - team.pos[1]
+        return (dx * dx + dy * dy) ** 0.5 / team.speed
+
+    # ── whole-set planning ──────────────────────────────────────
+    def plan(self, incidents):
+        """Assign incidents to the currently free team slots.
+
+        Returns {incident id: Team or None}. Does not commit anything;
+        call commit() for that.
+        """
+        if not incidents:
+            return {}
+        cost, w = self.costs(incidents)
+        if len(incidents) <= self.optimal_limit:
+            picks = self._optimal(cost, w)
+        else:
+            picks = self._greedy(cost, w)
+        return {inc.id: (self.teams[t] if t >= 0 else None)
+                for inc, t in zip(incidents, picks)}
+
+    def total_cost(self, incidents, plan):
+        cost, w = self.costs(incidents)
+        total = 0.0
+        for row, inc in enumerate(incidents):
+            team = plan[inc.id]
+            total += (cost[row, self.by_id[team.id]] if team is not None
+                      else w[row] * UNASSIGNED_HOURS)
+        return total
+
+    def _greedy(self, cost, w):
+        # Heaviest incidents first, each to its cheapest team with a free slot
+        free = self.free.copy()
+        cost = cost.copy()
+        cost[:, free <= 0] = np.inf
+        picks = np.full(len(w), -1, dtype=np.int64)
+        for row in np.argsort(-w, kind="stable").tolist():
+            best = int(np.argmin(cost[row]))
+            if not np.isfinite(cost[row, best]):
+                continue
+            picks[row] = best
+            free[best] -= 1
+            if free[best] == 0:
+                cost[:, best] = np.inf
+        return picks
+
+    def _optimal(self, cost, w):
+        # One column per free team slot plus one "unassigned" column per
+        # incident, then a minimum-cost perfect matching
+        n = len(w)
+        slots = np.repeat(np.arange(len(self.teams)), np.minimum(self.free, n))
+        big = (w * UNASSIGNED_HOURS).sum() + 1.0
+        matrix = np.full((n, len(slots) + n), big)
+        matrix[:, :len(slots)] = np.where(np.isfinite(cost[:, slots]), cost[:, slots], big)
+        matrix[np.arange(n), len(slots) + np.arange(n)] = w * UNASSIGNED_HOURS
+        cols = hungarian(matrix)
+        return np.array([slots[c] if c < len(slots) else -1 for c in cols], dtype=np.int64)
+
+
+def hungarian(cost):
+    """Minimum-cost assignment of every row to a distinct column
+    (rows <= columns). Returns the column chosen for each row."""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)      # p[j] = row matched to column j (1-based)
+    way = np.zeros(m + 1, dtype=np.int64)
+    a = np.zeros((n + 1, m + 1))
+    a[1:, 1:] = cost
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            cur = a[i0] - u[i0] - v
+            better = free & (cur < minv)
+            minv[better] = cur[better]
+            way[better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.zeros(n, dtype=np.int64)
+    for j in range(1, m + 1):
+        if p[j]:
+            cols[p[j] - 1] = j - 1
+    return cols
@@ -0,0 +1,80 @@
+"""
+Size/time batching for high-rate senders.
+
+A Batcher buffers items and releases them as one batch when it holds
+max_size items or its oldest item has waited max_delay seconds, whichever
+comes first. Senders call add() on every item and run flush_due() in a
+behaviour to pick up batches that time out before they fill.
+"""
+
+import asyncio
+
+
+class Batcher:
+    def __init__(self, max_size, max_delay):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.items = []
+        self._first_at = None
+        self._nonempty = asyncio.Event()
+
+        # Metrics
+        self.batches = 0
+        self.flushed_items = 0
+        self.by_size = 0
+        self.by_time = 0
+        self.fill_counts = [0] * (max_size + 1)   # fill_counts[n] = batches of n items
+
+    def add(self, item):
+        """Buffer item; returns the batch if this filled it, else None"""
+        if not self.items:
+            self._first_at = asyncio.get_running_loop().time()
+            self._nonempty.set()
+        self.items.append(item)
+        if len(self.items) >= self.max_size:
+            self.by_size += 1
+            return self._take()
+        return None
+
+    async def flush_due(self):
+        """Wait until the buffered items reach max_delay, then return them"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.items:
+                await self._nonempty.wait()
+                continue
+            left = self._first_at + self.max_delay - loop.time()
+            if left <= 0:
+                self.by_time += 1
+                return self._take()
+            await asyncio.sleep(left)
+
+    def flush(self):
+        """Return whatever is buffered now (e.g. on shutdown)"""
+        if not self.items:
+            return []
+        self.by_time += 1
+        return self._take()
+
+    def _take(self):
+        batch, self.items = self.items, []
+        self._first_at = None
+        self._nonempty.clear()
+        self.batches += 1
+        self.flushed_items += len(batch)
+        self.fill_counts[len(batch)] += 1
+        return batch
+
+    def stats(self):
+        mean = self.flushed_items / self.batches if self.batches else 0.0
+        return {
+            "batches": self.batches,
+            "items": self.flushed_items,
+            "mean_size": round(mean, 2),
+            "mean_fill": round(mean / self.max_size, 3),
+            "flushed_by_size": self.by_size,
+            "flushed_by_time": self.by_time,
+            "fill_histogram": {n: c for n, c in enumerate(self.fill_counts) if c},
+        }
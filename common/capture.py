@@ -0,0 +1,322 @@
+"""
+Capture and replay of the ACL messages agents exchange.
+
+A capture records every Message sent, on a LocalBus or over XMPP, with
+the sender, recipient, thread, body and all metadata (performative,
+ontology, zone, ...) and the monotonic time it was sent (the loop's
+clock, so virtual time under simclock):
+
+    capture = CaptureWriter("run.cap").start()   # every send is recorded
+    ...
+    capture.close()
+
+    for rec in CaptureReader("run.cap"):         # streamed, any file size
+        rec.time, rec.sender, rec.metadata["ontology"], rec.body
+
+A ReplayAgent sends a capture's messages again, at the recorded pace
+(speed=1), N times faster (speed=N) or as fast as the recipients take
+them (speed=0), so a run can be reproduced exactly, a pipeline can be
+load-tested with a day of traffic in minutes, and historical data
+written with CaptureWriter.append() can be fed to the agents in place
+of their random sensors.
+
+File format
+-----------
+Append-only: MAGIC, then records, each starting with one type byte:
+
+    R  <B restart>                  new segment: string table emptied;
+                                    restart=1 when a new writer opened
+                                    the file and its clock starts again
+    S  <H n> n bytes                next entry in the string table
+    M  <d t> <I sender> <I to> <H k> k x (<I key> <I value>)
+       <i n> n bytes (thread; n=-1 for none) <I n> n bytes (body)
+
+JIDs, metadata keys and values are written once per segment as S
+records and referred to by index, so a message costs its body, its
+thread and about 40 bytes. A segment holds at most MAX_STRINGS strings,
+which bounds the table a reader keeps in memory. Times are seconds from
+the writer's first message; a reader continues them across writers so
+they never go back.
+
+Records are buffered and reach the file a buffer at a time; the loop
+never waits on more than a write to the page cache. A file cut short by
+a crash reads up to its last complete record. Readers parse a chunk at a
+time (or an mmap of the file with mmap=True), so memory does not grow
+with the capture.
+"""
+
+import asyncio
+import logging
+import mmap as _mmap
+import os
+import struct
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from spade.behaviour import OneShotBehaviour
+from spade.message import Message
+
+from common import transport
+from common.metrics import counter
+from common.transport import BusAgent
+
+logger = logging.getLogger("flood.capture")
+
+CAPTURED = counter("flood_capture_messages_total", "Messages written to a capture")
+REPLAYED = counter("flood_replay_messages_total", "Captured messages sent again", ("ontology",))
+
+MAGIC = b"FLOODCAP1\n"
+MAX_STRINGS = 1 << 16
+CHUNK = 1 << 20
+
+# The messages that come from outside the agents: what a replay sends
+INPUTS = ("sensor-reading", "sensor-batch", "disaster-event", "disaster-batch")
+
+Captured = namedtuple("Captured", "time sender to thread body metadata")
+
+_SEGMENT = struct.Struct("<cB")
+_STRING = struct.Struct("<cH")
+_MESSAGE = struct.Struct("<cdIIH")
+_THREAD = struct.Struct("<i")
+_BODY = struct.Struct("<I")
+_M, _S, _R = b"MSR"
+
+
+@lru_cache(maxsize=None)
+def _ids(n):
+    # The metadata (key, value) string ids of a message with n // 2 pairs
+    return struct.Struct(f"<{n}I")
+
+
+def message(rec):
+    """The spade Message a captured record was"""
+    return Message(to=rec.to, sender=rec.sender, body=rec.body, thread=rec.thread,
+                   metadata=dict(rec.metadata))
+
+
+class CaptureWriter:
+    def __init__(self, path, buffering=CHUNK):
+        self.path = path
+        self.file = open(path, "ab", buffering=buffering)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.origin = None
+        self.written = 0
+        self._segment(restart=1)
+
+    def _segment(self, restart=0):
+        self.file.write(_SEGMENT.pack(b"R", restart))
+        self.strings = {}
+
+    def _id(self, text):
+        i = self.strings.get(text)
+        if i is None:
+            data = text.encode()
+            i = self.strings[text] = len(self.strings)
+            self.file.write(_STRING.pack(b"S", len(data)))
+            self.file.write(data)
+        return i
+
+    def append(self, t, sender, to, metadata, body, thread=None):
+        """Write one message sent at monotonic time t (seconds)"""
+        if self.origin is None:
+            self.origin = t
+        # Room for every string this message could add
+        if len(self.strings) + 2 + 2 * len(metadata) > MAX_STRINGS:
+            self._segment()
+        ids = [self._id(text) for pair in metadata.items() for text in pair]
+        header = _MESSAGE.pack(b"M", t - self.origin, self._id(sender), self._id(to), len(metadata))
+        if thread is None:
+            thread, n = b"", -1
+        else:
+            thread = thread.encode()
+            n = len(thread)
+        body = body.encode()
+        self.file.write(b"".join((header, _ids(len(ids)).pack(*ids), _THREAD.pack(n), thread,
+                                  _BODY.pack(len(body)), body)))
+        self.written += 1
+        CAPTURED.inc()
+
+    def record(self, msg):
+        """Tap for common.transport: writes a Message as it is sent"""
+        try:
+            now = asyncio.get_running_loop().time()
+        except RuntimeError:
+            now = time.monotonic()
+        # spade has no public accessor for the whole metadata dict
+        self.append(now, str(msg.sender), str(msg.to), msg._metadata, msg.body or "", msg.thread)
+
+    def start(self):
+        """Record every Message agents in this process send, until close()"""
+        transport.TAPS.append(self.record)
+        return self
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.record in transport.TAPS:
+            transport.TAPS.remove(self.record)
+        self.file.close()
+        logger.info("[Capture] %d messages written to %s", self.written, self.path)
+
+
+class CaptureReader:
+    """Iterates a capture's messages as Captured records, in order"""
+
+    def __init__(self, path, mmap=False, chunk=CHUNK):
+        self.path = path
+        self.mmap = mmap
+        self.chunk = chunk
+        self.truncated = False
+
+    def __iter__(self):
+        # String table and clock carried from one buffer to the next
+        self._strings = []
+        self._base = self._last = 0.0
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a capture")
+            if self.mmap:
+                size = os.fstat(f.fileno()).st_size
+                if size > len(MAGIC):
+                    with _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) as mapped:
+                        view = memoryview(mapped)
+                        try:
+                            end = yield from self._records(view, len(MAGIC))
+                        finally:
+                            view.release()
+                    self._finish(size - end)
+                return
+            rest = b""
+            while True:
+                data = f.read(self.chunk)
+                if not data:
+                    self._finish(len(rest))
+                    return
+                buf = rest + data if rest else data
+                end = yield from self._records(buf, 0)
+                rest = buf[end:]
+
+    def _finish(self, left):
+        if left:
+            self.truncated = True
+            logger.warning("[Capture] %s ends in a partial record", self.path)
+
+    def _records(self, buf, pos):
+        """Yield the complete records in buf from pos; returns where the
+        first incomplete one starts"""
+        strings = self._strings
+        size = len(buf)
+        while pos < size:
+            kind = buf[pos]
+            try:
+                if kind == _M:
+                    _, t, sender, to, k = _MESSAGE.unpack_from(buf, pos)
+                    at = pos + _MESSAGE.size
+                    ids = _ids(2 * k).unpack_from(buf, at)
+                    at += 8 * k
+                    metadata = {strings[ids[i]]: strings[ids[i + 1]] for i in range(0, 2 * k, 2)}
+                    (n,) = _THREAD.unpack_from(buf, at)
+                    at += _THREAD.size
+                    thread = None
+                    if n >= 0:
+                        thread = _text(buf, at, n)
+                        at += n
+                    (n,) = _BODY.unpack_from(buf, at)
+                    at += _BODY.size
+                    body = _text(buf, at, n)
+                    pos = at + n
+                    self._last = self._base + t
+                    yield Captured(self._last, strings[sender], strings[to], thread, body,
+                                   metadata)
+                elif kind == _S:
+                    _, n = _STRING.unpack_from(buf, pos)
+                    strings.append(_text(buf, pos + _STRING.size, n))
+                    pos += _STRING.size + n
+                elif kind == _R:
+                    _, restart = _SEGMENT.unpack_from(buf, pos)
+                    pos += _SEGMENT.size
+                    strings.clear()
+                    if restart:
+                        self._base = self._last
+                else:
+                    raise ValueError(f"{self.path}: bad record type {kind!r} at {pos}")
+            except (struct.error, _Short):
+                # The record runs past the end of the buffer
+                break
+        return pos
+
+
+class _Short(Exception):
+    pass
+
+
+def _text(buf, pos, n):
+    if pos + n > len(buf):
+        raise _Short
+    return str(buf[pos:pos + n], "utf-8")
+
+
+class ReplayAgent(BusAgent):
+    """Sends the messages of a capture whose ontology is in `ontologies`
+    (the sensor inputs by default) at `speed` times the recorded pace;
+    speed=0 sends them as fast as the recipients take them.
+
+    Messages keep their captured sender, so on a LocalBus each reading
+    arrives from the sensor that sent it (over XMPP the server stamps
+    this agent's JID instead). route, if given, is an async function of
+    the Message returning the JID to send it to, for pipelines laid out
+    differently from the captured one. At full speed on a bus the agent
+    waits while the recipient has more than `window` messages queued, so
+    a large capture does not end up in a mailbox. `done` is set once the
+    capture is sent."""
+
+    def __init__(self, jid, password, bus=None, path=None, speed=1.0, ontologies=INPUTS,
+                 route=None, mmap=False, window=1000):
+        super().__init__(jid, password, bus=bus)
+        self.reader = CaptureReader(path, mmap=mmap)
+        self.speed = speed
+        self.ontologies = set(ontologies) if ontologies else None
+        self.route = route
+        self.window = window
+        self.sent = 0
+        self.done = asyncio.Event()
+
+    class ReplayBehaviour(OneShotBehaviour):
+        async def run(self):
+            try:
+                await self.agent.replay(self)
+            finally:
+                self.agent.done.set()
+
+    async def replay(self, behaviour):
+        loop = asyncio.get_running_loop()
+        start = first = None
+        for rec in self.reader:
+            ontology = rec.metadata.get("ontology")
+            if self.ontologies is not None and ontology not in self.ontologies:
+                continue
+            if self.speed:
+                if first is None:
+                    start, first = loop.time(), rec.time
+                delay = start + (rec.time - first) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            msg = message(rec)
+            if self.route is not None:
+                msg.to = await self.route(msg)
+            await behaviour.send(msg)
+            self.sent += 1
+            REPLAYED.inc(ontology or "none")
+            if not self.speed:
+                # Let the recipients run; hold off while they are behind
+                await asyncio.sleep(0)
+                while self.bus is not None and self.bus.backlog(msg.to) > self.window:
+                    await asyncio.sleep(0.001)
+        logger.info("[Replay] %d messages from %s replayed at %s", self.sent,
+                    self.reader.path, f"{self.speed:g}x" if self.speed else "full speed")
+
+    async def setup(self):
+        self.add_behaviour(self.ReplayBehaviour())
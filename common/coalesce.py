@@ -0,0 +1,105 @@
+"""
+Coalescing of repeated requests about the same situation.
+
+A CoalescingTable maps a key, e.g. (zone, risk), to whatever stands for
+the request already made about it (an incident id, a conversation id).
+While an entry is live, repeats of the key are folded into it instead of
+starting something new. An entry lives for ttl seconds after it was
+added, and for as long as it is held open (hold() / release()), so an
+incident still being worked keeps absorbing repeats however long it
+takes, and once it is done, a persisting situation is raised again after
+the TTL rather than never.
+
+    table = CoalescingTable(ttl=60)
+    if table.get(("Zone_3", "HIGH"), now) is None:
+        table.put(("Zone_3", "HIGH"), incident_id, now, hold=True)
+
+Expired entries are dropped lazily on lookup, and put() sweeps the
+whole table once every ttl seconds, so it never holds more than the
+held entries and those added in the last two TTLs. That is O(1)
+amortised per put(), and keeps held() short for the status endpoint.
+Work saved is counted in flood_coalesced_total{agent, kind}.
+"""
+
+from common.metrics import counter
+
+SAVED = counter("flood_coalesced_total", "Requests folded into an existing one instead of "
+                "being sent or dispatched", ("agent", "kind"))
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "held", "hits")
+
+    def __init__(self, value, expires, held):
+        self.value = value
+        self.expires = expires
+        self.held = held
+        self.hits = 0
+
+
+class CoalescingTable:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.by_value = {}      # value -> key, for release(value)
+        self.coalesced = 0
+        self.swept = None       # when sweep() last ran
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now):
+        """The live entry's value for key, counting the repeat; None if there is none"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not entry.held and now >= entry.expires:
+            self._drop(key)
+            return None
+        entry.hits += 1
+        self.coalesced += 1
+        return entry.value
+
+    def put(self, key, value, now, hold=False):
+        if self.swept is None or now - self.swept >= self.ttl:
+            self.sweep(now)
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = _Entry(value, now + self.ttl, hold)
+        self.by_value[value] = key
+
+    def hits(self, key):
+        entry = self.entries.get(key)
+        return entry.hits if entry is not None else 0
+
+    def held(self):
+        """(key, value) of every entry held open"""
+        return [(key, entry.value) for key, entry in self.entries.items() if entry.held]
+
+    def release(self, value, now):
+        """The work behind value is done; its entry lapses at its TTL from now on"""
+        key = self.by_value.get(value)
+        if key is not None:
+            entry = self.entries[key]
+            entry.held = False
+            if now >= entry.expires:
+                self._drop(key)
+
+    def pop(self, key):
+        """Forget key at once, e.g. the request behind it was refused"""
+        if key in self.entries:
+            self._drop(key)
+
+    def sweep(self, now):
+        """Drop every expired entry; returns how many went"""
+        self.swept = now
+        stale = [key for key, entry in self.entries.items()
+                 if not entry.held and now >= entry.expires]
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        if self.by_value.get(entry.value) == key:
+            del self.by_value[entry.value]
@@ -0,0 +1,87 @@
+"""
+Priority queue for the CoordinatorAgent's pending rescue requests.
+
+Requests are ordered by risk (CRITICAL before HIGH), then by water level
+(higher first), then by age (older first). The queue is bounded: push()
+returns False once `limit` requests are waiting, and the coordinator
+answers REFUSE with a retry hint instead of buffering without limit.
+
+take() pops every request a callback accepts, still in priority order,
+so a request waiting for a particular kind of team does not hold up the
+ones behind it.
+"""
+
+import asyncio
+import heapq
+import itertools
+from collections import deque
+
+from common.stats import percentiles
+
+RISK_RANK = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+
+
+class DispatchQueue:
+    def __init__(self, limit=100, wait_samples=1000):
+        self.limit = limit
+        self._heap = []
+        self._seq = itertools.count()
+        self.waits = deque(maxlen=wait_samples)   # seconds from push to pop
+
+        self.accepted = 0
+        self.refused = 0
+        self.dispatched = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item, risk, water=0):
+        """Queue item; False if the queue is full"""
+        if len(self._heap) >= self.limit:
+            self.refused += 1
+            return False
+        now = asyncio.get_running_loop().time()
+        key = (RISK_RANK.get(risk, len(RISK_RANK)), -water, now, next(self._seq))
+        heapq.heappush(self._heap, (key, item))
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, len(self._heap))
+        return True
+
+    def pop(self):
+        key, item = heapq.heappop(self._heap)
+        self.waits.append(asyncio.get_running_loop().time() - key[2])
+        self.dispatched += 1
+        return item
+
+    def items(self):
+        """Queued items in priority order"""
+        return [item for _, item in sorted(self._heap)]
+
+    def take(self, accept):
+        """Pop, in priority order, each item for which accept(item) returns
+        something other than None; returns [(item, result), ...]"""
+        now = asyncio.get_running_loop().time()
+        taken, kept = [], []
+        for key, item in sorted(self._heap):
+            result = accept(item)
+            if result is None:
+                kept.append((key, item))
+                continue
+            taken.append((item, result))
+            self.waits.append(now - key[2])
+        if taken:
+            self._heap = kept            # sorted, so already a heap
+            self.dispatched += len(taken)
+        return taken
+
+    def stats(self):
+        waits = percentiles(self.waits)
+        return {
+            "depth": len(self._heap),
+            "max_depth": self.max_depth,
+            "accepted": self.accepted,
+            "refused": self.refused,
+            "dispatched": self.dispatched,
+            **{f"wait_p{p}_ms": round(w * 1000, 1) for p, w in waits.items()},
+        }
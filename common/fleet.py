@@ -0,0 +1,121 @@
+"""
+Declarative agent fleets and a concurrent launcher.
+
+A FleetSpec says what to run; launch() builds and starts it:
+
+    spec = FleetSpec(SensorAgent, count=10_000, jid="takyisky.sensor4-{}@xmpp.jp",
+                     password="sensor123", period=4, zone="Zone_{}")
+    sensors = await launch(spec, bus=bus, risk_pool=pool)
+    ...
+    await stop(sensors)
+
+Agent i gets jid.format(i) and zone.format(i) (zone may also be a
+function of i); extra keyword arguments to launch() are passed to every
+agent, so routing tables, buses and stores are shared, not copied.
+
+Starts run concurrently, at most `parallelism` at a time. Over XMPP each
+start is a TLS connection and a login, so overlapping them is what
+brings a fleet up in seconds; the bound keeps the server (and the local
+file descriptors) from being hit by every login at once.
+
+Each XMPP client connects with a TLS context of its own, loaded with the
+system CA bundle. start_all() builds one context for the fleet
+(tls_context()) and hands it to every BusAgent, which connects with it
+rather than its own (see BusAgent). spade still builds each client's
+own context when the agent starts, so this shares the connection
+settings, not that start-up cost.
+
+With per_agent > 1 the fleet is of virtual sensors: each agent hosts
+per_agent consecutive sensors and gets zones=[...] instead of zone=...,
+so 10,000 sensors can be 100 agents on 100 connections.
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+from collections import namedtuple
+
+from common.metrics import histogram
+from common.transport import BusAgent
+
+logger = logging.getLogger("flood.fleet")
+
+START = histogram("flood_fleet_start_seconds", "Time to start one agent of a fleet", ("fleet",))
+
+FleetSpec = namedtuple("FleetSpec", "agent count jid password period zone per_agent kwargs",
+                       defaults=("", 4, "Zone_{}", 1, {}))
+
+
+def zones(spec):
+    """Every sensor's zone, in order"""
+    zone = spec.zone if callable(spec.zone) else spec.zone.format
+    return [zone(i) for i in range(spec.count)]
+
+
+def build(spec, **shared):
+    """The fleet's agents, not yet started"""
+    names = zones(spec)
+    agents = []
+    for n, first in enumerate(range(0, spec.count, spec.per_agent)):
+        kwargs = dict(spec.kwargs, period=spec.period, **shared)
+        if spec.per_agent == 1:
+            kwargs["zone"] = names[first]
+        else:
+            kwargs["zones"] = names[first:first + spec.per_agent]
+        agents.append(spec.agent(spec.jid.format(n), spec.password, **kwargs))
+    return agents
+
+
+def tls_context():
+    """A client TLS context as slixmpp builds for each client: hostname
+    checked, certificate required, the system CA bundle loaded"""
+    context = ssl.create_default_context()
+    context.check_hostname = True
+    context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
+
+async def start_all(agents, parallelism=64, name="fleet"):
+    """Start agents concurrently, at most parallelism at once; returns
+    the ones that started (failures are logged)"""
+    gate = asyncio.Semaphore(parallelism)
+    context = tls_context()
+
+    async def start(agent):
+        async with gate:
+            began = time.perf_counter()
+            if isinstance(agent, BusAgent):
+                agent.tls_context = context
+            await agent.start()
+            START.observe(time.perf_counter() - began, name)
+
+    results = await asyncio.gather(*(start(agent) for agent in agents),
+                                   return_exceptions=True)
+    started = []
+    for agent, result in zip(agents, results):
+        if isinstance(result, BaseException):
+            logger.warning("[Fleet] %s failed to start: %s", agent.jid, result)
+        else:
+            started.append(agent)
+    return started
+
+
+async def launch(spec, parallelism=64, **shared):
+    """Build and start the fleet; returns the agents that are running"""
+    name = spec.jid.split("@", 1)[0].format("*")
+    began = time.perf_counter()
+    agents = await start_all(build(spec, **shared), parallelism, name)
+    logger.info("[Fleet] %d sensors on %d/%d agents ready in %.2fs", spec.count, len(agents),
+                -(-spec.count // spec.per_agent), time.perf_counter() - began)
+    return agents
+
+
+async def stop(agents, parallelism=256):
+    gate = asyncio.Semaphore(parallelism)
+
+    async def stop_one(agent):
+        async with gate:
+            await agent.stop()
+
+    await asyncio.gather(*(stop_one(agent) for agent in agents))
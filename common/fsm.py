@@ -0,0 +1,149 @@
+"""
+Table-driven finite state machines for agents.
+
+A machine is a list of Transition(source, trigger, guard, dest, action)
+rows:
+
+  trigger  EVENT    consumes the next event (a decoded message)
+           TIMEOUT  the state's timeout passed with no message
+           NOW      fires as soon as the state is entered, with the
+                    event that led there
+  guard    guard(agent, event) -> bool, or None to always match
+  action   action(agent, event), plain or async, or None
+
+Rows with the same source and trigger are tried in table order and the
+first whose guard passes wins. An event no EVENT row accepts is ignored
+and the machine stays where it is.
+
+TableFSM compiles the table once into per-state tuples and runs it as a
+single CyclicBehaviour. Each cycle waits for one message, then drains
+whatever else is already queued (up to max_drain) and pushes every event
+through the table, so a burst costs one wakeup rather than one FSM cycle
+per message. Dwell time per state, transition counts and drain sizes go
+to common.metrics.
+"""
+
+import asyncio
+import inspect
+import logging
+from collections import namedtuple
+
+from spade.behaviour import CyclicBehaviour
+
+from common.metrics import counter, histogram
+
+logger = logging.getLogger("flood.fsm")
+
+EVENT, TIMEOUT, NOW = "event", "timeout", "now"
+_TRIGGERS = (EVENT, TIMEOUT, NOW)
+
+Transition = namedtuple("Transition", "source trigger guard dest action")
+
+STATE_SECONDS = histogram("flood_fsm_state_seconds", "Time spent in an FSM state per visit",
+                          ("agent", "state"))
+TRANSITIONS = counter("flood_fsm_transitions_total", "FSM transitions taken",
+                      ("agent", "source", "dest"))
+EVENTS = counter("flood_fsm_events_total", "Events fed to an FSM", ("agent",))
+DRAIN = histogram("flood_fsm_drain_size", "Messages taken from the mailbox per wakeup",
+                  ("agent",), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+class FSMError(ValueError):
+    """The transition table is malformed or the machine got stuck"""
+
+
+def compile_table(table, initial):
+    """{state: (event rows, timeout rows, now rows)}, each row (guard, dest, action)"""
+    rows = {}
+    for t in table:
+        if t.trigger not in _TRIGGERS:
+            raise FSMError(f"unknown trigger {t.trigger!r} in {t}")
+        rows.setdefault(t.source, {trigger: [] for trigger in _TRIGGERS})
+        rows.setdefault(t.dest, {trigger: [] for trigger in _TRIGGERS})
+        rows[t.source][t.trigger].append((t.guard, t.dest, t.action))
+
+    if initial not in rows:
+        raise FSMError(f"initial state {initial!r} is not in the table")
+    for state, by_trigger in rows.items():
+        waits = by_trigger[EVENT] or by_trigger[TIMEOUT]
+        if by_trigger[NOW] and waits:
+            raise FSMError(f"{state} both waits for events and moves on at once")
+        if not by_trigger[NOW] and not by_trigger[EVENT]:
+            raise FSMError(f"{state} has no way out")
+    return {state: tuple(tuple(by_trigger[t]) for t in _TRIGGERS)
+            for state, by_trigger in rows.items()}
+
+
+class TableFSM(CyclicBehaviour):
+    """Runs a compiled transition table.
+
+    decode(msg) turns a message into an event, or None to skip it.
+    timeouts maps waiting states to seconds (default_timeout otherwise).
+    """
+
+    def __init__(self, table, initial, decode, timeouts=None, default_timeout=10,
+                 max_drain=100):
+        super().__init__()
+        self.table = compile_table(table, initial)
+        self.state = initial
+        self.decode = decode
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_drain = max_drain
+        self.entered = None
+
+    async def on_start(self):
+        self.entered = asyncio.get_running_loop().time()
+
+    async def run(self):
+        msg = await self.receive(timeout=self.timeouts.get(self.state, self.default_timeout))
+        if msg is None:
+            await self.fire(TIMEOUT, None)
+            return
+
+        batch = [msg]
+        while len(batch) < self.max_drain:
+            msg = await self.receive()    # no timeout: only what is already queued
+            if msg is None:
+                break
+            batch.append(msg)
+        name = self.agent.name
+        DRAIN.observe(len(batch), name)
+
+        for msg in batch:
+            event = self.decode(msg)
+            if event is not None:
+                EVENTS.inc(name)
+                await self.fire(EVENT, event)
+
+    async def fire(self, trigger, event):
+        """Feed one event (or a timeout) through the table"""
+        rows = self.table[self.state][_TRIGGERS.index(trigger)]
+        if not await self._take(rows, event):
+            return   # nothing in this state handles it
+        while self.table[self.state][2]:
+            if not await self._take(self.table[self.state][2], event):
+                raise FSMError(f"no NOW transition out of {self.state} matched {event!r}")
+
+    async def _take(self, rows, event):
+        agent = self.agent
+        for guard, dest, action in rows:
+            if guard is None or guard(agent, event):
+                break
+        else:
+            return False
+
+        if action is not None:
+            result = action(agent, event)
+            if inspect.isawaitable(result):
+                await result
+
+        source = self.state
+        TRANSITIONS.inc(agent.name, source, dest)
+        if dest != source:
+            now = asyncio.get_running_loop().time()
+            STATE_SECONDS.observe(now - self.entered, agent.name, source)
+            self.entered = now
+            self.state = dest
+            logger.debug("[%s FSM] %s → %s", agent.name, source, dest)
+        return True
@@ -0,0 +1,108 @@
+"""
+Non-blocking logging for the agents.
+
+setup() routes every "flood.*" logger through a QueueHandler: the event
+loop only drops the LogRecord (message template plus arguments, still
+unformatted) on a queue, and a QueueListener thread does the formatting
+and the stdout writes. Records below the level are discarded before any
+formatting happens, so call sites should pass arguments rather than
+f-strings:
+
+    logger.info("[%s] <%s> %s", agent, performative, body)
+
+If the writer falls behind and the queue fills up, records are dropped
+and counted (flood_log_dropped_total) instead of stalling the loop.
+
+The writer thread still shares the GIL, so a queued record is not free
+(a few microseconds to build); what it buys is that a slow terminal or
+pipe never stalls the event loop. For load runs raise the level: a
+filtered call costs well under a microsecond.
+
+While it runs, setup() also turns off the logging module's caller,
+thread and process lookups (logging._srcfile, logThreads, logProcesses,
+logMultiprocessing). Those are process-wide, so records from every
+logger (spade, slixmpp, aiohttp) lose %(filename)s, %(lineno)d,
+%(thread)d and %(process)d too; shutdown() puts them back.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import queue
+import sys
+
+from common import simclock
+from common.metrics import counter
+
+DROPPED = counter("flood_log_dropped_total", "Log records dropped because the log queue was full")
+
+FORMAT = "[%(asctime)s] %(message)s"
+DATEFMT = "%H:%M:%S"
+
+_listener = None
+_saved = None       # the logging module's globals from before setup()
+
+_GLOBALS = ("_srcfile", "logThreads", "logProcesses", "logMultiprocessing")
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, records, max_queue):
+        super().__init__(records)
+        self.max_queue = max_queue
+
+    def prepare(self, record):
+        # Leave msg % args for the listener thread; only pin down what
+        # cannot travel: the traceback and the (virtual) wall time
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if isinstance(loop, simclock.VirtualClockLoop):
+            record.created = loop.wall().timestamp()
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_queue:
+            DROPPED.inc()
+        else:
+            self.queue.put_nowait(record)
+
+
+def setup(level="INFO", stream=None, max_queue=10_000, name="flood"):
+    """Start the background log writer for the `name` logger tree"""
+    global _listener, _saved
+    shutdown()
+    # Nothing we print needs the caller's file/line or process/thread
+    # ids; skipping them is the logging module's documented fast path
+    _saved = {attr: getattr(logging, attr) for attr in _GLOBALS}
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(FORMAT, DATEFMT))
+
+    root = logging.getLogger(name)
+    root.handlers[:] = [_LazyQueueHandler(records, max_queue)]
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    return _listener
+
+
+def shutdown():
+    """Write out whatever is still queued, stop the writer thread and
+    restore the logging module's globals"""
+    global _listener, _saved
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _saved is not None:
+        for attr, value in _saved.items():
+            setattr(logging, attr, value)
+        _saved = None
@@ -0,0 +1,136 @@
+"""
+In-process counters and histograms with a Prometheus text export.
+
+Metrics are created once at import time and updated on the hot path
+with a dict lookup and an add; nothing is formatted until render() is
+called.
+
+    MESSAGES = counter("flood_messages_total", "ACL messages", ("agent", "direction"))
+    MESSAGES.inc("risk4", "in")
+    print(REGISTRY.render())
+"""
+
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Seconds; suits both message hops (ms) and rescue work / state dwell (s)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = defaultdict(float)   # label values -> total
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] += amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        if not self.labels and not self.values:
+            yield self.name, (), 0
+        for labels, value in sorted(self.values.items()):
+            yield self.name, self._pairs(labels), value
+
+    def _pairs(self, labels, extra=()):
+        return tuple(zip(self.labels, labels)) + tuple(extra)
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}                   # label values -> per-bucket counts (+inf last)
+        self.sums = defaultdict(float)
+
+    def observe(self, value, *labels):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the wall time spent in the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels):
+        return sum(self.counts.get(labels, ()))
+
+    def mean(self, *labels):
+        n = self.count(*labels)
+        return self.sums[labels] / n if n else 0.0
+
+    def samples(self):
+        for labels, counts in sorted(self.counts.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield self.name + "_bucket", self._pairs(labels, [("le", le)]), running
+            yield self.name + "_sum", self._pairs(labels), self.sums[labels]
+            yield self.name + "_count", self._pairs(labels), running
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            # Re-imported module (e.g. a lab run as __main__ and imported)
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, pairs, value in metric.samples():
+                if pairs:
+                    labels = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                    name = f"{name}{{{labels}}}"
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write(self.render())
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
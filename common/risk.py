@@ -0,0 +1,343 @@
+"""
+Flood risk classification used by the RiskAgent.
+
+classify() handles one reading; classify_batch() does the same rules for
+a whole batch of readings at once with NumPy. RiskModel classifies each
+sensor's readings on their recent trend instead; update_batch() takes a
+batch of STEP_BATCH or more readings through the trend in one pass of
+array operations and classifies every reading on the trend as of that
+reading, with classify_batch().
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+# water in metres, rain in mm/hr
+CRITICAL_WATER, CRITICAL_RAIN = 7, 150
+HIGH_WATER,     HIGH_RAIN     = 4, 80
+
+# Index = code returned by classify_batch() and RiskModel
+LEVELS  = ("LOW", "HIGH", "CRITICAL")
+ACTIONS = ("CONTINUE_MONITORING", "ALERT_TEAMS", "DISPATCH_RESCUE")
+
+
+def classify(water, rain):
+    """Return (risk, action) for one reading"""
+    if water >= CRITICAL_WATER or rain >= CRITICAL_RAIN:
+        return "CRITICAL", "DISPATCH_RESCUE"
+    elif water >= HIGH_WATER or rain >= HIGH_RAIN:
+        return "HIGH", "ALERT_TEAMS"
+    return "LOW", "CONTINUE_MONITORING"
+
+
+def classify_batch(water, rain):
+    """Vectorised classify(): returns an int8 array of indexes into LEVELS"""
+    water = np.asarray(water)
+    rain = np.asarray(rain)
+    codes = ((water >= HIGH_WATER) | (rain >= HIGH_RAIN)).astype(np.int8)
+    codes[(water >= CRITICAL_WATER) | (rain >= CRITICAL_RAIN)] = 2
+    return codes
+
+
+# ── Trend model ─────────────────────────────────────────────────
+# Water rising this fast (m/h, least-squares over the window) is HIGH on
+# its own, and the level projected HORIZON_H ahead at that rate is
+# checked against CRITICAL_WATER
+RISE_ALERT = 2.0
+HORIZON_H = 0.25
+# Trend times are kept relative to an origin moved forward this often
+REBASE_S = 86_400.0
+# Batches smaller than this are stepped through add(): the array pass
+# costs a fixed ~150 µs, about what add() takes for 30 readings
+STEP_BATCH = 32
+
+
+def _ewma(start, times, water, dt, tau):
+    """EWMA after each reading, from start, as add() would step it: the
+    recurrence unrolled into a cumulative sum weighted by exp(t / tau)"""
+    alpha = -np.expm1(-dt / tau)
+    rel = (times - times[0]) / tau
+    if rel[-1] < 500:
+        grow = np.exp(rel)
+        return start * np.exp(-rel - dt[0] / tau) + np.cumsum(grow * alpha * water) / grow
+    # The weights would overflow for a batch spanning hours: step it
+    out = np.empty(len(water))
+    ewma = start
+    for i, (a, w) in enumerate(zip(alpha.tolist(), water.tolist())):
+        ewma += a * (w - ewma)
+        out[i] = ewma
+    return out
+
+
+def _fits(n, sum_t, sum_w, sum_tt, sum_tw, sum_ww):
+    # SensorTrend._fit() over arrays of sums: (slope, standard error), m/s
+    stt = sum_tt - sum_t * sum_t / n
+    fit = (n >= 3) & (stt > 1e-9)
+    stw = sum_tw - sum_t * sum_w / n
+    sww = sum_ww - sum_w * sum_w / n
+    slope = np.where(fit, stw / stt, 0.0)
+    residual = np.maximum(sww - slope * stw, 0.0) / (n - 2)
+    return slope, np.where(fit, np.sqrt(residual / stt), np.inf)
+
+
+class SensorTrend:
+    """Sliding-window statistics for one sensor.
+
+    Keeps at most max_samples readings from the last window seconds and
+    running sums over them, so each update is O(1) amortised: the new
+    reading is added to the sums and evicted ones subtracted.
+    """
+
+    __slots__ = ("samples", "origin", "last", "ewma",
+                 "sum_t", "sum_w", "sum_tt", "sum_tw", "sum_ww", "rain_mm")
+
+    def __init__(self):
+        self.samples = deque()      # (seconds since origin, water, rain mm since previous)
+        self.origin = None
+        self.last = None
+        self.ewma = 0.0
+        self.sum_t = self.sum_w = self.sum_tt = self.sum_tw = self.sum_ww = self.rain_mm = 0.0
+
+    def add(self, now, water, rain, window, max_samples, tau):
+        if self.origin is None:
+            self.origin = self.last = now
+            self.ewma = float(water)
+        elif now - self.origin > REBASE_S:
+            self._rebase(now)
+        dt = max(now - self.last, 0.0)
+        self.last = now
+        # Time-aware EWMA: irregular gaps weigh the new reading accordingly
+        self.ewma += (1.0 - math.exp(-dt / tau)) * (water - self.ewma)
+
+        t = now - self.origin
+        mm = rain * dt / 3600.0
+        self.samples.append((t, water, mm))
+        self.sum_t += t
+        self.sum_w += water
+        self.sum_tt += t * t
+        self.sum_tw += t * water
+        self.sum_ww += water * water
+        self.rain_mm += mm
+
+        samples = self.samples
+        while len(samples) > max_samples or samples[0][0] < t - window:
+            old_t, old_w, old_mm = samples.popleft()
+            self.sum_t -= old_t
+            self.sum_w -= old_w
+            self.sum_tt -= old_t * old_t
+            self.sum_tw -= old_t * old_w
+            self.sum_ww -= old_w * old_w
+            self.rain_mm -= old_mm
+
+    def add_batch(self, times, water, rain, window, max_samples, tau):
+        """add() for readings taken at times (ascending arrays), at once.
+
+        Each reading's window is a run of the series: the window so far,
+        then the batch. Its sums are differences of prefix sums over the
+        readings this batch evicts, the rest of the window as one row
+        (the running sums less the evicted) and the batch, so the work is
+        O(batch + evicted) like add(). Returns, per reading, the arrays
+        classification needs: (ewma, rain rate, count, span, slope, slope
+        error)."""
+        if self.origin is None:
+            self.origin = self.last = float(times[0])
+            self.ewma = float(water[0])
+        elif times[0] - self.origin > REBASE_S:
+            self._rebase(float(times[0]))
+        n = len(times)
+        dt = np.empty(n)
+        dt[0] = times[0] - self.last
+        np.subtract(times[1:], times[:-1], out=dt[1:])
+        np.maximum(dt, 0.0, out=dt)
+        ewma = _ewma(self.ewma, times, water, dt, tau)
+        t = times - self.origin
+        mm = rain * dt / 3600.0
+
+        # Readings already in the window that the last of the batch evicts;
+        # no reading's window starts past them in the old part
+        samples = self.samples
+        old = len(samples)
+        horizon = t[-1] - window
+        evict = max(old + n - max_samples, 0)
+        while evict < old and samples[evict][0] < horizon:
+            evict += 1
+        evict = min(evict, old)
+        head = [samples.popleft() for _ in range(evict)]
+
+        # Rows: evicted readings, the rest of the window in one, the batch
+        rows = np.zeros((evict + 1 + n, 6))
+        rows[:evict, 0], rows[:evict, 1], rows[:evict, 5] = np.array(head).reshape(evict, 3).T
+        rows[evict + 1:, 0], rows[evict + 1:, 1], rows[evict + 1:, 5] = t, water, mm
+        rows[:, 2] = rows[:, 0] * rows[:, 0]
+        rows[:, 3] = rows[:, 0] * rows[:, 1]
+        rows[:, 4] = rows[:, 1] * rows[:, 1]
+        if samples:
+            rows[evict] = (self.sum_t, self.sum_w, self.sum_tt, self.sum_tw, self.sum_ww,
+                           self.rain_mm)
+            rows[evict] -= rows[:evict].sum(axis=0)
+            first = samples[0][0]
+        else:
+            rows[evict] = 0.0
+            first = t[0]
+        prefix = np.zeros((len(rows) + 1, 6))
+        np.cumsum(rows, axis=0, out=prefix[1:])
+
+        # Window start of each reading, as an index into the whole series
+        # (then into the rows): by time, then by max_samples
+        starts = np.concatenate((rows[:evict, 0], (first,), t))
+        at = np.searchsorted(starts, t - window)
+        start = np.where(at <= evict, at, at - evict - 1 + old)
+        end = np.arange(old + 1, old + n + 1)
+        start = np.maximum(start, end - max_samples)
+        row = np.where(start <= evict, start, start - old + evict + 1)
+
+        sums = prefix[evict + 2:] - prefix[row]
+        count = end - start
+        span = t - starts[row]
+        sum_t, sum_w, sum_tt, sum_tw, sum_ww, rain_mm = sums.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rain_rate = np.where(span > 0, rain_mm / span * 3600.0, 0.0)
+            slope, error = _fits(count, sum_t, sum_w, sum_tt, sum_tw, sum_ww)
+
+        keep = max(int(start[-1]) - old, 0)
+        samples.extend(zip(t[keep:].tolist(), water[keep:].tolist(), mm[keep:].tolist()))
+        (self.sum_t, self.sum_w, self.sum_tt, self.sum_tw, self.sum_ww,
+         self.rain_mm) = sums[-1].tolist()
+        self.last = float(times[-1])
+        self.ewma = float(ewma[-1])
+        return ewma, rain_rate, count, span, slope, error
+
+    def _rebase(self, now):
+        # Keep the time sums small so they do not lose precision over
+        # long runs; O(window) but only once per REBASE_S
+        shift = now - self.origin
+        self.origin = now
+        self.samples = deque((t - shift, w, mm) for t, w, mm in self.samples)
+        self.sum_t = sum(t for t, _, _ in self.samples)
+        self.sum_tt = sum(t * t for t, _, _ in self.samples)
+        self.sum_tw = sum(t * w for t, w, _ in self.samples)
+
+    @property
+    def count(self):
+        return len(self.samples)
+
+    @property
+    def span(self):
+        """Seconds between the oldest and newest reading in the window"""
+        return self.samples[-1][0] - self.samples[0][0] if self.samples else 0.0
+
+    @property
+    def mean(self):
+        return self.sum_w / len(self.samples) if self.samples else 0.0
+
+    @property
+    def rise(self):
+        """Least-squares water slope over the window, m/h"""
+        return self._fit()[0] * 3600.0
+
+    @property
+    def rise_error(self):
+        """Standard error of rise, m/h"""
+        return self._fit()[1] * 3600.0
+
+    def _fit(self):
+        # Slope and its standard error from the running sums (m/s)
+        n = len(self.samples)
+        if n < 3:
+            return 0.0, math.inf
+        stt = self.sum_tt - self.sum_t * self.sum_t / n
+        if stt <= 1e-9:
+            return 0.0, math.inf
+        stw = self.sum_tw - self.sum_t * self.sum_w / n
+        sww = self.sum_ww - self.sum_w * self.sum_w / n
+        slope = stw / stt
+        residual = max(sww - slope * stw, 0.0) / (n - 2)
+        return slope, math.sqrt(residual / stt)
+
+    @property
+    def rain_rate(self):
+        """Mean rainfall over the window, mm/h"""
+        span = self.span
+        return self.rain_mm / span * 3600.0 if span > 0 else 0.0
+
+
+class RiskModel:
+    """Per-sensor streaming risk classification on trends.
+
+    Each reading updates its sensor's SensorTrend and is classified on
+    the EWMA water level, the mean rainfall over the window and the rate
+    of rise, not on the reading alone: one noisy spike moves the EWMA a
+    little, while water that keeps rising is flagged before it gets high.
+    Only the part of the rise that is clear of the noise counts (the
+    slope less two standard errors).
+    A sensor needs min_samples readings before it can be CRITICAL.
+    Memory per sensor is bounded by max_samples.
+    """
+
+    def __init__(self, window=600.0, max_samples=256, tau=60.0, min_samples=3,
+                 min_span=60.0):
+        self.window = window
+        self.max_samples = max_samples
+        self.tau = tau
+        self.min_samples = min_samples
+        self.min_span = min_span        # seconds of history before the rise counts
+        self.sensors = {}
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def update(self, sensor, water, rain, now):
+        """Add one reading; returns (code into LEVELS, the sensor's SensorTrend)"""
+        trend = self.sensors.get(sensor)
+        if trend is None:
+            trend = self.sensors[sensor] = SensorTrend()
+        trend.add(now, water, rain, self.window, self.max_samples, self.tau)
+        return self.classify(trend), trend
+
+    def update_batch(self, sensor, water, rain, now):
+        """Add a batch of readings that arrived together, spread evenly over
+        the time since the sensor's previous reading; returns their codes,
+        an int8 array, as update() one by one would. The array pass sums
+        in a different order, so a reading whose level, rain or rise
+        lands exactly on a threshold can come out one level apart."""
+        trend = self.sensors.get(sensor)
+        if trend is None:
+            trend = self.sensors[sensor] = SensorTrend()
+        n = len(water)
+        last = trend.last
+        if n < STEP_BATCH:
+            return np.array([self.update(sensor, w, r, now if last is None else
+                                         last + (now - last) * (i + 1) / n)[0]
+                             for i, (w, r) in enumerate(zip(water, rain))], dtype=np.int8)
+        water = np.asarray(water, dtype=np.float64)
+        rain = np.asarray(rain, dtype=np.float64)
+        if last is None:
+            times = np.full(n, float(now))
+        else:
+            times = last + (now - last) * np.arange(1, n + 1) / n
+        ewma, rain_rate, count, span, slope, error = trend.add_batch(
+            times, water, rain, self.window, self.max_samples, self.tau)
+
+        rise = np.where(span >= self.min_span, np.maximum((slope - 2 * error) * 3600.0, 0.0), 0.0)
+        codes = classify_batch(ewma, rain_rate)
+        codes[ewma + rise * HORIZON_H >= CRITICAL_WATER] = 2
+        codes[(codes == 0) & (rise >= RISE_ALERT)] = 1
+        codes[(codes == 2) & (count < self.min_samples)] = 1
+        return codes
+
+    def classify(self, trend):
+        ewma, rain = trend.ewma, trend.rain_rate
+        rise = 0.0
+        if trend.span >= self.min_span:
+            rise = max(trend.rise - 2 * trend.rise_error, 0.0)
+        projected = ewma + max(rise, 0.0) * HORIZON_H
+        if ewma >= CRITICAL_WATER or rain >= CRITICAL_RAIN or projected >= CRITICAL_WATER:
+            return 2 if trend.count >= self.min_samples else 1
+        if ewma >= HIGH_WATER or rain >= HIGH_RAIN or rise >= RISE_ALERT:
+            return 1
+        return 0
+
+    def forget(self, sensor):
+        self.sensors.pop(sensor, None)
@@ -0,0 +1,435 @@
+"""
+Multi-process agent runtime.
+
+One event loop uses one core, however many agents it runs. The runtime
+spreads agents over worker processes, each with its own loop, and keeps
+the LocalBus semantics between them: a BridgeBus delivers to agents in
+its own process directly and forwards everything else, as one JSON line
+per Message, over a Unix socket to the worker that hosts the recipient.
+Agents are unchanged; a reply goes back the same way.
+
+Where every agent runs is declared in a topology:
+
+    {
+      "path": ["lab4"],
+      "workers": {
+        "core":    [{"agent": "lab4_fipa_acl:CoordinatorAgent",
+                     "jid": "takyisky.coordinator4@xmpp.jp", "password": "coord123"},
+                    {"agent": "lab4_fipa_acl:RescueAgent",
+                     "jid": "takyisky.rescue4@xmpp.jp", "password": "rescue123",
+                     "kwargs": {"max_in_flight": 4}}],
+        "risk-0":  [{"agent": "lab4_fipa_acl:RiskAgent", "jid": "takyisky.risk4-0@xmpp.jp"}],
+        "risk-1":  [{"agent": "lab4_fipa_acl:RiskAgent", "jid": "takyisky.risk4-1@xmpp.jp"}],
+        "sensors": [{"agent": "lab4_fipa_acl:SensorAgent", "jid": "takyisky.sensor4-0@xmpp.jp",
+                     "kwargs": {"zone": "Zone_0"},
+                     "routes": {"risk_pool": ["takyisky.risk4-0@xmpp.jp",
+                                              "takyisky.risk4-1@xmpp.jp"]}}]
+      }
+    }
+
+"path" entries (relative to the repository root) are added to sys.path
+so "module:Class" resolves; each agent is built as Class(jid, password,
+bus=..., **kwargs), with every "routes" entry passed as a FixedRing over
+the listed shard JIDs. Agents in a worker start in the order listed.
+
+The Supervisor starts one process per worker and restarts any that dies
+(at most max_restarts in restart_window seconds). Peers reconnect by
+themselves; frames for a worker that is down wait in a bounded queue,
+and a frame caught in a write that fails is lost (counted), as with any
+at-most-once transport. Each worker writes its metrics to
+<run_dir>/<worker>.prom every metrics_every seconds and at exit, which is
+how the Supervisor reports totals across processes.
+
+There is no virtual clock across processes: the runtime is for real-time
+runs only.
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+from spade.message import Message
+
+from common.metrics import REGISTRY, counter
+from common.sharding import FixedRing
+from common.transport import LocalBus, sent
+
+logger = logging.getLogger("flood.runtime")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FRAMES = counter("flood_bridge_frames_total", "Messages forwarded to another worker process",
+                 ("worker", "peer", "outcome"))
+RESTARTS = counter("flood_worker_restarts_total", "Worker processes restarted after a crash",
+                   ("worker",))
+
+RETRY_MIN = 0.05
+RETRY_MAX = 2.0
+LINE_LIMIT = 1 << 24        # longest frame (a large sensor batch is well under this)
+
+
+def load_topology(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _placement(topology):
+    """bare JID -> worker hosting it"""
+    return {spec["jid"]: worker
+            for worker, specs in topology["workers"].items() for spec in specs}
+
+
+def _socket_path(run_dir, worker):
+    return str(Path(run_dir) / f"{worker}.sock")
+
+
+def encode(msg):
+    # spade has no public accessor for the whole metadata dict
+    return (json.dumps([str(msg.to), str(msg.sender), msg.thread, msg.body, msg._metadata],
+                       separators=(",", ":")) + "\n").encode()
+
+
+def decode(line):
+    to, sender, thread, body, metadata = json.loads(line)
+    return Message(to=to, sender=sender, body=body, thread=thread, metadata=metadata)
+
+
+class _Link:
+    """Frames for one peer worker, written by a task that (re)connects as needed"""
+
+    def __init__(self, worker, peer, path, max_pending):
+        self.worker = worker
+        self.peer = peer
+        self.path = path
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, frame):
+        if len(self.pending) >= self.max_pending:
+            FRAMES.inc(self.worker, self.peer, "dropped")
+            return
+        self.pending.append(frame)
+        self.wakeup.set()
+
+    async def _run(self):
+        delay = RETRY_MIN
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                # Peer not up yet, or restarting
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, RETRY_MAX)
+                continue
+            delay = RETRY_MIN
+            logger.debug("[%s] Connected to %s", self.worker, self.peer)
+            try:
+                await self._pump(reader, writer)
+            except (ConnectionError, OSError) as e:
+                logger.warning("[%s] Lost connection to %s: %s", self.worker, self.peer, e)
+            finally:
+                writer.close()
+
+    async def _pump(self, reader, writer):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            # The peer never writes; EOF means it closed (or died) since
+            # the last write, so keep the frames for the next connection
+            if reader.at_eof() or writer.is_closing():
+                raise ConnectionResetError("peer closed the connection")
+            frames = len(self.pending)
+            try:
+                writer.write(b"".join(self.pending))
+            except RuntimeError as e:
+                # uvloop's word for a transport that closed under us
+                raise ConnectionResetError(str(e)) from e
+            self.pending.clear()
+            try:
+                await writer.drain()
+            except (ConnectionError, OSError):
+                FRAMES.inc(self.worker, self.peer, "lost", amount=frames)
+                raise
+            FRAMES.inc(self.worker, self.peer, "sent", amount=frames)
+
+    async def close(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class BridgeBus(LocalBus):
+    """A LocalBus for one worker that forwards messages for agents placed
+    in other workers over their Unix sockets"""
+
+    def __init__(self, worker, placement, run_dir, max_pending=100_000):
+        super().__init__()
+        self.worker = worker
+        self.placement = placement
+        self.run_dir = run_dir
+        self.max_pending = max_pending
+        self.links = {}
+        self.server = None
+        self.readers = {}       # peer connection task -> its writer
+
+    async def send(self, msg, behaviour):
+        to = str(msg.to.bare)
+        peer = self.placement.get(to)
+        if to in self.agents or peer is None or peer == self.worker:
+            await super().send(msg, behaviour)
+            return
+        sent(msg, behaviour.agent.name)
+        link = self.links.get(peer)
+        if link is None:
+            link = self.links[peer] = _Link(self.worker, peer,
+                                            _socket_path(self.run_dir, peer), self.max_pending)
+        link.put(encode(msg))
+
+    async def serve(self):
+        path = _socket_path(self.run_dir, self.worker)
+        if os.path.exists(path):
+            os.unlink(path)     # left behind by a crashed predecessor
+        self.server = await asyncio.start_unix_server(self._receive, path, limit=LINE_LIMIT)
+
+    async def _receive(self, reader, writer):
+        self.readers[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = decode(line)
+                agent = self.agents.get(str(msg.to.bare))
+                if agent is None or not agent.is_alive():
+                    self.undeliverable += 1
+                    logger.warning("No agent for %s in %s, dropping message", msg.to, self.worker)
+                    continue
+                self.deliver(agent, msg)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("[%s] Bad connection from a peer: %s", self.worker, e)
+        finally:
+            writer.close()
+            self.readers.pop(asyncio.current_task(), None)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Closing the transports ends each reader at its next readline()
+            tasks = list(self.readers)
+            for writer in self.readers.values():
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+        for link in self.links.values():
+            await link.close()
+
+
+def _build(spec, bus):
+    module, _, name = spec["agent"].partition(":")
+    cls = getattr(importlib.import_module(module), name)
+    kwargs = dict(spec.get("kwargs", {}))
+    for arg, jids in spec.get("routes", {}).items():
+        kwargs[arg] = FixedRing(jids)
+    return cls(spec["jid"], spec.get("password", ""), bus=bus, **kwargs)
+
+
+async def _serve(worker, topology, run_dir, metrics_every):
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    metrics_path = Path(run_dir) / f"{worker}.prom"
+
+    bus = BridgeBus(worker, _placement(topology), run_dir)
+    agents = [_build(spec, bus) for spec in topology["workers"][worker]]
+    for agent in agents:
+        await agent.start()
+    # Accept messages only once every agent here can take them
+    await bus.serve()
+    _write_metrics(metrics_path)    # also tells the supervisor this worker is up
+    logger.info("[%s] Worker %d running %d agents", worker, os.getpid(), len(agents))
+
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), metrics_every)
+        except asyncio.TimeoutError:
+            _write_metrics(metrics_path)
+
+    await bus.close()
+    for agent in reversed(agents):
+        await agent.stop()
+    _write_metrics(metrics_path)
+
+
+def _write_metrics(path):
+    # Replace atomically: the supervisor may be reading the old file
+    tmp = path.with_suffix(".tmp")
+    REGISTRY.write(tmp)
+    os.replace(tmp, path)
+
+
+def _worker_main(worker, topology, run_dir, log_level, metrics_every):
+    import spade
+    from common import logs
+
+    # Ctrl-C reaches the whole process group; the supervisor decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for entry in topology.get("path", ()):
+        sys.path.insert(0, str(ROOT / entry))
+    logs.setup(log_level)
+    spade.run(_serve(worker, topology, run_dir, metrics_every))
+    logs.shutdown()
+
+
+_SAMPLE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(text):
+    """(name, {label: value}, value) of each sample in Prometheus text"""
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            yield name, dict(_LABEL.findall(labels or "")), float(value)
+
+
+class Supervisor:
+    """Runs each worker of a topology in its own process and restarts
+    the ones that crash.
+
+    With run_dir=None sockets and metrics go to a temporary directory,
+    removed by cleanup() once the metrics have been read.
+    """
+
+    def __init__(self, topology, run_dir=None, log_level="WARNING", metrics_every=1.0,
+                 max_restarts=5, restart_window=60.0, poll_interval=0.2):
+        self.topology = topology
+        self._tmp = None
+        if run_dir is None:
+            # Keep it short: Unix socket paths are limited to ~100 bytes
+            self._tmp = tempfile.TemporaryDirectory(prefix="flood-")
+            run_dir = self._tmp.name
+        self.run_dir = str(run_dir)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.log_level = log_level
+        self.metrics_every = metrics_every
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.poll_interval = poll_interval
+        self.processes = {}
+        self.crashes = {worker: deque() for worker in topology["workers"]}
+        self.failed = set()
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self):
+        for worker in self.topology["workers"]:
+            self._spawn(worker)
+        return self
+
+    def _spawn(self, worker):
+        process = self._context.Process(
+            target=_worker_main, name=f"flood-{worker}", daemon=True,
+            args=(worker, self.topology, self.run_dir, self.log_level, self.metrics_every))
+        process.start()
+        self.processes[worker] = process
+
+    def wait_ready(self, timeout=120.0):
+        """Block until every worker has its agents running; returns the
+        seconds waited"""
+        start = time.monotonic()
+        waiting = set(self.topology["workers"])
+        while waiting:
+            waiting = {worker for worker in waiting
+                       if not (Path(self.run_dir) / f"{worker}.prom").exists()}
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"workers not up after {timeout:g}s: {sorted(waiting)}")
+            self.poll()
+            time.sleep(0.05)
+        return time.monotonic() - start
+
+    def poll(self):
+        """Restart every worker that has exited; returns the ones restarted"""
+        restarted = []
+        now = time.monotonic()
+        for worker, process in self.processes.items():
+            if process.is_alive() or worker in self.failed:
+                continue
+            crashes = self.crashes[worker]
+            crashes.append(now)
+            while crashes and now - crashes[0] > self.restart_window:
+                crashes.popleft()
+            if len(crashes) > self.max_restarts:
+                self.failed.add(worker)
+                logger.error("[Supervisor] %s crashed %d times in %gs, giving up",
+                             worker, len(crashes), self.restart_window)
+                continue
+            logger.warning("[Supervisor] %s exited with %s, restarting",
+                           worker, process.exitcode)
+            RESTARTS.inc(worker)
+            self._spawn(worker)
+            restarted.append(worker)
+        return restarted
+
+    def run(self, duration):
+        """Start, supervise for duration seconds once every worker is up,
+        then stop"""
+        self.start()
+        try:
+            ready = self.wait_ready()
+            logger.info("[Supervisor] %d workers up in %.1fs", len(self.processes), ready)
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+                self.poll()
+        except KeyboardInterrupt:
+            logger.warning("[Supervisor] Interrupted, stopping workers")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=10.0):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker, process in self.processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("[Supervisor] %s did not stop in time, killing it", worker)
+                process.kill()
+                process.join()
+
+    def cleanup(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    def metrics(self):
+        """Latest metrics text written by each worker"""
+        texts = {}
+        for worker in self.topology["workers"]:
+            try:
+                texts[worker] = (Path(self.run_dir) / f"{worker}.prom").read_text()
+            except FileNotFoundError:
+                pass
+        return texts
+
+    def total(self, name, **labels):
+        """Sum of a sample across all workers, e.g.
+        total("flood_messages_total", direction="out", performative="agree")"""
+        return sum(value for text in self.metrics().values()
+                   for sample, have, value in scrape(text)
+                   if sample == name and all(have.get(k) == v for k, v in labels.items()))
@@ -0,0 +1,155 @@
+"""
+Adaptive sampling periods for sensors.
+
+A fixed period spends as many messages on a calm zone as on one that is
+flooding, and samples the flooding one no faster. An AdaptiveSampler
+picks the period before each next reading from what the last one showed:
+
+    sampler = AdaptiveSampler(period=4, budget=budget)
+    ...
+    reading = read_sensors()
+    level, _ = trend.update(zone, reading.water, reading.rain, now)   # a RiskModel
+    behaviour.period = sampler.observe(level, (reading.water, reading.rain), now)
+
+level is 0 for a calm reading, 1 for an elevated one and 2 for a severe
+one. The labs take it from the RiskModel trend (LOW, HIGH, CRITICAL),
+not from the reading alone, so one noisy reading does not send the
+sensor to its fastest period. Each level has a target period: `floor`
+(period * 4 by default), period / 2 and `fastest` (period / 4). A
+reading whose values moved by `change` or more of their range per
+period since the last one counts as elevated whatever its level, so a
+rise is tracked before it crosses a threshold. It is measured per
+period, not per reading: at the floor a steady rise still shows, and
+sampled faster, noise between close readings does not pass for one.
+Faster targets apply at once; slower ones are approached by `backoff`
+per reading, so a zone that has just gone quiet is still watched
+closely for a while.
+
+A SampleBudget shared by a fleet caps the readings per second all its
+samplers ask for together. Each sampler keeps its wanted rate in the
+budget's running total (O(1) per reading); while the total is over the
+budget, every period is stretched by total / rate, so the fleet stays
+within it and a severe zone keeps its lead over a calm one. Each sensor
+takes up a new stretch at its next reading, so when zones turn severe
+the fleet can run over for up to a floor period (under 10% in
+benchmarks/bench_sampling.py) before the rest have slowed down.
+
+stats() compares what was sent with what the fixed period would have
+sent over the same time; savings() totals that over a fleet.
+"""
+
+from common.metrics import counter
+
+READINGS = counter("flood_sensor_readings_total", "Readings taken by adaptive samplers",
+                   ("agent", "level"))
+
+LEVELS = ("calm", "elevated", "severe")
+
+
+class SampleBudget:
+    def __init__(self, rate):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate          # readings per second, whole fleet
+        self.demand = 0.0         # readings per second the samplers want
+        self.stretched = 0        # periods lengthened to stay in budget
+
+    def scale(self):
+        """Factor every wanted period is stretched by (1 within budget)"""
+        return max(1.0, self.demand / self.rate)
+
+
+class AdaptiveSampler:
+    def __init__(self, period, fastest=None, floor=None, backoff=1.5, change=0.03,
+                 ranges=(10, 200), budget=None, agent=""):
+        self.base = period
+        self.targets = (floor or period * 4, period / 2, fastest or period / 4)
+        self.backoff = backoff
+        self.change = change
+        self.ranges = ranges
+        self.budget = budget
+        self.agent = agent
+        self.wanted = period      # before the budget
+        self.period = period      # what the behaviour runs at
+        self.last = None          # (values, time) of the last reading
+        self.started = None
+        self.now = None
+        self.readings = 0
+        self.by_level = [0, 0, 0]
+        if budget is not None:
+            budget.demand += 1 / period
+
+    def level(self, level, values, now):
+        """level, raised to elevated if values are moving by change or
+        more of their range per period"""
+        last, self.last = self.last, (values, now)
+        if level or last is None:
+            return level
+        before, then = last
+        scale = self.base / max(now - then, self.base)
+        moved = max(abs(v - w) / r for v, w, r in zip(values, before, self.ranges)) * scale
+        return 1 if moved >= self.change else 0
+
+    def observe(self, level, values, now):
+        """Record a reading taken at now (seconds) and return the period
+        until the next one"""
+        if self.started is None:
+            self.started = now
+        self.now = now
+        level = self.level(level, values, now)
+        self.readings += 1
+        self.by_level[level] += 1
+        READINGS.inc(self.agent, LEVELS[level])
+
+        target = self.targets[level]
+        wanted = target if target <= self.wanted else min(target, self.wanted * self.backoff)
+        budget = self.budget
+        if budget is not None:
+            budget.demand += 1 / wanted - 1 / self.wanted
+        self.wanted = wanted
+        self.period = wanted
+        if budget is not None and budget.demand > budget.rate:
+            self.period = wanted * budget.scale()
+            budget.stretched += 1
+        return self.period
+
+    def close(self):
+        """Leave the budget (the sensor stopped)"""
+        if self.budget is not None:
+            self.budget.demand -= 1 / self.wanted
+            self.budget = None
+
+    def fixed(self):
+        """Readings the fixed period would have taken over the same time"""
+        if self.started is None:
+            return 0
+        return int((self.now - self.started) / self.base) + 1
+
+    def stats(self):
+        fixed = self.fixed()
+        return {
+            "readings": self.readings,
+            "fixed_rate": fixed,
+            "saved": fixed - self.readings,
+            "saved_pct": round(100 * (fixed - self.readings) / fixed, 1) if fixed else 0.0,
+            **{level: n for level, n in zip(LEVELS, self.by_level)},
+            "period": round(self.period, 2),
+        }
+
+
+def savings(samplers):
+    """stats() totalled over a fleet's samplers"""
+    readings = fixed = 0
+    by_level = [0, 0, 0]
+    for sampler in samplers:
+        readings += sampler.readings
+        fixed += sampler.fixed()
+        by_level = [n + m for n, m in zip(by_level, sampler.by_level)]
+    return {
+        "sensors": len(samplers),
+        "readings": readings,
+        "fixed_rate": fixed,
+        "saved": fixed - readings,
+        "saved_pct": round(100 * (fixed - readings) / fixed, 1) if fixed else 0.0,
+        **dict(zip(LEVELS, by_level)),
+    }
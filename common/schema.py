@@ -0,0 +1,203 @@
+"""
+Typed message bodies for the flood-response ontologies.
+
+Every ontology has a record type (a namedtuple) and a fixed field order.
+On the wire a body is a compact JSON-style array of integers in that
+order, with enumerated fields (risk levels, actions, ...) sent as their
+index:
+
+    risk-assessment   RiskAssessment('CRITICAL', 'DISPATCH_RESCUE', 7, 160)
+                      -> "[3,0,7,160]"
+
+decode() also accepts the old "KEY:value;KEY:value" text bodies, so agents
+that still build bodies by f-string keep working.
+
+Ontologies whose bodies take few distinct values (risk assessments,
+rescue tasks and statuses) keep an LRU cache of decoded bodies: the
+same body decodes to the same (immutable) record, so a coordinator
+hearing "[2,1,6,90]" for the hundredth time does not parse it again.
+Sensor readings are not cached; they rarely repeat exactly.
+
+A batch of records of one ontology is the records' arrays concatenated
+into one flat array (see encode_batch/decode_batch), sent under the
+matching *-batch ontology.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+# ─── Enumerations (order is part of the wire format) ──────────
+SEVERITIES = ("LOW", "MEDIUM", "HIGH")
+RISKS      = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+ACTIONS    = ("DISPATCH_RESCUE", "ALERT_TEAMS", "CONTINUE_MONITORING")
+STATUSES   = ("COMPLETE", "FAILED", "TIMEOUT")
+
+# ─── Record types ─────────────────────────────────────────────
+SensorReading  = namedtuple("SensorReading",  "water rain wind")
+DisasterEvent  = namedtuple("DisasterEvent",  "severity water rain wind")
+RiskAssessment = namedtuple("RiskAssessment", "risk action water rain")
+RescueTask     = namedtuple("RescueTask",     "action risk water")
+RescueStatus   = namedtuple("RescueStatus",   "status action risk")
+
+
+class MessageError(ValueError):
+    """A message body that does not match its ontology's schema"""
+
+
+class Schema:
+    """Encoder/decoder for one ontology.
+
+    fields is a list of (legacy_key, kind, default) where kind is int or a
+    tuple of allowed strings. default is used when an old text body leaves
+    the key out. cache > 0 keeps that many decoded bodies.
+    """
+
+    def __init__(self, ontology, record, fields, cache=0):
+        self.ontology = ontology
+        self.record = record
+        self.keys = [key for key, _, _ in fields]
+        self.kinds = [kind for _, kind, _ in fields]
+        self.defaults = [default for _, _, default in fields]
+        # Precomputed per-schema so encode/decode only loop over what they must
+        self._fmt = "[" + ",".join("{}" for _ in fields) + "]"
+        self._ints = [i for i, kind in enumerate(self.kinds) if kind is int]
+        self._enums = [(i, kind, {v: code for code, v in enumerate(kind)})
+                       for i, kind in enumerate(self.kinds) if kind is not int]
+        if cache:
+            # Errors are raised, not cached, so a bad body is rejected every time
+            self.decode = lru_cache(maxsize=cache)(self.decode)
+
+    def encode(self, rec):
+        values = list(rec)
+        for i, kind, codes in self._enums:
+            try:
+                values[i] = codes[values[i]]
+            except KeyError:
+                raise MessageError(f"{self.ontology}: {values[i]!r} not in {kind}") from None
+        for i in self._ints:
+            if type(values[i]) is not int or values[i] < 0:
+                raise MessageError(f"{self.ontology}: expected int >= 0 for "
+                                   f"{self.keys[i]}, got {values[i]!r}")
+        return self._fmt.format(*values)
+
+    def encode_batch(self, recs):
+        if not recs:
+            raise MessageError(f"{self.ontology}: empty batch")
+        return "[" + ",".join(self.encode(rec)[1:-1] for rec in recs) + "]"
+
+    def decode_batch(self, body):
+        if not body or body[0] != "[":
+            raise MessageError(f"{self.ontology}: batch body must be compact form")
+        values = self._decode_values(body)
+        n = len(self.kinds)
+        if len(values) % n:
+            raise MessageError(f"{self.ontology}: batch length {len(values)} "
+                               f"is not a multiple of {n}")
+        return [self._make(values[i:i + n]) for i in range(0, len(values), n)]
+
+    def encode_text(self, rec):
+        """The old KEY:value;KEY:value form, for receivers not yet upgraded"""
+        return ";".join(f"{key}:{value}" for key, value in zip(self.keys, rec))
+
+    def decode(self, body):
+        if not body:
+            raise MessageError(f"{self.ontology}: empty body")
+        if body[0] == "[":
+            return self._decode_compact(body)
+        return self._decode_text(body)
+
+    def _decode_compact(self, body):
+        values = self._decode_values(body)
+        if len(values) != len(self.kinds):
+            raise MessageError(f"{self.ontology}: expected {len(self.kinds)} fields, "
+                               f"got {len(values)}")
+        return self._make(values)
+
+    def _decode_values(self, body):
+        try:
+            if body[-1] != "]":
+                raise ValueError
+            values = [int(v) for v in body[1:-1].split(",")]
+        except ValueError:
+            raise MessageError(f"{self.ontology}: malformed body {body!r}") from None
+        if min(values) < 0:
+            raise MessageError(f"{self.ontology}: negative field in {body!r}")
+        return values
+
+    def _make(self, values):
+        for i, kind, _ in self._enums:
+            try:
+                values[i] = kind[values[i]]
+            except IndexError:
+                raise MessageError(f"{self.ontology}: bad code "
+                                   f"{self.keys[i]}={values[i]}") from None
+        return self.record._make(values)
+
+    def _decode_text(self, body):
+        parts = dict(p.split(":", 1) for p in body.split(";") if ":" in p)
+        values = []
+        for key, kind, default in zip(self.keys, self.kinds, self.defaults):
+            value = parts.get(key, default)
+            if kind is int:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise MessageError(f"{self.ontology}: bad field {key}={value!r}") from None
+            elif value not in kind:
+                raise MessageError(f"{self.ontology}: {key}={value!r} not in {kind}")
+            values.append(value)
+        return self.record._make(values)
+
+
+SENSOR_READING = Schema("sensor-reading", SensorReading, [
+    ("WATER", int, 0),
+    ("RAIN",  int, 0),
+    ("WIND",  int, 0),
+])
+
+DISASTER_EVENT = Schema("disaster-event", DisasterEvent, [
+    ("SEVERITY", SEVERITIES, "LOW"),
+    ("WATER",    int, 0),
+    ("RAIN",     int, 0),
+    ("WIND",     int, 0),
+])
+
+RISK_ASSESSMENT = Schema("risk-assessment", RiskAssessment, [
+    ("RISK",   RISKS,   "LOW"),
+    ("ACTION", ACTIONS, "CONTINUE_MONITORING"),
+    ("WATER",  int, 0),
+    ("RAIN",   int, 0),
+], cache=4096)
+
+RESCUE_TASK = Schema("rescue-task", RescueTask, [
+    ("ACTION", ACTIONS, "CONTINUE_MONITORING"),
+    ("RISK",   RISKS,   "LOW"),
+    ("WATER",  int, 0),
+], cache=256)
+
+RESCUE_STATUS = Schema("rescue-status", RescueStatus, [
+    ("STATUS", STATUSES, "COMPLETE"),
+    ("ACTION", ACTIONS,  "CONTINUE_MONITORING"),
+    ("RISK",   RISKS,    "LOW"),
+], cache=64)
+
+SCHEMAS = {s.ontology: s for s in (SENSOR_READING, DISASTER_EVENT, RISK_ASSESSMENT,
+                                   RESCUE_TASK, RESCUE_STATUS)}
+
+# Batched ontologies and the schema of the records they carry
+SENSOR_BATCH   = "sensor-batch"
+DISASTER_BATCH = "disaster-batch"
+BATCH_SCHEMAS = {SENSOR_BATCH: SENSOR_READING, DISASTER_BATCH: DISASTER_EVENT}
+
+
+def decode(msg):
+    """Decode a spade Message body using the schema named by its ontology.
+    Batched ontologies decode to a list of records."""
+    ontology = msg.get_metadata("ontology")
+    if ontology in BATCH_SCHEMAS:
+        return BATCH_SCHEMAS[ontology].decode_batch(msg.body)
+    try:
+        schema = SCHEMAS[ontology]
+    except KeyError:
+        raise MessageError(f"no schema for ontology {ontology!r}") from None
+    return schema.decode(msg.body)
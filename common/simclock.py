@@ -0,0 +1,105 @@
+"""
+Virtual-clock event loop for headless simulation runs.
+
+A VirtualClockLoop is an ordinary asyncio event loop whose time() is a
+counter rather than the system clock. Whenever nothing is ready to run,
+the loop jumps the counter straight to the next scheduled timer instead
+of waiting for it, so asyncio.sleep(), wait_for() timeouts (and so
+Behaviour.receive(timeout=...)), PeriodicBehaviour periods and simulated
+work all cost no real time. A day of agent interaction runs in seconds.
+
+    simclock.run(main(local=True, duration=24 * 3600), seed=7)
+
+Agents must talk over a LocalBus: real sockets would keep real time.
+Code that wants the current time of day should call simclock.now(),
+which is the virtual datetime inside a simulation and datetime.now()
+outside one.
+"""
+
+import asyncio
+import random
+import selectors
+from contextlib import suppress
+from datetime import datetime, timedelta
+
+import numpy as np
+import spade.behaviour
+from spade.container import Container
+
+
+class _SkippingSelector(selectors.DefaultSelector):
+    """Polls without blocking; if nothing is ready, advances the loop's
+    clock by the time the loop wanted to wait instead."""
+
+    loop = None
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # Nothing scheduled: only another thread can wake us
+            return super().select(None)
+        events = super().select(0)
+        if not events and timeout > 0:
+            self.loop._now += timeout
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    def __init__(self, start=None):
+        self._now = 0.0
+        self.epoch = start or datetime.now()
+        selector = _SkippingSelector()
+        super().__init__(selector)
+        selector.loop = self
+
+    def time(self):
+        return self._now
+
+    def wall(self):
+        """Virtual time of day"""
+        return self.epoch + timedelta(seconds=self._now)
+
+
+def now():
+    """Current datetime: virtual inside a simulation, wall clock otherwise"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return datetime.now()
+    if isinstance(loop, VirtualClockLoop):
+        return loop.wall()
+    return datetime.now()
+
+
+def seed_all(seed):
+    """Seed the global random generators the agents draw from"""
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def run(main, seed=None, start=None):
+    """spade.run() on a VirtualClockLoop.
+
+    seed makes the run reproducible; start is the datetime the virtual
+    clock starts at (default: now).
+    """
+    if seed is not None:
+        seed_all(seed)
+
+    loop = VirtualClockLoop(start)
+    container = Container()
+    previous, container.loop = container.loop, loop
+    asyncio.set_event_loop(loop)
+    spade.behaviour.now = now          # PeriodicBehaviour schedules with this
+    try:
+        loop.run_until_complete(main)
+        container.stop_agents()
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                loop.run_until_complete(task)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    finally:
+        loop.close()
+        spade.behaviour.now = datetime.now
+        container.loop = previous
+        asyncio.set_event_loop(previous)
@@ -0,0 +1,148 @@
+"""
+Zone geometry and a spatial index over 2-D points (km).
+
+Zones are square grid cells: Zone_<i> sits in row i // columns, column
+i % columns, and its position is the cell's centre.
+
+GridIndex buckets points into square cells and stores them sorted by
+cell, with each cell's start offset (a CSR layout), so
+
+    nearest(point, k)      the k nearest points, closest first
+    within(point, radius)  every point within radius, closest first
+
+only look at the cells around the query point. At the default density
+(about per_cell points per cell) both take tens of microseconds over
+100k points. A mask restricts either query to some of the points, e.g.
+rescue teams that are free.
+"""
+
+import hashlib
+import math
+import re
+
+import numpy as np
+
+# Layout of Zone_<i> names when no map says otherwise
+ZONE_COLUMNS = 10
+CELL_KM = 2.0
+
+_ZONE_INDEX = re.compile(r"(\d+)$")
+
+
+def grid_cell(i, columns=ZONE_COLUMNS):
+    """(row, column) of the i-th zone"""
+    return divmod(i, columns)
+
+
+def cell_centre(row, column, cell_km=CELL_KM):
+    return (column + 0.5) * cell_km, (row + 0.5) * cell_km
+
+
+def zone_position(name, columns=ZONE_COLUMNS, cell_km=CELL_KM):
+    """Centre of a Zone_<i>'s cell; names without an index get a stable
+    hashed position inside the first columns x columns cells"""
+    match = _ZONE_INDEX.search(name)
+    if match:
+        return cell_centre(*grid_cell(int(match.group(1)), columns), cell_km)
+    digest = hashlib.blake2b(name.encode(), digest_size=4).digest()
+    size = columns * cell_km
+    return (digest[0] * 256 + digest[1]) / 65535 * size, \
+           (digest[2] * 256 + digest[3]) / 65535 * size
+
+
+class GridIndex:
+    def __init__(self, points, cell_size=None, per_cell=4):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        n = len(self.points)
+        lo = self.points.min(axis=0) if n else np.zeros(2)
+        hi = self.points.max(axis=0) if n else np.zeros(2)
+        if cell_size is None:
+            span = max(float((hi - lo).max()), 1e-9)
+            cell_size = span / max(1.0, math.sqrt(n / per_cell))
+        self.cell = float(cell_size)
+        self.origin = lo
+        self.nx, self.ny = ((hi - lo) // self.cell).astype(np.int64) + 1
+
+        cx, cy = self._cell_of(self.points)
+        flat = cy * self.nx + cx
+        self.order = np.argsort(flat, kind="stable")          # sorted slot -> point index
+        self.sorted = self.points[self.order]
+        self.starts = np.searchsorted(flat[self.order], np.arange(self.nx * self.ny + 1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_of(self, points):
+        cells = ((points - self.origin) // self.cell).astype(np.int64)
+        return cells[..., 0], cells[..., 1]
+
+    def _block(self, x0, x1, y0, y1):
+        """Sorted slots of the points in cells x0..x1, y0..y1 (clipped)"""
+        x0, x1 = max(x0, 0), min(x1, self.nx - 1)
+        y0, y1 = max(y0, 0), min(y1, self.ny - 1)
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.int64)
+        # Within one row of cells the points are contiguous: one range per row
+        rows = np.arange(y0, y1 + 1) * self.nx
+        lo = self.starts[rows + x0]
+        lengths = self.starts[rows + x1 + 1] - lo
+        total = int(lengths.sum())
+        offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total)
+
+    def _candidates(self, slots, point, mask):
+        idx = self.order[slots]
+        if mask is not None:
+            keep = mask[idx]
+            idx, slots = idx[keep], slots[keep]
+        d = self.sorted[slots] - point
+        return idx, np.hypot(d[:, 0], d[:, 1])
+
+    def within(self, point, radius, mask=None):
+        """(indices, distances) of the points within radius, closest first"""
+        point = np.asarray(point, dtype=np.float64)
+        (x0, x1), (y0, y1) = self._span(point, radius)
+        idx, dist = self._candidates(self._block(x0, x1, y0, y1), point, mask)
+        keep = dist <= radius
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
+
+    def nearest(self, point, k=1, mask=None):
+        """(indices, distances) of the k nearest points, closest first"""
+        point = np.asarray(point, dtype=np.float64)
+        available = len(self.points) if mask is None else int(np.count_nonzero(mask))
+        k = min(k, available)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Grow a square of cells around the point until it holds k points
+        # and no point outside it can be closer than the k-th found
+        reach = 0.0
+        while True:
+            (x0, x1), (y0, y1) = self._span(point, reach)
+            idx, dist = self._candidates(self._block(x0, x1, y0, y1), point, mask)
+            whole = x0 <= 0 and y0 <= 0 and x1 >= self.nx - 1 and y1 >= self.ny - 1
+            if len(idx) >= k:
+                part = np.argpartition(dist, k - 1)[:k]
+                kth = float(dist[part].max())
+                # Everything within `covered` of the point is inside the square
+                covered = min(point[0] - (self.origin[0] + x0 * self.cell),
+                              self.origin[0] + (x1 + 1) * self.cell - point[0],
+                              point[1] - (self.origin[1] + y0 * self.cell),
+                              self.origin[1] + (y1 + 1) * self.cell - point[1])
+                if whole or kth <= covered:
+                    order = part[np.argsort(dist[part], kind="stable")]
+                    return idx[order], dist[order]
+                reach = kth
+            elif whole:
+                order = np.argsort(dist, kind="stable")
+                return idx[order], dist[order]
+            else:
+                reach = max(2 * reach, self.cell)
+
+    def _span(self, point, radius):
+        """Cell ranges (x0, x1), (y0, y1) of the square point ± radius"""
+        lo = ((point - radius - self.origin) // self.cell).astype(np.int64)
+        hi = ((point + radius - self.origin) // self.cell).astype(np.int64)
+        return (int(lo[0]), int(hi[0])), (int(lo[1]), int(hi[1]))
@@ -0,0 +1,10 @@
+"""Small statistics helpers shared by the agents and benchmarks."""
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles of samples; {} when there are none"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {p: ordered[min(last, int(round(p / 100 * last)))] for p in points}
@@ -0,0 +1,256 @@
+"""
+Live status endpoint inside an agent process.
+
+    status = StatusServer(port=8765)
+    status.add_zones(env)                               # names, damage, fire arrays
+    status.add("coordinator", coordinator.status)       # any small JSON-able view
+    await status.start()
+    ...
+    await status.stop()
+
+    GET /status   the current state as one JSON document
+    GET /ws       WebSocket: the current state, then only what changes
+
+The server runs on the agents' own event loop (aiohttp, which spade
+already depends on), so views read agent state directly, with no locks.
+
+Every `interval` seconds a publisher task compares the zones with what
+clients were last sent, at display precision (damage to `resolution`,
+fire), in one NumPy pass, and builds a delta of the zones that changed,
+plus each section whose value changed. A delta is serialised once for
+every client. So the Python work per refresh grows with the zones that
+changed, not with the map: on a 100k-zone map a refresh takes under
+half a millisecond when nothing moved and about one when 1% of zones
+did, where serialising every zone takes 200 ms.
+
+Frames on /ws are JSON objects:
+
+    {"type": "snapshot", "seq": 7, "part": 0, "parts": 50,
+     "sections": {...}, "zones": {"Zone_0": [4.3, false], ...}}
+    {"type": "delta",    "seq": 8, "part": 0, "parts": 1,
+     "sections": {"coordinator": {...}}, "zones": {"Zone_12": [7.1, true]}}
+
+Zones go out in parts of at most `chunk`, and the server yields to the
+loop between parts, so a client joining a large map, or a tick that
+moves every zone, does not hold the agents up while it is serialised.
+Sections only come with part 0. A snapshot includes every delta up to
+its seq, so a client skips delta parts numbered at or below it that are
+still arriving. A client that falls `backlog` frames behind is sent a
+fresh snapshot instead of the frames it missed.
+
+GET /status writes the same state, {"seq": 7, "sections": {...},
+"zones": {...}}, as one document, also a part at a time.
+"""
+
+import asyncio
+import json
+import logging
+import math
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+from common.metrics import counter
+
+logger = logging.getLogger("flood.status")
+
+_NONE = np.empty(0, dtype=np.int64)
+_COMPACT = (",", ":")
+_FIRE = (",false]", ",true]")
+
+FRAMES = counter("flood_status_frames_total", "Frames sent to status clients", ("type",))
+RESYNCS = counter("flood_status_resyncs_total", "Status clients too far behind, sent a snapshot")
+
+
+class _Client:
+    __slots__ = ("ws", "frames", "stale")
+
+    def __init__(self, ws, backlog):
+        self.ws = ws
+        self.frames = asyncio.Queue(backlog)
+        self.stale = False
+
+
+class StatusServer:
+    def __init__(self, host="127.0.0.1", port=8765, interval=1.0, resolution=0.1, chunk=2000,
+                 backlog=64):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.resolution = resolution
+        self.digits = max(0, -math.floor(math.log10(resolution)))
+        self.chunk = chunk
+        self.backlog = backlog
+        self.env = None
+        self._damage = self._fire = None     # zones as last published
+        self.views = {}
+        self.sections = {}          # name -> value last published
+        self.seq = 0
+        self.clients = set()
+        self.runner = None
+        self.publisher = None
+
+    def add_zones(self, env):
+        """Publish env's zones: anything with names, damage and fire arrays"""
+        self.env = env
+        self._damage = self._level(env.damage)
+        self._fire = env.fire.copy()
+        self._keys = [json.dumps(name) + ":[" for name in env.names]
+
+    def add(self, name, view):
+        """Publish view(), a JSON-able value, as section `name`"""
+        self.views[name] = view
+        self.sections[name] = view()
+
+    def _level(self, damage):
+        return np.rint(damage / self.resolution).astype(np.int64)
+
+    # ── publishing ──────────────────────────────────────────────
+    def _zone_parts(self, idx, damage, fire):
+        """JSON text, '"Zone_3":[4.3,false],...', of at most chunk of the
+        zones at idx at a time"""
+        # Written out as text, not built as a dict of lists for json: a
+        # third of the cost, and no containers to wake the cyclic GC
+        for start in range(0, len(idx), self.chunk):
+            part = idx[start:start + self.chunk]
+            keys = self._keys
+            values = np.round(damage[part] * self.resolution, self.digits).tolist()
+            yield ",".join(map("".join, zip([keys[i] for i in part.tolist()], map(repr, values),
+                                            [_FIRE[f] for f in fire[part].tolist()])))
+
+    def _changes(self):
+        """Zone indexes and sections that changed since the last publish;
+        the published state is updated to match"""
+        changed = _NONE
+        if self.env is not None:
+            level = self._level(self.env.damage)
+            fire = self.env.fire
+            changed = np.flatnonzero((level != self._damage) | (fire != self._fire))
+            self._damage[changed] = level[changed]
+            self._fire[changed] = fire[changed]
+        sections = {}
+        for name, view in self.views.items():
+            value = view()
+            if value != self.sections[name]:
+                sections[name] = self.sections[name] = value
+        return changed, sections
+
+    async def _frames(self, kind, seq, count, parts, sections):
+        """Serialised frames of count zones, coming a part at a time from
+        parts, and the sections"""
+        n = max(1, -(-count // self.chunk))
+        for part in range(n):
+            frame = {"type": kind, "seq": seq, "part": part, "parts": n}
+            if part == 0:
+                frame["sections"] = sections
+            head = json.dumps(frame, separators=_COMPACT)
+            yield f'{head[:-1]},"zones":{{{next(parts, "")}}}}}'
+            FRAMES.inc(kind)
+            if part + 1 < n:
+                await asyncio.sleep(0)
+
+    async def _publish(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                changed, sections = self._changes()
+                if not self.clients or (not len(changed) and not sections):
+                    continue
+                self.seq += 1
+                # No publish runs until this one is out, so the parts can
+                # read the published arrays as they go
+                parts = self._zone_parts(changed, self._damage, self._fire)
+                frames = self._frames("delta", self.seq, len(changed), parts, sections)
+                async for frame in frames:
+                    for client in list(self.clients):
+                        if client.stale:
+                            continue
+                        try:
+                            client.frames.put_nowait(frame)
+                        except asyncio.QueueFull:
+                            client.stale = True
+            except Exception:
+                logger.exception("[Status] Publishing failed")
+
+    def _published(self):
+        """seq, sections, zone count and zone parts of the published state
+        as of this call; the parts go out across later publishes, so they
+        read copies"""
+        if self.env is None:
+            return self.seq, dict(self.sections), 0, iter(())
+        idx = np.arange(len(self.env.names))
+        parts = self._zone_parts(idx, self._damage.copy(), self._fire.copy())
+        return self.seq, dict(self.sections), len(idx), parts
+
+    def _snapshot(self):
+        seq, sections, count, parts = self._published()
+        return self._frames("snapshot", seq, count, parts, sections)
+
+    # ── HTTP ────────────────────────────────────────────────────
+    async def _status(self, request):
+        """The published state as one JSON object, written a part at a time"""
+        seq, sections, _, parts = self._published()
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        head = json.dumps({"seq": seq, "sections": sections}, separators=_COMPACT)
+        await response.write(head[:-1].encode() + b',"zones":{')
+        comma = b""
+        for part in parts:
+            await response.write(comma + part.encode())
+            comma = b","
+        await response.write(b"}}")
+        await response.write_eof()
+        return response
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse(heartbeat=30, compress=False)
+        await ws.prepare(request)
+        client = _Client(ws, self.backlog)
+        writer = asyncio.ensure_future(self._feed(client))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            writer.cancel()
+            self.clients.discard(client)
+        return ws
+
+    async def _feed(self, client):
+        try:
+            while True:
+                # Register and snapshot with no await in between, so every
+                # delta published after the snapshot is queued for it
+                while not client.frames.empty():
+                    client.frames.get_nowait()
+                client.stale = False
+                self.clients.add(client)
+                async for frame in self._snapshot():
+                    await client.ws.send_str(frame)
+                while not client.stale:
+                    await client.ws.send_str(await client.frames.get())
+                RESYNCS.inc()
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/status", self._status)
+        app.router.add_get("/ws", self._ws)
+        self.runner = web.AppRunner(app, handle_signals=False, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        self.publisher = asyncio.ensure_future(self._publish())
+        logger.info("[Status] Serving on http://%s:%d/status and ws://%s:%d/ws",
+                    self.host, self.port, self.host, self.port)
+        return self
+
+    async def stop(self):
+        if self.publisher is not None:
+            self.publisher.cancel()
+        for client in list(self.clients):
+            await client.ws.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,286 @@
+"""
+Persistent event and incident store on SQLite.
+
+Agents write through a queue: record_event(), open_incident(), assign()
+and close_incident() only put a row on an in-memory queue and return, so
+a behaviour never waits on the disk. A writer thread drains whatever has
+queued up (up to batch_size rows) and commits it as one transaction, so
+under load many rows share each fsync. Like the log queue, writes beyond
+max_pending are dropped and counted (flood_store_dropped_total) rather
+than stalling the loop. Nothing is committed until start(); rows queued
+before it wait for the writer, and flush() without one raises rather
+than waiting forever.
+
+The database runs in WAL mode, so readers never block the writer. Queries
+take a connection from a small pool and run in the default executor:
+
+    rows = await store.open_incidents(zone="Zone_3", risk="CRITICAL", within=600)
+
+Events are indexed by zone, risk and time. Incidents are indexed by
+time, plus partial indexes on open incidents by (zone, risk, opened) and
+(risk, opened), which answer the query above, or the same across all
+zones, without touching closed rows. Times are epoch seconds of the (virtual)
+wall clock.
+
+Under a simclock virtual-time loop queries run inline instead: a thread
+would let the loop skip virtual time while the query ran.
+
+The XMPP server keeps its own tables in server.db; the agents' store is
+a separate file (pass its path with --store).
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from common import simclock
+from common.metrics import counter, histogram
+
+logger = logging.getLogger("flood.store")
+
+WRITES = counter("flood_store_writes_total", "Rows queued for the store", ("table",))
+DROPPED = counter("flood_store_dropped_total", "Store writes dropped because the queue was full")
+ERRORS = counter("flood_store_errors_total", "Store transactions that failed")
+BATCH = histogram("flood_store_batch_size", "Rows committed per transaction",
+                  buckets=(1, 10, 50, 100, 500, 1000, 5000))
+COMMIT = histogram("flood_store_commit_seconds", "Time to write and commit one batch")
+QUERY = histogram("flood_store_query_seconds", "Time to run one store query", ("query",))
+
+Event = namedtuple("Event", "id time zone risk water rain wind source thread")
+StoredIncident = namedtuple(
+    "StoredIncident", "id zone risk action water rain thread opened team assigned closed status")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY,
+    time    REAL NOT NULL,
+    zone    TEXT,
+    risk    TEXT NOT NULL,
+    water   INTEGER,
+    rain    INTEGER,
+    wind    INTEGER,
+    source  TEXT,
+    thread  TEXT
+);
+CREATE INDEX IF NOT EXISTS events_zone_time ON events (zone, time);
+CREATE INDEX IF NOT EXISTS events_risk_time ON events (risk, time);
+CREATE INDEX IF NOT EXISTS events_time      ON events (time);
+
+CREATE TABLE IF NOT EXISTS incidents (
+    id       INTEGER PRIMARY KEY,
+    zone     TEXT,
+    risk     TEXT NOT NULL,
+    action   TEXT,
+    water    INTEGER,
+    rain     INTEGER,
+    thread   TEXT,
+    opened   REAL NOT NULL,
+    team     TEXT,
+    assigned REAL,
+    closed   REAL,
+    status   TEXT
+);
+CREATE INDEX IF NOT EXISTS incidents_open      ON incidents (zone, risk, opened)
+    WHERE closed IS NULL;
+CREATE INDEX IF NOT EXISTS incidents_open_risk ON incidents (risk, opened)
+    WHERE closed IS NULL;
+CREATE INDEX IF NOT EXISTS incidents_opened    ON incidents (opened);
+"""
+
+INSERT_EVENT = ("INSERT INTO events (time, zone, risk, water, rain, wind, source, thread) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+INSERT_INCIDENT = ("INSERT OR REPLACE INTO incidents "
+                   "(id, zone, risk, action, water, rain, thread, opened) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+ASSIGN = "UPDATE incidents SET team = ?, assigned = ? WHERE id = ?"
+CLOSE = "UPDATE incidents SET status = ?, closed = ? WHERE id = ?"
+
+_STOP = object()
+
+
+def _timestamp(when):
+    return simclock.now().timestamp() if when is None else when
+
+
+class IncidentStore:
+    def __init__(self, path, batch_size=1000, max_pending=100_000, readers=4):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = queue.SimpleQueue()
+        self._writer = None
+
+        # Create the schema up front so the first query cannot race it
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._readers.put(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints: a power cut can lose
+        # the last commits but never corrupts the database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    # ── lifecycle ───────────────────────────────────────────────
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="flood-store",
+                                            daemon=True)
+            self._writer.start()
+        return self
+
+    async def close(self):
+        """Commit everything queued, then stop the writer and close connections"""
+        if self._writer is not None:
+            self._pending.put(_STOP)
+            await self._blocking(self._writer.join)
+            self._writer = None
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+    # ── writes (never block) ────────────────────────────────────
+    def _put(self, table, sql, params):
+        if self._pending.qsize() >= self.max_pending:
+            DROPPED.inc()
+            return
+        WRITES.inc(table)
+        self._pending.put((sql, params))
+
+    def record_event(self, risk, zone=None, water=None, rain=None, wind=None, source=None,
+                     thread=None, when=None):
+        self._put("events", INSERT_EVENT,
+                  (_timestamp(when), zone, risk, water, rain, wind, source, thread))
+
+    def open_incident(self, id, risk, zone=None, action=None, water=None, rain=None,
+                      thread=None, when=None):
+        self._put("incidents", INSERT_INCIDENT,
+                  (id, zone, risk, action, water, rain, thread, _timestamp(when)))
+
+    def assign(self, id, team, when=None):
+        self._put("incidents", ASSIGN, (team, _timestamp(when), id))
+
+    def close_incident(self, id, status, when=None):
+        self._put("incidents", CLOSE, (status, _timestamp(when), id))
+
+    async def flush(self):
+        """Wait until everything queued so far is committed"""
+        if self._writer is None:
+            raise RuntimeError("IncidentStore.flush() before start(): nothing would commit")
+        done = threading.Event()
+        self._pending.put(done)
+        await self._blocking(done.wait)
+
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            batch = [self._pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            rows, barriers = [], []
+            for op in batch:
+                if op is _STOP:
+                    stop = True
+                elif isinstance(op, threading.Event):
+                    barriers.append(op)
+                else:
+                    rows.append(op)
+            if rows:
+                self._commit(conn, rows)
+            for barrier in barriers:
+                barrier.set()
+        conn.close()
+
+    def _commit(self, conn, rows):
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN")
+            # Consecutive rows for the same statement go in one executemany;
+            # order between statements is kept (an incident opens before it closes)
+            i = 0
+            while i < len(rows):
+                sql = rows[i][0]
+                j = i
+                while j < len(rows) and rows[j][0] == sql:
+                    j += 1
+                conn.executemany(sql, [params for _, params in rows[i:j]])
+                i = j
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            ERRORS.inc()
+            logger.error("[Store] Lost a batch of %d writes: %s", len(rows), e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return
+        BATCH.observe(len(rows))
+        COMMIT.observe(time.perf_counter() - start)
+
+    # ── queries ─────────────────────────────────────────────────
+    async def _blocking(self, fn, *args):
+        if isinstance(asyncio.get_running_loop(), simclock.VirtualClockLoop):
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _run(self, name, sql, params):
+        conn = self._readers.get()
+        try:
+            with QUERY.time(name):
+                return conn.execute(sql, params).fetchall()
+        finally:
+            self._readers.put(conn)
+
+    async def query(self, sql, params=(), name="query"):
+        """Rows for a read-only SQL statement, on a pooled connection"""
+        return await self._blocking(self._run, name, sql, params)
+
+    async def open_incidents(self, zone=None, risk=None, within=None, limit=None):
+        """Incidents not yet closed, newest first; within is seconds back from now"""
+        where, params = _filters(zone, risk, within, "opened")
+        sql = ("SELECT * FROM incidents WHERE closed IS NULL"
+               + "".join(f" AND {w}" for w in where) + " ORDER BY opened DESC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [StoredIncident(*row)
+                for row in await self.query(sql, params, name="open_incidents")]
+
+    async def events(self, zone=None, risk=None, within=None, limit=None):
+        """Recorded events, newest first"""
+        where, params = _filters(zone, risk, within, "time")
+        sql = ("SELECT * FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+               + " ORDER BY time DESC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [Event(*row) for row in await self.query(sql, params, name="events")]
+
+    async def last_incident_id(self):
+        rows = await self.query("SELECT MAX(id) FROM incidents", name="last_incident_id")
+        return rows[0][0] or 0
+
+
+def _filters(zone, risk, within, time_column):
+    where, params = [], []
+    if zone is not None:
+        where.append("zone = ?")
+        params.append(zone)
+    if risk is not None:
+        where.append("risk = ?")
+        params.append(risk)
+    if within is not None:
+        where.append(f"{time_column} >= ?")
+        params.append(simclock.now().timestamp() - within)
+    return where, params
@@ -0,0 +1,73 @@
+"""
+Bounded pool for long-running agent work.
+
+A behaviour that must do something slow (a rescue operation, a remote
+call) submits it to a TaskPool and goes straight back to its mailbox.
+At most max_in_flight jobs run at once; the rest wait in a priority queue
+(lowest priority value first, FIFO within a priority). Each job gets an
+optional timeout and on_done(status, context) is awaited when it ends,
+with status "COMPLETE", "TIMEOUT" or "FAILED".
+"""
+
+import asyncio
+import itertools
+import logging
+
+logger = logging.getLogger("flood.taskpool")
+
+
+class TaskPool:
+    def __init__(self, max_in_flight=4, timeout=None, on_done=None):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.on_done = on_done
+        self.in_flight = 0
+        self.counts = {"COMPLETE": 0, "TIMEOUT": 0, "FAILED": 0}
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._workers = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker())
+                             for _ in range(self.max_in_flight)]
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, make_job, priority=0, context=None):
+        """Queue make_job() (a coroutine function) to run on a free worker"""
+        self._queue.put_nowait((priority, next(self._seq), make_job, context))
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "pending": self.pending, **self.counts}
+
+    async def _worker(self):
+        while True:
+            _, _, make_job, context = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await asyncio.wait_for(make_job(), self.timeout)
+                status = "COMPLETE"
+            except asyncio.TimeoutError:
+                status = "TIMEOUT"
+            except Exception:
+                logger.exception("Job %r failed", context)
+                status = "FAILED"
+            finally:
+                self.in_flight -= 1
+            self.counts[status] += 1
+            if self.on_done is not None:
+                try:
+                    await self.on_done(status, context)
+                except Exception:
+                    logger.exception("on_done for %r failed", context)
@@ -0,0 +1,154 @@
+"""
+In-process message transport for SPADE agents.
+
+When every agent in a pipeline lives in the same process there is no need
+to go through an XMPP server. A LocalBus stands in for the agent's
+container: Behaviour.send() hands it the Message and the bus drops it
+straight into the mailbox (asyncio.Queue) of each matching behaviour of
+the recipient. Behaviour.receive(timeout=...) is untouched, so agents
+behave exactly as they do over XMPP.
+
+    bus = LocalBus()
+    risk   = RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus)
+    sensor = SensorAgent("takyisky.sensor4@xmpp.jp", "sensor123", bus=bus)
+"""
+
+import logging
+
+from spade.agent import Agent
+
+from common.metrics import counter
+
+logger = logging.getLogger("flood.transport")
+
+MESSAGES = counter("flood_messages_total", "ACL messages sent and received",
+                   ("agent", "direction", "performative"))
+
+# Called with every Message an agent sends, on a bus or over XMPP
+# (common.capture records them this way)
+TAPS = []
+
+
+def count(msg, agent, direction):
+    MESSAGES.inc(agent, direction, msg.get_metadata("performative") or "none")
+
+
+def sent(msg, agent):
+    count(msg, agent, "out")
+    for tap in TAPS:
+        tap(msg)
+
+
+class LocalBus:
+    """Routes Messages between the agents registered on it"""
+
+    def __init__(self):
+        self.agents = {}
+        self.delivered = 0
+        self.undeliverable = 0
+
+    def register(self, agent):
+        self.agents[str(agent.jid.bare)] = agent
+
+    def unregister(self, agent):
+        self.agents.pop(str(agent.jid.bare), None)
+
+    def is_local(self, jid):
+        return str(jid).split("/", 1)[0] in self.agents
+
+    async def send(self, msg, behaviour):
+        # Same signature as spade's Container.send, which the bus replaces
+        sent(msg, behaviour.agent.name)
+        agent = self.agents.get(str(msg.to.bare))
+        if agent is None or not agent.is_alive():
+            self.undeliverable += 1
+            logger.warning("No local agent for %s, dropping message", msg.to)
+            return
+        self.deliver(agent, msg)
+
+    def backlog(self, jid):
+        """Messages waiting in the fullest mailbox of a local agent"""
+        agent = self.agents.get(str(jid).split("/", 1)[0])
+        if agent is None:
+            return 0
+        return max((b.queue.qsize() for b in agent.behaviours if b.queue is not None), default=0)
+
+    def deliver(self, agent, msg):
+        matched = False
+        for behaviour in agent.behaviours:
+            if behaviour.queue is not None and behaviour.match(msg):
+                behaviour.queue.put_nowait(msg)
+                matched = True
+        if matched:
+            self.delivered += 1
+            count(msg, agent.name, "in")
+        else:
+            self.undeliverable += 1
+            logger.warning("No behaviour of %s matched message: %s", agent.jid, msg)
+
+
+class _CountingContainer:
+    """spade's Container, counting what goes out over XMPP"""
+
+    def __init__(self, container):
+        self._container = container
+
+    async def send(self, msg, behaviour):
+        sent(msg, behaviour.agent.name)
+        await self._container.send(msg, behaviour)
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+
+class BusAgent(Agent):
+    """A SPADE Agent that can run on a LocalBus instead of XMPP.
+
+    With bus=None it is a plain Agent and logs in to the XMPP server as
+    usual. With a bus it skips the XMPP login entirely.
+
+    tls_context, if set before start(), is the TLS context the XMPP client
+    connects with (common.fleet gives a fleet one, loaded once), unless
+    the client has ciphers, a certificate or CA certs of its own to load.
+    """
+
+    def __init__(self, jid, password, bus=None, **kwargs):
+        super().__init__(jid, password, **kwargs)
+        self.bus = bus
+        self.tls_context = None
+        if bus is not None:
+            bus.register(self)
+            self.set_container(bus)
+        else:
+            self.set_container(_CountingContainer(self.container))
+
+    def dispatch(self, msg):
+        # Messages arriving over XMPP; the bus counts its own deliveries
+        count(msg, self.name, "in")
+        return super().dispatch(msg)
+
+    async def _async_connect(self):
+        if self.bus is None:
+            client = self.client
+            # get_ssl_context() only changes the context when one of these
+            # is set, so a context shared by many clients stays as it is
+            if (self.tls_context is not None and self.verify_security
+                    and client.ciphers is None and not client.certfile
+                    and client.ca_certs is None):
+                client.ssl_context = self.tls_context
+            await super()._async_connect()
+        else:
+            # The client never connects, so its keepalive ping would time
+            # out and start a real reconnect to the XMPP server
+            self.client["xep_0199"].disable_keepalive()
+            self.bus.register(self)
+
+    async def _async_stop(self):
+        if self.bus is None:
+            return await super()._async_stop()
+        for behav in self.behaviours:
+            behav.kill()
+        if self.web.is_started():
+            await self.web.runner.cleanup()
+        self.bus.unregister(self)
+        self._alive.clear()
@@ -1,36 +1,284 @@
-import random
-from datetime import datetime
+from collections import namedtuple
+from collections.abc import Mapping
+import math
+import time
+
+import numpy as np
+
+from common.spatial import CELL_KM, GridIndex
+from event_log import EventLog, EventRecord, format_short
+
+# Damage never goes above this value
+MAX_DAMAGE = 10.0
+
+# Per-tick damage increase is drawn from [low, low + span)
+FIRE_LOW, FIRE_SPAN = 0.3, 0.5      # fire zones get worse faster
+CALM_LOW, CALM_SPAN = 0.1, 0.2
+
+# Each tick a zone catches fire from each burning neighbour with this chance
+SPREAD_CHANCE = 0.05
+# Chance of catching fire in one tick with 0..4 burning neighbours
+IGNITION = 1.0 - (1.0 - SPREAD_CHANCE) ** np.arange(5.0)
+# Share of the damage gap to each worse-off neighbour that seeps across per tick
+DAMAGE_SPILL = 0.05
+
+# Alert thresholds; an alert only clears once damage falls HYSTERESIS below
+CRITICAL_LEVEL = 7.0
+WARNING_LEVEL = 5.0     # only raised for zones that are on fire
+HYSTERESIS = 0.5
+
+# Emitted by update() when a zone crosses a threshold.
+# kind is 'CRITICAL', 'WARNING' or 'FIRE'; raised is False when it clears.
+ThresholdEvent = namedtuple('ThresholdEvent', 'zone kind raised damage fire')
+
+
+class ZoneStatus(Mapping):
+    """Read-only dict view over the zone arrays: name -> {'damage', 'fire'}"""
+
+    def __init__(self, env):
+        self._env = env
+
+    def __getitem__(self, name):
+        i = self._env.index[name]
+        return {'damage': float(self._env.damage[i]),
+                'fire': bool(self._env.fire[i])}
+
+    def __iter__(self):
+        return iter(self._env.names)
+
+    def __len__(self):
+        return len(self._env.names)
+
+    def items(self):
+        # Convert the arrays once instead of once per zone
+        damage = self._env.damage.tolist()
+        fire = self._env.fire.tolist()
+        for name, d, f in zip(self._env.names, damage, fire):
+            yield name, {'damage': d, 'fire': f}
+
+
+class Dynamics:
+    """One tick of damage growth, fire spread and damage spill on a
+    padded grid (see DisasterEnvironment._load_geometry). Works on zone
+    arrays of shape (zones,) or (members, zones), so the environment
+    steps its one map and a forecast steps a whole ensemble with the
+    same code; the scratch buffers are sized for one of those shapes,
+    and for damage of one dtype."""
+
+    def __init__(self, slot, neighbours, grid_size, shape, dtype=np.float64):
+        self.slot = slot
+        self.neighbours = neighbours
+        self.grid_size = grid_size
+        self._grid = np.zeros(tuple(shape[:-1]) + (grid_size,), dtype=dtype)
+        self._fire_grid = np.zeros(self._grid.shape, dtype=np.uint8)
+        # Every zone's slot in the flattened grid(s): one scatter per tick
+        rows = math.prod(shape[:-1])
+        self._slots = (np.arange(rows)[:, None] * grid_size + slot).ravel()
+        self._step = np.empty(shape, dtype=dtype)
+        self._gap = np.empty(shape, dtype=dtype)
+        self._spill = np.empty(shape, dtype=dtype)
+        self._burning = np.empty(shape, dtype=np.uint8)
+        self._exposed = np.empty(shape, dtype=np.uint8)
+
+    def resized(self, shape, dtype=np.float64):
+        """The same grid with buffers for arrays of another shape"""
+        return Dynamics(self.slot, self.neighbours, self.grid_size, shape, dtype)
+
+    def tick(self, damage, fire, rng):
+        # Make damage get worse over time, every zone in one batched step
+        step = self._step
+        rng.random(out=step, dtype=step.dtype)
+        step *= np.where(fire, FIRE_SPAN, CALM_SPAN)
+        step += np.where(fire, FIRE_LOW, CALM_LOW)
+        damage += step
+        self.spread(damage, fire, rng)
+
+        # Keep damage between 0 and 10
+        np.minimum(damage, MAX_DAMAGE, out=damage)
+
+    def spread(self, damage, fire, rng):
+        """Fire jumps to adjacent cells; damage seeps towards them"""
+        grid, gap, spill = self._grid, self._gap, self._spill
+        burning, exposed = self._burning, self._exposed
+
+        # Burning neighbours per zone, then one draw per exposed zone only
+        self._fire_grid.reshape(-1)[self._slots] = fire.reshape(-1)
+        np.take(self._fire_grid, self.neighbours[0], axis=-1, out=burning)
+        for side in self.neighbours[1:]:
+            np.take(self._fire_grid, side, axis=-1, out=exposed)
+            burning += exposed
+        at_risk = np.flatnonzero(burning.astype(bool) & ~fire)
+        if len(at_risk):
+            chance = IGNITION[burning.reshape(-1)[at_risk]]
+            fire.reshape(-1)[at_risk[rng.random(len(at_risk)) < chance]] = True
+
+        # Each zone takes a share of how much worse each neighbour is;
+        # empty cells read as damage 0 and so never give any
+        grid.reshape(-1)[self._slots] = damage.reshape(-1)
+        spill.fill(0.0)
+        for side in self.neighbours:
+            np.take(grid, side, axis=-1, out=gap)
+            gap -= damage
+            np.maximum(gap, 0.0, out=gap)
+            spill += gap
+        spill *= DAMAGE_SPILL
+        damage += spill
+
 
 class DisasterEnvironment:
-    def __init__(self):
+    """Zones are cells of a square grid, CELL_KM across. A zone dict may
+    give its (row, column) as 'cell'; otherwise zones fill the grid row
+    by row. Fire and damage spread between cells sharing an edge."""
+
+    def __init__(self, zones=None, seed=None, events=None, clock=time.time):
         # Start with 3 zones to keep it simple
-        self.zones = {
-            'Zone_A': {'damage': 2.0, 'fire': False},
-            'Zone_B': {'damage': 4.5, 'fire': True},
-            'Zone_C': {'damage': 1.0, 'fire': False}
-        }
-        self.events = []
-    
+        if zones is None:
+            zones = {
+                'Zone_A': {'damage': 2.0, 'fire': False},
+                'Zone_B': {'damage': 4.5, 'fire': True},
+                'Zone_C': {'damage': 1.0, 'fire': False}
+            }
+
+        self.rng = np.random.default_rng(seed)
+        # Bounded log; pass EventLog(path) to also stream events to disk
+        self.events = events if events is not None else EventLog()
+        self.clock = clock   # event timestamps; a simulation passes its virtual clock
+        self.subscribers = []
+        cells = [z.get('cell') for z in zones.values()]
+        self._load(list(zones),
+                   [z['damage'] for z in zones.values()],
+                   [z['fire'] for z in zones.values()],
+                   cells if all(c is not None for c in cells) else None)
+
+    @classmethod
+    def generate(cls, count, seed=None, fire_ratio=0.05, max_damage=5.0, events=None,
+                 clock=time.time):
+        """Build a square-ish map of `count` grid cells named Zone_0 .. Zone_<count-1>"""
+        env = cls({}, seed, events, clock)
+        env._load([f"Zone_{i}" for i in range(count)],
+                  env.rng.uniform(0.0, max_damage, count),
+                  env.rng.random(count) < fire_ratio)
+        return env
+
+    def _load(self, names, damage, fire, cells=None):
+        # Zone state lives in contiguous arrays, one slot per zone
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.damage = np.asarray(damage, dtype=np.float64)
+        self.fire = np.asarray(fire, dtype=bool)
+        self._load_geometry(cells)
+
+        # Alert state per zone, so each crossing is reported only once
+        self.critical = np.zeros(len(names), dtype=bool)
+        self.warning = np.zeros(len(names), dtype=bool)
+        self._was_on_fire = self.fire.copy()
+
+    def _load_geometry(self, cells):
+        n = len(self.names)
+        if cells is None:
+            columns = max(1, math.ceil(math.sqrt(n)))
+            cells = np.stack(np.divmod(np.arange(n), columns), axis=1)    # as grid_cell()
+        self.cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)      # (row, column)
+        if n and self.cells.min() < 0:
+            raise ValueError("zone cells must have non-negative row and column")
+        # Cell centres, as cell_centre(): x from the column, y from the row
+        self.positions = (self.cells[:, ::-1] + 0.5) * CELL_KM
+        self.spatial = GridIndex(self.positions, cell_size=CELL_KM)
+
+        # The grid padded by one empty cell on every side, flattened: each
+        # zone's four edge neighbours are fixed offsets from its own slot,
+        # and the padding stands in for "no neighbour"
+        rows, cols = (self.cells.max(axis=0) + 1) if n else (0, 0)
+        width = cols + 2
+        slot = (self.cells[:, 0] + 1) * width + self.cells[:, 1] + 1
+        if len(np.unique(slot)) != n:
+            raise ValueError("two zones share a grid cell")
+        self.dynamics = Dynamics(slot, np.stack([slot - width, slot + width, slot - 1, slot + 1]),
+                                 (rows + 2) * width, (n,))
+
+    @property
+    def zones(self):
+        return self.get_status()
+
     def update(self):
-        # Make damage get worse over time
-        for zone_name in self.zones:
-            zone = self.zones[zone_name]
-            
-            # Fire zones get worse faster
-            if zone['fire']:
-                zone['damage'] += random.uniform(0.3, 0.8)
-            else:
-                zone['damage'] += random.uniform(0.1, 0.3)
-            
-            # Keep damage between 0 and 10
-            if zone['damage'] > 10:
-                zone['damage'] = 10
-    
+        self.dynamics.tick(self.damage, self.fire, self.rng)
+        return self.detect()
+
+    def spread(self):
+        """Fire jumps to adjacent cells; damage seeps towards them"""
+        self.dynamics.spread(self.damage, self.fire, self.rng)
+
+    def position(self, zone_name):
+        """(x, y) in km of the zone's cell centre"""
+        return tuple(self.positions[self.index[zone_name]].tolist())
+
+    def neighbours(self, zone_name):
+        """Zones sharing an edge with zone_name"""
+        row, column = self.cells[self.index[zone_name]].tolist()
+        idx, _ = self.spatial.within(self.positions[self.index[zone_name]], CELL_KM * 1.01)
+        return [self.names[i] for i in idx.tolist()
+                if abs(self.cells[i, 0] - row) + abs(self.cells[i, 1] - column) == 1]
+
+    def nearest_zones(self, point, k=1):
+        """Names of the k zones whose centres are closest to point (km)"""
+        idx, _ = self.spatial.nearest(point, k)
+        return [self.names[i] for i in idx.tolist()]
+
+    def zones_within(self, point, radius):
+        """Names of the zones whose centres lie within radius km of point"""
+        idx, _ = self.spatial.within(point, radius)
+        return [self.names[i] for i in idx.tolist()]
+
+    def subscribe(self, callback):
+        """Call callback(event) for every ThresholdEvent raised by update()"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def set_fire(self, zone_name, on_fire=True):
+        self.fire[self.index[zone_name]] = on_fire
+
+    def detect(self):
+        """Compare zones against the alert thresholds and emit the crossings.
+
+        The comparison is one array pass; Python-level work (building events,
+        calling subscribers) only happens for the zones that changed.
+        """
+        damage = self.damage
+        critical = np.where(self.critical,
+                            damage > CRITICAL_LEVEL - HYSTERESIS,
+                            damage > CRITICAL_LEVEL)
+        warning = self.fire & np.where(self.warning,
+                                       damage > WARNING_LEVEL - HYSTERESIS,
+                                       damage > WARNING_LEVEL)
+        ignited = self.fire & ~self._was_on_fire
+
+        events = []
+        changed = np.flatnonzero((critical != self.critical)
+                                 | (warning != self.warning) | ignited)
+        for i in changed.tolist():
+            zone, d, f = self.names[i], float(damage[i]), bool(self.fire[i])
+            if ignited[i]:
+                events.append(ThresholdEvent(zone, 'FIRE', True, d, f))
+            if critical[i] != self.critical[i]:
+                events.append(ThresholdEvent(zone, 'CRITICAL', bool(critical[i]), d, f))
+            if warning[i] != self.warning[i]:
+                events.append(ThresholdEvent(zone, 'WARNING', bool(warning[i]), d, f))
+
+        self.critical = critical
+        self.warning = warning
+        np.copyto(self._was_on_fire, self.fire)
+
+        for event in events:
+            for callback in self.subscribers:
+                callback(event)
+        return events
+
     def get_status(self):
-        return self.zones
-    
-    def log_event(self, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        event = f"[{timestamp}] {message}"
-        self.events.append(event)
-        return event
\ No newline at end of file
+        return ZoneStatus(self)
+
+    def log_event(self, message, zone=None, level='INFO', damage=None):
+        record = EventRecord(self.clock(), zone, level, damage, message)
+        self.events.append(record)
+        return format_short(record)
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+# One logged event; timestamp is seconds since the epoch (time.time())
+EventRecord = namedtuple('EventRecord', 'timestamp zone level damage message')
+
+
+class EventLog:
+    """Bounded event log with a batched, rotating file writer.
+
+    append() only touches memory: the record goes into a fixed-size ring
+    buffer (for "last N events" queries) and onto a pending batch. A
+    background thread writes pending batches to disk, so callers running
+    in the asyncio loop never wait on file I/O.
+
+    With path=None nothing is written and only the ring buffer is kept.
+    """
+
+    def __init__(self, path=None, keep_last=1000, max_bytes=1_000_000,
+                 backup_count=3, batch_size=1000, flush_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.recent = deque(maxlen=keep_last)
+        self.total = 0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._written = 0
+        self._closed = False
+        self._file = None
+        self._thread = None
+
+        if path is not None:
+            self._file = open(path, 'a', encoding='utf-8')
+            self._thread = threading.Thread(target=self._writer, daemon=True,
+                                            name='event-log-writer')
+            self._thread.start()
+
+    def __len__(self):
+        return self.total
+
+    def append(self, record):
+        self.recent.append(record)
+        self.total += 1
+        if self._thread is None:
+            return
+        with self._lock:
+            self._pending.append(record)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def last(self, n):
+        """The n most recent records, oldest first"""
+        if n <= 0:
+            return []
+        return list(self.recent)[-n:]
+
+    def flush(self):
+        """Block until everything appended so far is on disk"""
+        if self._thread is None:
+            return
+        with self._lock:
+            target = self._written + len(self._pending)
+            self._wake.set()
+            while self._written < target and self._thread.is_alive():
+                self._flushed.wait(timeout=0.1)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join()
+            self._file.close()
+
+    # ── writer thread ──────────────────────────────────────────
+    def _writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+            with self._lock:
+                self._written += len(batch)
+                self._flushed.notify_all()
+            if self._closed and not self._pending:
+                return
+
+    def _write(self, batch):
+        data = ''.join(format_record(r) for r in batch)
+        if self._file.tell() + len(data) > self.max_bytes and self._file.tell() > 0:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _rotate(self):
+        # event_log.txt -> event_log.txt.1 -> ... -> event_log.txt.<backup_count>
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+
+# Backslash first, so the escapes it adds are not escaped again
+_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+
+
+def _escape(text):
+    """text with tabs, newlines and backslashes escaped, so it stays one field"""
+    for char, escaped in _ESCAPES:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def format_record(record):
+    """Tab-separated line: time, level, zone, damage, message (zone and
+    message escaped)"""
+    when = datetime.fromtimestamp(record.timestamp).isoformat(timespec='milliseconds')
+    damage = '' if record.damage is None else f"{record.damage:.2f}"
+    zone = _escape(record.zone or '')
+    return f"{when}\t{record.level}\t{zone}\t{damage}\t{_escape(record.message)}\n"
+
+
+def format_short(record):
+    """The console form used by the lab: [HH:MM:SS] message"""
+    when = time.strftime('%H:%M:%S', time.localtime(record.timestamp))
+    return f"[{when}] {record.message}"
@@ -0,0 +1,133 @@
+"""
+Ensemble forecasts of a DisasterEnvironment.
+
+One run of update() is one possible future. forecast() runs `members`
+independent copies of the map forward `ticks` steps and summarises, per
+zone:
+
+    chance   share of members in which damage reaches `threshold`
+    bands    damage percentiles at the horizon
+    ttc      ticks until damage reaches `threshold`, as percentiles over
+             all members (inf where fewer than that share get there), so
+             ttc at 80 <= 20 reads "80% chance within 20 ticks"
+
+    result = forecast(env, members=1000, ticks=60, seed=7)
+    result.zone("Zone_B")    # {'chance': .., 'damage': {5: .., 50: .., 95: ..}, 'ticks': {...}}
+
+Members are stepped together as (members, zones) arrays with the
+environment's own Dynamics, in chunks of about `batch_cells` zone
+values so memory stays bounded on large maps. Each chunk only returns
+fixed-size per-zone histograms (damage in BIN-wide bins, ticks to
+threshold), which add up across chunks; so chunks can run on a process
+pool (executor=ProcessPoolExecutor(...)) and the result does not depend
+on how they were spread. Each chunk has its own seed spawned from
+`seed`, so a forecast is reproducible for a given seed and batch_cells.
+Members carry damage as float32, which is plenty for 0..10 and moves
+half the bytes of the environment's float64 per tick. Damage bands are
+accurate to the bin width.
+
+Cost is about members * zones * ticks; one CPU manages 15-20 million
+zone-ticks a second (benchmarks/bench_forecast.py). The lab2 map takes
+milliseconds, 1000 members x 20 ticks of 10,000 zones about 10 seconds,
+and 100,000 zones needs fewer members or a pool with several workers to
+come in under a minute. lab2/main.py --forecast runs it once, for the
+end-of-run report; nothing calls it on a schedule.
+"""
+
+import math
+
+import numpy as np
+
+from environment import CRITICAL_LEVEL, MAX_DAMAGE
+
+BIN = 0.05
+DAMAGE_BINS = int(round(MAX_DAMAGE / BIN)) + 1     # the last bin is damage == MAX_DAMAGE
+PERCENTILES = (5, 50, 95)
+DTYPE = np.float32
+
+
+def _run_chunk(damage, fire, dynamics, members, ticks, threshold, seed):
+    """Histograms (DAMAGE_BINS, zones) of damage at the horizon and
+    (ticks + 2, zones) of the tick damage first reached threshold (0 if
+    it already had; ticks + 1 for never) over `members` futures"""
+    rng = np.random.default_rng(seed)
+    zones = len(damage)
+    damage = np.repeat(damage[None, :].astype(DTYPE), members, axis=0)
+    fire = np.repeat(fire[None, :], members, axis=0)
+    dynamics = dynamics.resized(damage.shape, DTYPE)
+
+    never = ticks + 1
+    first = np.where(damage >= threshold, 0, never).astype(np.int32)
+    for t in range(1, ticks + 1):
+        dynamics.tick(damage, fire, rng)
+        first[(first == never) & (damage >= threshold)] = t
+
+    columns = np.arange(zones)
+    bins = np.minimum((damage / BIN).astype(np.int64), DAMAGE_BINS - 1)
+    damage_hist = np.bincount((bins * zones + columns).ravel(),
+                              minlength=DAMAGE_BINS * zones).reshape(DAMAGE_BINS, zones)
+    first_hist = np.bincount((first.astype(np.int64) * zones + columns).ravel(),
+                             minlength=(ticks + 2) * zones).reshape(ticks + 2, zones)
+    return damage_hist, first_hist
+
+
+def _ranks(hist, percentiles, members):
+    """Bin holding each percentile (nearest rank) per zone: (P, zones)"""
+    cumulative = hist.cumsum(axis=0)
+    return np.stack([(cumulative < max(1, math.ceil(p / 100 * members))).sum(axis=0)
+                     for p in percentiles])
+
+
+class Forecast:
+    def __init__(self, names, members, ticks, threshold, percentiles, damage_hist, first_hist):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.members = members
+        self.ticks = ticks
+        self.threshold = threshold
+        self.percentiles = tuple(percentiles)
+        self.damage_hist = damage_hist
+        self.first_hist = first_hist
+
+        self.chance = first_hist[:ticks + 1].sum(axis=0) / members
+        # Bin midpoints, except the last bin which is exactly MAX_DAMAGE
+        centres = np.minimum((np.arange(DAMAGE_BINS) + 0.5) * BIN, MAX_DAMAGE)
+        self.bands = centres[_ranks(damage_hist, self.percentiles, members)]
+        ttc = _ranks(first_hist, self.percentiles, members).astype(np.float64)
+        ttc[ttc > ticks] = np.inf
+        self.ttc = ttc
+
+    def zone(self, name):
+        i = self.index[name]
+        return {'chance': float(self.chance[i]),
+                'damage': dict(zip(self.percentiles, self.bands[:, i].tolist())),
+                'ticks': dict(zip(self.percentiles, self.ttc[:, i].tolist()))}
+
+    def at_risk(self, min_chance=0.5):
+        """(name, chance) of the zones at least min_chance likely to reach
+        the threshold, likeliest first"""
+        idx = np.flatnonzero(self.chance >= min_chance)
+        idx = idx[np.argsort(-self.chance[idx], kind="stable")]
+        return [(self.names[i], float(self.chance[i])) for i in idx.tolist()]
+
+
+def forecast(env, members=1000, ticks=60, threshold=CRITICAL_LEVEL, seed=None,
+             percentiles=PERCENTILES, executor=None, batch_cells=2_000_000):
+    """Run the ensemble from env's current state; see the module docstring"""
+    zones = len(env.names)
+    per_chunk = max(1, min(members, batch_cells // max(1, zones)))
+    sizes = [min(per_chunk, members - start) for start in range(0, members, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(env.damage.copy(), env.fire.copy(), env.dynamics, size, ticks, threshold, s)
+            for size, s in zip(sizes, seeds)]
+
+    if executor is None:
+        results = (_run_chunk(*job) for job in jobs)
+    else:
+        results = executor.map(_run_chunk, *zip(*jobs))
+    damage_hist = np.zeros((DAMAGE_BINS, zones), dtype=np.int64)
+    first_hist = np.zeros((ticks + 2, zones), dtype=np.int64)
+    for d, f in results:
+        damage_hist += d
+        first_hist += f
+    return Forecast(env.names, members, ticks, threshold, percentiles, damage_hist, first_hist)
@@ -1,12 +1,26 @@
+import argparse
 import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import simclock
+from common.status import StatusServer
+from common.transport import LocalBus
 from environment import DisasterEnvironment
+from event_log import EventLog, format_short
+from forecast import forecast
 from sensor_agent import SensorAgent
 
-async def main():
+TICK_SECONDS = 3   # MonitorBehaviour updates the environment every 3 seconds
+
+async def main(local=False, duration=30, seed=None, members=0, horizon=20, status=None):
     print("=== Lab 2: Disaster Monitoring ===\n")
     
-    # Create the environment
-    env = DisasterEnvironment()
+    # Create the environment; events stream to event_log.txt as they happen
+    env = DisasterEnvironment(seed=seed, events=EventLog('event_log.txt', keep_last=100),
+                              clock=lambda: simclock.now().timestamp())
     
     print("Initial state:")
     for zone, data in env.get_status().items():
@@ -14,18 +28,29 @@ async def main():
     print()
     
     # Create and start the sensor agent
-    agent = SensorAgent("sensor@localhost", "password", env)
+    # --local: no XMPP server needed
+    agent = SensorAgent("sensor@localhost", "password", env, bus=LocalBus() if local else None)
     await agent.start()
     
-    print("Monitoring for 30 seconds...\n")
+    # --status PORT: serve the zones and recent events over HTTP/WebSocket
+    server = None
+    if status is not None:
+        server = StatusServer(port=status)
+        server.add_zones(env)
+        server.add("events", lambda: [format_short(record) for record in env.events.last(5)])
+        await server.start()
     
-    # Run for 30 seconds
+    print(f"Monitoring for {duration:g} seconds...\n")
+    
+    # Run for the requested time
     try:
-        await asyncio.sleep(30)
+        await asyncio.sleep(duration)
     except KeyboardInterrupt:
         print("\nStopped by user")
     
     # Stop the agent
+    if server is not None:
+        await server.stop()
     await agent.stop()
     
     # Show final results
@@ -35,19 +60,50 @@ async def main():
         status = "CRITICAL" if data['damage'] >= 7 else "OK"
         print(f"  {zone}: {status} (damage={data['damage']:.1f})")
     
+    if members:
+        result = forecast(env, members=members, ticks=horizon, seed=seed)
+        print(f"\nForecast ({members} runs, next {horizon * TICK_SECONDS:g} seconds):")
+        for zone in env.names:
+            z = result.zone(zone)
+            low, mid, high = z['damage'].values()
+            soonest = z['ticks'][50]
+            when = f", median {soonest * TICK_SECONDS:g}s" if soonest != float('inf') else ""
+            print(f"  {zone}: {z['chance']:.0%} chance of CRITICAL{when}; "
+                  f"damage {mid:.1f} ({low:.1f}-{high:.1f})")
+
     print(f"\nTotal events logged: {len(env.events)}")
     print("\nLast 5 events:")
-    for event in env.events[-5:]:
-        print(f"  {event}")
+    for record in env.events.last(5):
+        print(f"  {format_short(record)}")
     
-    # Save to file
-    with open('event_log.txt', 'w') as f:
-        f.write("Disaster Monitoring Event Log\n")
-        f.write("="*40 + "\n\n")
-        for event in env.events:
-            f.write(event + "\n")
+    # Flush whatever the background writer hasn't written yet
+    env.events.close()
     
     print("\nEvents saved to event_log.txt")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Lab 2 disaster monitoring")
+    parser.add_argument("--local", action="store_true",
+                        help="run without an XMPP server")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to monitor for (default 30)")
+    parser.add_argument("--sim", action="store_true",
+                        help="headless run on a virtual clock (implies --local)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed the environment for a reproducible run")
+    parser.add_argument("--forecast", type=int, default=0, metavar="RUNS",
+                        help="end with an ensemble forecast of this many runs")
+    parser.add_argument("--horizon", type=int, default=20,
+                        help="ticks the forecast looks ahead (default 20, one minute)")
+    parser.add_argument("--status", type=int, metavar="PORT",
+                        help="serve live zone status on http://127.0.0.1:PORT/status and "
+                             "ws://127.0.0.1:PORT/ws")
+    args = parser.parse_args()
+    if args.sim and args.status is not None:
+        parser.error("--status needs a real clock; it cannot be combined with --sim")
+    scenario = main(local=args.local or args.sim, duration=args.duration, seed=args.seed,
+                    members=args.forecast, horizon=args.horizon, status=args.status)
+    if args.sim:
+        simclock.run(scenario, seed=args.seed)
+    else:
+        asyncio.run(scenario)
\ No newline at end of file
@@ -1,44 +1,51 @@
-from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
 import asyncio
 
+from common.transport import BusAgent
+
 class MonitorBehaviour(CyclicBehaviour):
+    async def on_start(self):
+        # Threshold crossings are pushed here by the environment,
+        # so we never have to rescan the whole map
+        self.pending = []
+        self.agent.environment.subscribe(self.pending.append)
+
+    async def on_end(self):
+        self.agent.environment.unsubscribe(self.pending.append)
+
     async def run(self):
         # Get the environment from the agent
         env = self.agent.environment
-        
-        # Update the environment state
+
+        # Update the environment state (emits events for changed zones)
         env.update()
-        
-        # Check each zone
-        zones = env.get_status()
-        for zone_name, zone_data in zones.items():
-            damage = zone_data['damage']
-            has_fire = zone_data['fire']
-            
-            # Check if damage is critical
-            if damage > 7.0:
-                msg = f"CRITICAL: {zone_name} damage level is {damage:.1f}"
-                event = env.log_event(msg)
-                print(event)
-            
-            # Check if there's fire
-            if has_fire and damage > 5.0:
-                msg = f"WARNING: Fire in {zone_name}, damage at {damage:.1f}"
-                event = env.log_event(msg)
-                print(event)
-        
+
+        # Only handle zones that crossed a threshold this tick
+        events, self.pending[:] = self.pending[:], []
+        for e in events:
+            if e.kind == 'CRITICAL' and e.raised:
+                level, msg = 'CRITICAL', f"CRITICAL: {e.zone} damage level is {e.damage:.1f}"
+            elif e.kind == 'WARNING' and e.raised:
+                level, msg = 'WARNING', f"WARNING: Fire in {e.zone}, damage at {e.damage:.1f}"
+            elif e.kind == 'FIRE':
+                level, msg = 'WARNING', (f"WARNING: Fire started in {e.zone}, "
+                                         f"damage at {e.damage:.1f}")
+            else:
+                level, msg = 'INFO', f"CLEARED: {e.kind} in {e.zone}, damage at {e.damage:.1f}"
+            event = env.log_event(msg, zone=e.zone, level=level, damage=e.damage)
+            print(event)
+
         # Wait 3 seconds before checking again
         await asyncio.sleep(3)
 
 
-class SensorAgent(Agent):
-    def __init__(self, jid, password, environment):
-        super().__init__(jid, password)
+class SensorAgent(BusAgent):
+    def __init__(self, jid, password, environment, bus=None):
+        super().__init__(jid, password, bus=bus)
         self.environment = environment
-    
+
     async def setup(self):
         print("SensorAgent started")
         # Add the monitoring behaviour
         behaviour = MonitorBehaviour()
-        self.add_behaviour(behaviour)
\ No newline at end of file
+        self.add_behaviour(behaviour)
@@ -4,13 +4,39 @@ Flood Monitoring & Emergency Response System
 Agents: SensorAgent, RescueAgent (FSM)
 """
 
+import argparse
 import asyncio
+import itertools
+import logging
 import random
+import sys
+from collections import namedtuple
+from pathlib import Path
 import spade
-from spade.agent import Agent
-from spade.behaviour import FSMBehaviour, State, PeriodicBehaviour
+from spade.behaviour import CyclicBehaviour, PeriodicBehaviour
 from spade.message import Message
-from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import logs, simclock
+from common.batching import Batcher
+from common.capture import CaptureWriter, ReplayAgent
+from common.fsm import (
+    DRAIN, EVENT, EVENTS as FSM_EVENTS, NOW, STATE_SECONDS, TIMEOUT,
+    TRANSITIONS as FSM_TRANSITIONS, TableFSM, Transition,
+)
+from common.metrics import REGISTRY
+from common.risk import RiskModel
+from common.sampling import AdaptiveSampler, SampleBudget
+from common.schema import (
+    DISASTER_EVENT, DISASTER_BATCH, SEVERITIES, DisasterEvent, MessageError,
+)
+from common.status import StatusServer
+from common.store import IncidentStore
+from common.taskpool import TaskPool
+from common.transport import BusAgent, LocalBus
+
+logger = logging.getLogger("flood.lab3")
 
 # ─── FSM States ───────────────────────────────────────────────
 STATE_IDLE       = "IDLE"
@@ -27,7 +53,29 @@ GOAL_RESCUE    = "RescueGoal: Respond to high-severity flood events"
 # ══════════════════════════════════════════════════════════════
 #  SENSOR AGENT — periodically generates flood sensor events
 # ══════════════════════════════════════════════════════════════
-class SensorAgent(Agent):
+class SensorAgent(BusAgent):
+    """batch_size > 1 sends readings as one disaster-batch INFORM once
+    batch_size are queued or the oldest has waited flush_ms.
+
+    With a budget, the sensor samples faster while the readings' trend
+    (a RiskModel: HIGH, CRITICAL) is bad or the readings are moving, and
+    backs off towards a floor rate while they are calm
+    (common/sampling.py); the budget caps the rate it may ask for together
+    with the other sensors sharing it."""
+
+    def __init__(self, jid, password, bus=None, period=3, batch_size=1, flush_ms=500,
+                 budget=None):
+        super().__init__(jid, password, bus=bus)
+        self.period  = period
+        self.batcher = Batcher(batch_size, flush_ms / 1000) if batch_size > 1 else None
+        self.sampler = None
+        if budget is not None:
+            self.sampler = AdaptiveSampler(period, budget=budget, agent=self.name)
+            self.trend = RiskModel()
+        self.sent    = itertools.count()
+
+    def conversation(self):
+        return f"{self.name}-{next(self.sent)}"
 
     class SensorBehaviour(PeriodicBehaviour):
         async def run(self):
@@ -43,143 +91,296 @@ class SensorAgent(Agent):
             else:
                 severity = "LOW"
 
-            ts = datetime.now().strftime("%H:%M:%S")
-            print(f"[{ts}] [SensorAgent] Water={water_level}m  "
-                  f"Rain={rainfall}mm/hr  Wind={wind_speed}km/h  "
-                  f"→ Severity={severity}")
+            logger.info("[SensorAgent] Water=%dm  Rain=%dmm/hr  Wind=%dkm/h  → Severity=%s",
+                        water_level, rainfall, wind_speed, severity)
+
+            # Next reading sooner while the trend looks bad, later while
+            # calm; one noisy reading moves the trend only a little
+            sampler = self.agent.sampler
+            if sampler is not None:
+                now = asyncio.get_running_loop().time()
+                code, _ = self.agent.trend.update(self.agent.name, water_level, rainfall, now)
+                self.period = sampler.observe(code, (water_level, rainfall), now)
+
+            event = DisasterEvent(severity, water_level, rainfall, wind_speed)
+            if self.agent.batcher is not None:
+                batch = self.agent.batcher.add(event)
+                if batch:
+                    await self.agent.send_batch(self, batch)
+                return
 
             # Send event to RescueAgent
-            msg = Message(to="takyisky.rescue@xmpp.jp")
+            msg = Message(to="takyisky.rescue@xmpp.jp", thread=self.agent.conversation())
             msg.set_metadata("performative", "inform")
             msg.set_metadata("ontology", "disaster-event")
-            msg.body = f"SEVERITY:{severity};WATER:{water_level};"  \
-                       f"RAIN:{rainfall};WIND:{wind_speed}"
+            msg.body = DISASTER_EVENT.encode(event)
             await self.send(msg)
 
+        async def on_end(self):
+            if self.agent.sampler is not None:
+                self.agent.sampler.close()
+
+    class FlushBehaviour(CyclicBehaviour):
+        # Sends batches that reach flush_ms before they fill up
+        async def run(self):
+            batch = await self.agent.batcher.flush_due()
+            await self.agent.send_batch(self, batch)
+
+    async def send_batch(self, behaviour, batch):
+        msg = Message(to="takyisky.rescue@xmpp.jp", thread=self.conversation())
+        msg.set_metadata("performative", "inform")
+        msg.set_metadata("ontology", DISASTER_BATCH)
+        msg.body = DISASTER_EVENT.encode_batch(batch)
+        await behaviour.send(msg)
+
     async def setup(self):
-        print("[SensorAgent] Starting — Goal:", GOAL_MONITOR)
-        self.add_behaviour(self.SensorBehaviour(period=3))
+        logger.info("[SensorAgent] Starting — Goal: %s", GOAL_MONITOR)
+        self.add_behaviour(self.SensorBehaviour(period=self.period))
+        if self.batcher is not None:
+            self.add_behaviour(self.FlushBehaviour())
 
 
 # ══════════════════════════════════════════════════════════════
 #  RESCUE AGENT — FSM reactive behaviour
 # ══════════════════════════════════════════════════════════════
 
-# ── State: IDLE ──────────────────────────────────────────────
-class IdleState(State):
-    async def run(self):
-        ts = datetime.now().strftime("%H:%M:%S")
-        print(f"[{ts}] [RescueAgent FSM] State=IDLE  "
-              f"(Waiting for disaster events...)")
-        msg = await self.receive(timeout=10)
-        if msg and msg.get_metadata("ontology") == "disaster-event":
-            self.agent.last_event = msg.body
-            print(f"[{ts}] [RescueAgent FSM] Event received → ASSESSING")
-            self.set_next_state(STATE_ASSESSING)
-        else:
-            self.set_next_state(STATE_IDLE)
-
-
-# ── State: ASSESSING ─────────────────────────────────────────
-class AssessingState(State):
-    async def run(self):
-        ts = datetime.now().strftime("%H:%M:%S")
-        event = self.agent.last_event
-        print(f"[{ts}] [RescueAgent FSM] State=ASSESSING  "
-              f"Goal={GOAL_ASSESS}")
-        print(f"[{ts}] [RescueAgent FSM] Parsing event → {event}")
-
-        # Parse severity from message body
-        parts = dict(p.split(":") for p in event.split(";") if ":" in p)
-        severity = parts.get("SEVERITY", "LOW")
-        self.agent.severity = severity
-
-        if severity == "HIGH":
-            print(f"[{ts}] [RescueAgent FSM] HIGH severity → RESPONDING")
-            self.set_next_state(STATE_RESPONDING)
-        else:
-            print(f"[{ts}] [RescueAgent FSM] {severity} severity → MONITORING")
-            self.set_next_state(STATE_MONITORING)
-
-
-# ── State: MONITORING ────────────────────────────────────────
-class MonitoringState(State):
-    async def run(self):
-        ts = datetime.now().strftime("%H:%M:%S")
-        print(f"[{ts}] [RescueAgent FSM] State=MONITORING  "
-              f"(Watching for changes...)")
-        msg = await self.receive(timeout=4)
-        if msg and msg.get_metadata("ontology") == "disaster-event":
-            self.agent.last_event = msg.body
-            parts = dict(p.split(":") for p in msg.body.split(";") if ":" in p)
-            if parts.get("SEVERITY") == "HIGH":
-                print(f"[{ts}] [RescueAgent FSM] Escalation detected → ASSESSING")
-                self.set_next_state(STATE_ASSESSING)
-            else:
-                print(f"[{ts}] [RescueAgent FSM] Conditions stable → IDLE")
-                self.set_next_state(STATE_IDLE)
-        else:
-            print(f"[{ts}] [RescueAgent FSM] No change → IDLE")
-            self.set_next_state(STATE_IDLE)
-
-
-# ── State: RESPONDING ────────────────────────────────────────
-class RespondingState(State):
-    async def run(self):
-        ts = datetime.now().strftime("%H:%M:%S")
-        print(f"[{ts}] [RescueAgent FSM] State=RESPONDING  "
-              f"Goal={GOAL_RESCUE}")
-        print(f"[{ts}] [RescueAgent FSM] *** DISPATCHING RESCUE TEAM ***")
-        print(f"[{ts}] [RescueAgent FSM] Allocating boats, medics, supplies...")
+# What the FSM sees for each message: the event, decoded once, and the
+# conversation it belongs to
+Report = namedtuple("Report", "event thread")
+
+
+def read_report(msg):
+    """The Report carried by a disaster-event or disaster-batch message, or
+    None. For a batch this is the most severe event in the batch."""
+    ontology = msg.get_metadata("ontology")
+    try:
+        if ontology == DISASTER_EVENT.ontology:
+            return Report(DISASTER_EVENT.decode(msg.body), msg.thread)
+        if ontology == DISASTER_BATCH:
+            batch = DISASTER_EVENT.decode_batch(msg.body)
+            worst = max(batch, key=lambda e: SEVERITIES.index(e.severity))
+            return Report(worst, msg.thread)
+    except MessageError as e:
+        logger.info("[RescueAgent FSM] Unreadable event (%s) ignored", e)
+    return None
+
+
+# ── Guards and actions ───────────────────────────────────────
+def is_high(agent, report):
+    return report.event.severity == "HIGH"
+
+
+def take(agent, report):
+    agent.last_event  = report.event
+    agent.last_thread = report.thread
+    agent.severity    = report.event.severity
+    if agent.store is not None:
+        event = report.event
+        agent.store.record_event(event.severity, water=event.water, rain=event.rain,
+                                 wind=event.wind, thread=report.thread)
+    logger.info("[RescueAgent FSM] Event received → ASSESSING  Goal=%s  %s",
+                GOAL_ASSESS, report.event)
+
+
+def stable(agent, report):
+    logger.info("[RescueAgent FSM] %s severity → MONITORING", report.event.severity)
+
+
+def dispatch(agent, report):
+    logger.info("[RescueAgent FSM] *** DISPATCHING RESCUE TEAM ***  Goal=%s", GOAL_RESCUE)
+    # The operation runs on the agent's TaskPool so the FSM can go
+    # straight back to watching for new events
+    pool = agent.pool
+    incident = next(agent.incident_ids)
+    if agent.store is not None:
+        event = report.event
+        agent.store.open_incident(incident, event.severity, action="DISPATCH_RESCUE",
+                                  water=event.water, rain=event.rain, thread=report.thread)
+    pool.submit(agent.rescue_operation, context=(report.event, report.thread, incident))
+    logger.info("[RescueAgent FSM] Rescue team dispatched (%d tasks open) → IDLE",
+                pool.in_flight + pool.pending)
+
+
+def quiet(agent, report):
+    logger.info("[RescueAgent FSM] No change → IDLE")
+
+
+# ── Transition table ─────────────────────────────────────────
+# ASSESSING and RESPONDING act on the event that led there and move on
+# at once; IDLE and MONITORING wait for the next one. A non-HIGH event
+# seen while MONITORING is assessed like any other rather than dropped.
+TRANSITIONS = [
+    #          source            trigger  guard    dest              action
+    Transition(STATE_IDLE,       EVENT,   None,    STATE_ASSESSING,  take),
+    Transition(STATE_IDLE,       TIMEOUT, None,    STATE_IDLE,       None),
+    Transition(STATE_ASSESSING,  NOW,     is_high, STATE_RESPONDING, None),
+    Transition(STATE_ASSESSING,  NOW,     None,    STATE_MONITORING, stable),
+    Transition(STATE_MONITORING, EVENT,   None,    STATE_ASSESSING,  take),
+    Transition(STATE_MONITORING, TIMEOUT, None,    STATE_IDLE,       quiet),
+    Transition(STATE_RESPONDING, NOW,     None,    STATE_IDLE,       dispatch),
+]
+TIMEOUTS = {STATE_IDLE: 10, STATE_MONITORING: 4}
+
+
+class RescueFSM(TableFSM):
+    async def on_end(self):
+        await self.agent.pool.close()
+
+
+class RescueAgent(BusAgent):
+    """With a store, received events and dispatched rescues (as incidents,
+    closed with the task's outcome) are written to it."""
+
+    def __init__(self, jid, password, bus=None, max_in_flight=2, task_timeout=10.0,
+                 max_drain=100, store=None):
+        super().__init__(jid, password, bus=bus)
+        self.max_in_flight = max_in_flight
+        self.task_timeout  = task_timeout
+        self.max_drain     = max_drain
+        self.store         = store
+        self.incident_ids  = itertools.count(1)
+
+    async def rescue_operation(self):
         await asyncio.sleep(2)  # simulate rescue operation time
-        print(f"[{ts}] [RescueAgent FSM] Rescue task complete → IDLE")
-        self.set_next_state(STATE_IDLE)
 
+    async def rescue_done(self, status, context):
+        event, _, incident = context
+        logger.info("[RescueAgent] Rescue task %s → %s", status, event)
+        if self.store is not None:
+            self.store.close_incident(incident, status)
 
-# ── RescueAgent wiring ───────────────────────────────────────
-class RescueAgent(Agent):
     async def setup(self):
-        print("[RescueAgent] Starting FSM — Goals: Monitor / Assess / Rescue")
-        self.last_event = None
-        self.severity   = None
-
-        fsm = FSMBehaviour()
-        fsm.add_state(name=STATE_IDLE,       state=IdleState(),       initial=True)
-        fsm.add_state(name=STATE_ASSESSING,  state=AssessingState())
-        fsm.add_state(name=STATE_MONITORING, state=MonitoringState())
-        fsm.add_state(name=STATE_RESPONDING, state=RespondingState())
-
-        fsm.add_transition(source=STATE_IDLE,       dest=STATE_IDLE)
-        fsm.add_transition(source=STATE_IDLE,       dest=STATE_ASSESSING)
-        fsm.add_transition(source=STATE_ASSESSING,  dest=STATE_RESPONDING)
-        fsm.add_transition(source=STATE_ASSESSING,  dest=STATE_MONITORING)
-        fsm.add_transition(source=STATE_MONITORING, dest=STATE_ASSESSING)
-        fsm.add_transition(source=STATE_MONITORING, dest=STATE_IDLE)
-        fsm.add_transition(source=STATE_RESPONDING, dest=STATE_IDLE)
-
-        self.add_behaviour(fsm)
+        logger.info("[RescueAgent] Starting FSM — Goals: Monitor / Assess / Rescue")
+        self.last_event  = None
+        self.last_thread = None   # conversation id of the event being handled
+        self.severity    = None
+        if self.store is not None:
+            self.incident_ids = itertools.count(await self.store.last_incident_id() + 1)
+        self.pool = TaskPool(self.max_in_flight, self.task_timeout, on_done=self.rescue_done)
+        self.pool.start()
+        self.fsm = RescueFSM(TRANSITIONS, STATE_IDLE, read_report, timeouts=TIMEOUTS,
+                             max_drain=self.max_drain)
+        self.add_behaviour(self.fsm)
 
 
 # ══════════════════════════════════════════════════════════════
 #  MAIN
 # ══════════════════════════════════════════════════════════════
-async def main():
+async def main(local=False, batch_size=1, flush_ms=500, rescue_workers=2, duration=30,
+               store=None, capture=None, replay=None, replay_speed=1.0, status=None,
+               sample_budget=None):
     print("=" * 60)
     print("  LAB 3: Flood Response FSM — Starting Agents")
     print("=" * 60)
 
-    rescue = RescueAgent("takyisky.rescue@xmpp.jp", "rescue123")
-    sensor = SensorAgent("takyisky.sensor@xmpp.jp", "sensor123")
+    # --local: route messages in memory instead of through xmpp.jp
+    bus = LocalBus() if local else None
+    # --store PATH: keep events and incidents in a SQLite file across runs
+    store = IncidentStore(store).start() if store else None
+    # --capture PATH: record every message sent; --replay PATH: send a
+    # capture's sensor events instead of generating them
+    capture = CaptureWriter(capture).start() if capture else None
+
+    rescue = RescueAgent("takyisky.rescue@xmpp.jp", "rescue123", bus=bus,
+                         max_in_flight=rescue_workers, store=store)
+    if replay:
+        sensor = ReplayAgent("takyisky.replay@xmpp.jp", "replay123", bus=bus, path=replay,
+                             speed=replay_speed)
+    else:
+        # --sample-budget RATE: sample rate follows the trend, at most RATE/s
+        sensor = SensorAgent("takyisky.sensor@xmpp.jp", "sensor123", bus=bus,
+                             batch_size=batch_size, flush_ms=flush_ms,
+                             budget=SampleBudget(sample_budget) if sample_budget else None)
 
     await rescue.start()
     await sensor.start()
-
-    print("[Main] Agents running for 30 seconds...")
-    await asyncio.sleep(30)
-
+    # --status PORT: serve the FSM state and rescue tasks over HTTP/WebSocket
+    if status is not None:
+        status = StatusServer(port=status)
+        status.add("rescue", lambda: {"state": rescue.fsm.state, "tasks": rescue.pool.stats()})
+        await status.start()
+
+    if replay:
+        logger.info("[Main] Replaying %s...", replay)
+        await sensor.done.wait()
+    logger.info("[Main] Agents running for %g seconds...", duration)
+    await asyncio.sleep(duration)
+
+    if status is not None:
+        await status.stop()
     await sensor.stop()
     await rescue.stop()
-    print("[Main] Simulation complete.")
+    if capture is not None:
+        capture.close()
+    if not replay and sensor.batcher is not None:
+        logger.info("[Main] Sensor batches: %s", sensor.batcher.stats())
+    if not replay and sensor.sampler is not None:
+        logger.info("[Main] Sensor sampling: %s", sensor.sampler.stats())
+    logger.info("[Main] Rescue tasks: %s", rescue.pool.stats())
+    for state in (STATE_IDLE, STATE_ASSESSING, STATE_MONITORING, STATE_RESPONDING):
+        logger.info("[Main] %-10s visits=%d  mean dwell=%.2fs", state,
+                    STATE_SECONDS.count(rescue.name, state), STATE_SECONDS.mean(rescue.name, state))
+    for (agent, source, dest), n in sorted(FSM_TRANSITIONS.values.items()):
+        if agent == rescue.name:
+            logger.info("[Main] %-10s → %-10s %d", source, dest, int(n))
+    logger.info("[Main] FSM events=%d  wakeups=%d  mean drain=%.1f",
+                FSM_EVENTS.get(rescue.name), DRAIN.count(rescue.name), DRAIN.mean(rescue.name))
+    if store is not None:
+        await store.close()
+    logger.info("[Main] Simulation complete.")
 
 if __name__ == "__main__":
-    spade.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Lab 3 flood response FSM")
+    parser.add_argument("--local", action="store_true",
+                        help="run both agents on an in-process bus (no XMPP server)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="readings per sensor INFORM; 1 disables batching")
+    parser.add_argument("--flush-ms", type=int, default=500,
+                        help="max time a reading waits in a partial batch")
+    parser.add_argument("--rescue-workers", type=int, default=2,
+                        help="rescue operations the RescueAgent runs at once")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to run the agents for (default 30)")
+    parser.add_argument("--sim", action="store_true",
+                        help="headless run on a virtual clock (implies --local)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed the random generators for a reproducible run")
+    parser.add_argument("--log-level", default="INFO",
+                        help="DEBUG, INFO, WARNING, ... (default INFO)")
+    parser.add_argument("--store", metavar="PATH",
+                        help="SQLite file to keep events and incidents in across runs")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write a Prometheus text snapshot of the metrics here at exit")
+    parser.add_argument("--capture", metavar="PATH",
+                        help="append every message the agents send to this capture file")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="send the sensor events of a capture instead of random ones "
+                             "(implies --local); runs --duration seconds past its end")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay pace: 1 as recorded, N times faster, 0 as fast as "
+                             "the agents keep up (default 1)")
+    parser.add_argument("--status", type=int, metavar="PORT",
+                        help="serve live status on http://127.0.0.1:PORT/status and "
+                             "ws://127.0.0.1:PORT/ws")
+    parser.add_argument("--sample-budget", type=float, metavar="RATE",
+                        help="adapt the sensor's period to the readings' trend, sending at "
+                             "most RATE readings per second")
+    args = parser.parse_args()
+    if args.sim and args.status is not None:
+        parser.error("--status needs a real clock; it cannot be combined with --sim")
+    logs.setup(args.log_level.upper())
+    scenario = main(local=args.local or args.sim or bool(args.replay),
+                    batch_size=args.batch_size, flush_ms=args.flush_ms,
+                    rescue_workers=args.rescue_workers, duration=args.duration,
+                    store=args.store, capture=args.capture, replay=args.replay,
+                    replay_speed=args.replay_speed, status=args.status,
+                    sample_budget=args.sample_budget)
+    if args.sim:
+        simclock.run(scenario, seed=args.seed)
+    else:
+        if args.seed is not None:
+            simclock.seed_all(args.seed)
+        spade.run(scenario)
+    logs.shutdown()
+    if args.metrics:
+        REGISTRY.write(args.metrics)
\ No newline at end of file
@@ -5,214 +5,849 @@ Performatives: INFORM, REQUEST, AGREE, REFUSE
 Agents: SensorAgent, RiskAgent, CoordinatorAgent, RescueAgent
 """
 
+import argparse
 import asyncio
+import itertools
+import logging
 import random
+import sys
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
 import spade
-from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour, PeriodicBehaviour
-from spade.message import Message
-from datetime import datetime
 
-
-def ts():
-    return datetime.now().strftime("%H:%M:%S")
-
-
-def log(agent_name, performative, content, direction=""):
-    arrow = f" {direction}" if direction else ""
-    print(f"[{ts()}] [{agent_name}]{arrow} <{performative}> {content}")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.acl import Template
+from common.allocation import (
+    Allocator, Incident, Team, BOAT, MEDIC, SUPPLIES, skill_names,
+)
+from common.batching import Batcher
+from common.capture import CaptureWriter, ReplayAgent
+from common.coalesce import SAVED, CoalescingTable
+from common.dispatch import DispatchQueue
+from common import logs
+from common.metrics import REGISTRY, histogram
+from common.risk import LEVELS as RISK_LEVELS, ACTIONS as RISK_ACTIONS, RiskModel
+from common.sampling import AdaptiveSampler, SampleBudget, savings
+from common.schema import (
+    SENSOR_READING, RISK_ASSESSMENT, RESCUE_TASK, RESCUE_STATUS, SENSOR_BATCH, RISKS,
+    SensorReading, RiskAssessment, RescueTask, RescueStatus, MessageError,
+)
+from common.sharding import ShardPool
+from common.spatial import zone_position
+from common import fleet, runtime, simclock
+from common.stats import percentiles
+from common.status import StatusServer
+from common.store import IncidentStore
+from common.taskpool import TaskPool
+from common.transport import BusAgent, LocalBus, MESSAGES
+
+
+# Rescue teams the coordinator allocates: position (km), speed (km/h),
+# incidents worked at once, skills
+RESCUE_TEAMS = (
+    Team("Alpha",   (2.0, 3.0),   40, 2, BOAT | MEDIC | SUPPLIES),
+    Team("Bravo",   (15.0, 4.0),  60, 1, BOAT | SUPPLIES),
+    Team("Charlie", (8.0, 16.0),  50, 2, MEDIC | SUPPLIES),
+    Team("Delta",   (17.0, 15.0), 30, 1, SUPPLIES),
+)
+
+# Lower runs first when the RescueAgent has more tasks than free teams
+TASK_PRIORITY = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+
+
+logger = logging.getLogger("flood.lab4")
+
+# What every message of each kind shares, built once (common.acl)
+READING     = Template("inform",  "sensor-reading",    "disaster-sl")
+BATCH       = Template("inform",  SENSOR_BATCH,        "disaster-sl")
+REQUEST     = Template("request", "risk-assessment",   "disaster-sl",
+                       to="takyisky.coordinator4@xmpp.jp")
+AGREE       = Template("agree",   "task-confirmation")
+REFUSE      = Template("refuse",  "task-confirmation")
+TASK        = Template("inform",  "rescue-task",       to="takyisky.rescue4@xmpp.jp")
+STATUS      = Template("inform",  "rescue-status",     to="takyisky.coordinator4@xmpp.jp")
+
+# Coordinator replies that depend only on the risk level
+TOO_LOW     = {risk: f"REFUSED:RISK_TOO_LOW;RISK:{risk}" for risk in RISKS}
+NO_TEAM     = {risk: f"REFUSED:NO_CAPABLE_TEAM;RISK:{risk}" for risk in RISKS}
+NO_ZONE     = {risk: f"REFUSED:NO_ZONE;RISK:{risk}" for risk in RISKS}
+DISPATCHING = {risk: f"ACKNOWLEDGED:DISPATCHING;RISK:{risk}" for risk in RISKS}
+
+HANDLING = histogram("flood_handling_seconds", "Time an agent spends on one incoming message",
+                     ("agent", "performative"))
+
+
+def log(agent_name, performative, content, *args, direction=""):
+    # content is a %-template; nothing is formatted unless INFO is enabled
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[%s]%s <%s> " + content, agent_name,
+                    f" {direction}" if direction else "", performative, *args)
 
 
 # ══════════════════════════════════════════════════════════════
 #  SENSOR AGENT — INFORMs RiskAgent of conditions
 # ══════════════════════════════════════════════════════════════
-class SensorAgent(Agent):
+def read_sensors():
+    return SensorReading(random.randint(0, 10),     # water level (m)
+                         random.randint(0, 200),    # rainfall (mm/h)
+                         random.randint(0, 100))    # wind (km/h)
+
+
+class SensorAgent(BusAgent):
+    """batch_size > 1 buffers readings and sends them as one sensor-batch
+    INFORM once batch_size readings are queued or the oldest has waited
+    flush_ms, whichever comes first.
+
+    With a budget shared by the fleet, the sensor samples faster while its
+    zone's trend (the RiskAgent's RiskModel, kept here too) is HIGH or
+    CRITICAL or the readings are moving, and backs off towards a floor
+    rate while they are calm (common/sampling.py). The budget caps the
+    readings per second the fleet asks of the RiskAgents."""
+
+    def __init__(self, jid, password, bus=None, period=4, batch_size=1, flush_ms=500,
+                 zone=None, risk_pool=None, budget=None):
+        super().__init__(jid, password, bus=bus)
+        self.period  = period
+        self.zone    = zone or self.name
+        # With a pool, readings go to the RiskAgent shard that owns our zone
+        self.risk_pool = risk_pool
+        self.batcher = Batcher(batch_size, flush_ms / 1000) if batch_size > 1 else None
+        self.sampler = None
+        if budget is not None:
+            self.sampler = AdaptiveSampler(period, budget=budget, agent=self.name)
+            self.trend = RiskModel()
+        self.sent    = itertools.count()
+
+    def conversation(self):
+        """Fresh conversation id; every message caused by this INFORM carries it"""
+        return f"{self.name}-{next(self.sent)}"
 
     class BroadcastBehaviour(PeriodicBehaviour):
         async def run(self):
-            water   = random.randint(0, 10)
-            rain    = random.randint(0, 200)
-            wind    = random.randint(0, 100)
+            reading = read_sensors()
+
+            # Next reading sooner while the trend looks bad, later while
+            # calm; one noisy reading moves the trend only a little
+            sampler = self.agent.sampler
+            if sampler is not None:
+                now = asyncio.get_running_loop().time()
+                code, _ = self.agent.trend.update(self.agent.zone, reading.water, reading.rain,
+                                                  now)
+                self.period = sampler.observe(code, (reading.water, reading.rain), now)
+
+            if self.agent.batcher is not None:
+                batch = self.agent.batcher.add(reading)
+                if batch:
+                    await self.agent.send_batch(self, batch)
+                return
+
+            await self.agent.send_reading(self, self.agent.zone, reading)
 
-            body = f"WATER:{water};RAIN:{rain};WIND:{wind}"
+        async def on_end(self):
+            if self.agent.sampler is not None:
+                self.agent.sampler.close()
 
-            msg = Message(to="takyisky.risk4@xmpp.jp")  # RiskAgent's JID
-            msg.set_metadata("performative", "inform")
-            msg.set_metadata("ontology",     "sensor-reading")
-            msg.set_metadata("language",     "disaster-sl")
-            msg.body = body
+    class FlushBehaviour(CyclicBehaviour):
+        # Sends batches that reach flush_ms before they fill up
+        async def run(self):
+            batch = await self.agent.batcher.flush_due()
+            await self.agent.send_batch(self, batch)
 
-            log("SensorAgent", "INFORM", f"→ RiskAgent | {body}", "→")
-            await self.send(msg)
+    async def risk_jid(self, zone=None):
+        if self.risk_pool is None:
+            return "takyisky.risk4@xmpp.jp"  # RiskAgent's JID
+        return await self.risk_pool.route(zone or self.zone)
+
+    async def send_reading(self, behaviour, zone, reading):
+        body = SENSOR_READING.encode(reading)
+        msg = READING.make(self.jid, body, self.conversation(), to=await self.risk_jid(zone),
+                           zone=zone)
+
+        log("SensorAgent", "INFORM", "→ RiskAgent | %s", body, direction="→")
+        await behaviour.send(msg)
+
+    async def send_batch(self, behaviour, batch):
+        msg = BATCH.make(self.jid, SENSOR_READING.encode_batch(batch), self.conversation(),
+                         to=await self.risk_jid(), zone=self.zone)
+
+        log("SensorAgent", "INFORM", "→ RiskAgent | batch of %d readings", len(batch),
+            direction="→")
+        await behaviour.send(msg)
 
     async def setup(self):
-        print(f"[{ts()}] [SensorAgent] Started")
-        self.add_behaviour(self.BroadcastBehaviour(period=4))
+        logger.info("[SensorAgent] Started")
+        self.add_behaviour(self.BroadcastBehaviour(period=self.period))
+        if self.batcher is not None:
+            self.add_behaviour(self.FlushBehaviour())
+
+
+class VirtualSensorAgent(SensorAgent):
+    """Many sensors, one per zone, behind one agent and one connection.
+    Every zone reports once per period as its own sensor would (the
+    RiskAgent keeps each zone's trend apart); the zones take turns over
+    `ticks` evenly spaced sends so the load arrives smoothly, not as one
+    burst per period."""
+
+    def __init__(self, jid, password, bus=None, period=4, zones=(), risk_pool=None, ticks=10):
+        super().__init__(jid, password, bus=bus, period=period,
+                         zone=zones[0] if zones else None, risk_pool=risk_pool)
+        self.zones = list(zones)
+        self.ticks = max(1, min(ticks, len(self.zones)))
+        self.turn  = itertools.cycle(range(self.ticks))
+
+    class BroadcastBehaviour(PeriodicBehaviour):
+        async def run(self):
+            agent = self.agent
+            for zone in agent.zones[next(agent.turn)::agent.ticks]:
+                await agent.send_reading(self, zone, read_sensors())
+
+    async def setup(self):
+        logger.info("[SensorAgent] Started %d virtual sensors", len(self.zones))
+        self.add_behaviour(self.BroadcastBehaviour(period=self.period / self.ticks))
 
 
 # ══════════════════════════════════════════════════════════════
 #  RISK AGENT — receives INFORM, sends REQUEST to Coordinator
 # ══════════════════════════════════════════════════════════════
-class RiskAgent(Agent):
+def sensor_key(msg):
+    """Which sensor's history a reading belongs to: one sensor per zone"""
+    return msg.get_metadata("zone") or str(msg.sender.bare)
 
-    class AssessBehaviour(CyclicBehaviour):
-        async def run(self):
-            msg = await self.receive(timeout=6)
-            if not msg:
-                return
 
-            if msg.get_metadata("ontology") == "sensor-reading":
-                parts    = dict(p.split(":") for p in msg.body.split(";") if ":" in p)
-                water    = int(parts.get("WATER", 0))
-                rain     = int(parts.get("RAIN",  0))
-
-                # Risk classification
-                if water >= 7 or rain >= 150:
-                    risk  = "CRITICAL"
-                    action = "DISPATCH_RESCUE"
-                elif water >= 4 or rain >= 80:
-                    risk  = "HIGH"
-                    action = "ALERT_TEAMS"
-                else:
-                    risk  = "LOW"
-                    action = "CONTINUE_MONITORING"
+@lru_cache(maxsize=4096)
+def assessment_body(risk, action, water, rain):
+    """Encoded risk-assessment for one classified reading. Readings are
+    small integers and recur, and so do these bodies."""
+    return RISK_ASSESSMENT.encode(RiskAssessment(risk, action, water, rain))
+
 
-                log("RiskAgent", "INFORM(recv)", f"← SensorAgent | {msg.body}")
-                log("RiskAgent", "Assessment",   f"Risk={risk}  Action={action}")
+class RiskAgent(BusAgent):
+    """Classifies each sensor's readings on their recent trend (RiskModel):
+    smoothed level, rate of rise and rainfall over the last few minutes.
 
-                # REQUEST CoordinatorAgent to act
-                req = Message(to="takyisky.coordinator4@xmpp.jp")
-                req.set_metadata("performative", "request")
-                req.set_metadata("ontology",     "risk-assessment")
-                req.set_metadata("language",     "disaster-sl")
-                req.body = f"RISK:{risk};ACTION:{action};WATER:{water};RAIN:{rain}"
+    A REQUEST for a zone and risk level already requested in the last
+    request_ttl seconds is not sent again, unless the coordinator refused
+    the earlier one for a full queue.
 
-                log("RiskAgent", "REQUEST", f"→ CoordinatorAgent | {req.body}", "→")
-                await self.send(req)
+    Shards of a ShardPool in one process should share one model and one
+    requested table, so a zone moved to another shard by a reshard keeps
+    its trend and its recent requests."""
+
+    def __init__(self, jid, password, bus=None, model=None, requested=None, request_ttl=30.0):
+        super().__init__(jid, password, bus=bus)
+        self.model = model or RiskModel()
+        self.requested = requested if requested is not None else CoalescingTable(request_ttl)
+
+    class AssessBehaviour(CyclicBehaviour):
+        async def run(self):
+            msg = await self.receive(timeout=6)
+            if msg:
+                with HANDLING.time(self.agent.name, msg.get_metadata("performative")):
+                    await self.handle(msg)
+
+        async def handle(self, msg):
+            ontology = msg.get_metadata("ontology")
+            if ontology == "task-confirmation":
+                # A full queue is worth retrying: let the next reading ask again
+                if msg.get_metadata("performative") == "refuse" and "QUEUE_FULL" in msg.body:
+                    self.agent.requested.pop((msg.get_metadata("zone"), msg.get_metadata("risk")))
+
+            elif ontology == "sensor-reading":
+                try:
+                    reading = SENSOR_READING.decode(msg.body)
+                except MessageError as e:
+                    log("RiskAgent", "INFORM(recv)", "← %s | rejected: %s", msg.sender, e)
+                    return
+                water    = reading.water
+                rain     = reading.rain
+
+                # Risk classification on this sensor's trend
+                code, trend = self.agent.model.update(
+                    sensor_key(msg), water, rain, asyncio.get_running_loop().time())
+                risk, action = RISK_LEVELS[code], RISK_ACTIONS[code]
+
+                log("RiskAgent", "INFORM(recv)", "← SensorAgent | %s", msg.body)
+                log("RiskAgent", "Assessment",   "Risk=%s  Action=%s  (level %.1fm, "
+                    "rise %+.1fm/h, rain %.0fmm/h)", risk, action, trend.ewma, trend.rise,
+                    trend.rain_rate)
+
+                await self.agent.request_action(self, msg.get_metadata("zone"),
+                                                risk, action, water, rain, msg.thread)
+
+            elif ontology == SENSOR_BATCH:
+                try:
+                    batch = SENSOR_READING.decode_batch(msg.body)
+                except MessageError as e:
+                    log("RiskAgent", "INFORM(recv)", "← %s | rejected: %s", msg.sender, e)
+                    return
+
+                # Readings in a batch are spread over the time since the
+                # sensor's previous message, then classified on the trend
+                readings = np.array(batch)
+                codes    = self.agent.model.update_batch(
+                    sensor_key(msg), readings[:, 0].tolist(), readings[:, 1].tolist(),
+                    asyncio.get_running_loop().time())
+                counts   = np.bincount(codes, minlength=len(RISK_LEVELS))
+
+                log("RiskAgent", "INFORM(recv)", "← SensorAgent | batch of %d readings", len(batch))
+                log("RiskAgent", "Assessment",   "LOW=%d  HIGH=%d  CRITICAL=%d", *counts.tolist())
+
+                # LOW readings need no action; only escalate the rest.
+                # Each escalation is its own conversation: <batch id>/<index>
+                for i in np.flatnonzero(codes).tolist():
+                    code = codes[i]
+                    await self.agent.request_action(
+                        self, msg.get_metadata("zone"), RISK_LEVELS[code], RISK_ACTIONS[code],
+                        batch[i].water, batch[i].rain,
+                        f"{msg.thread}/{i}" if msg.thread else None)
+
+    async def request_action(self, behaviour, zone, risk, action, water, rain, thread=None):
+        key = (zone, risk)
+        now = asyncio.get_running_loop().time()
+        if self.requested.get(key, now) is not None:
+            SAVED.inc(self.name, "message")
+            return
+        self.requested.put(key, key, now)
+
+        # REQUEST CoordinatorAgent to act
+        req = REQUEST.make(self.jid, assessment_body(risk, action, water, rain), thread)
+        if zone:
+            req.set_metadata("zone", zone)
+
+        log("RiskAgent", "REQUEST", "→ CoordinatorAgent | %s", req.body, direction="→")
+        await behaviour.send(req)
 
     async def setup(self):
-        print(f"[{ts()}] [RiskAgent] Started")
+        logger.info("[RiskAgent] Started")
         self.add_behaviour(self.AssessBehaviour())
 
 
 # ══════════════════════════════════════════════════════════════
 #  COORDINATOR AGENT — receives REQUEST, sends INFORM to Rescue
 # ══════════════════════════════════════════════════════════════
-class CoordinatorAgent(Agent):
+class CoordinatorAgent(BusAgent):
+    """Accepted requests wait in a priority queue (CRITICAL > HIGH, then
+    higher water, then older) and are dispatched to the closest free team
+    with the skills they need (boat for deep water, medic for CRITICAL).
+    A full queue answers REFUSE with a RETRY_AFTER hint instead of
+    growing without bound.
+
+    A request for a zone and risk level that already has an incident
+    open (or opened in the last coalesce_ttl seconds) is folded into that
+    incident: AGREE COALESCED, no new dispatch. A request with no zone is
+    refused (NO_ZONE): there is nowhere to send a team to. Incident ids
+    are only used up by requests that queue a new incident.
+
+    With a store, every request is recorded as an event and every
+    accepted one as an incident (opened, assigned, closed); on start the
+    coordinator re-queues the incidents a previous run left open."""
+
+    def __init__(self, jid, password, bus=None, teams=RESCUE_TEAMS, queue_limit=100,
+                 store=None, coalesce_ttl=60.0):
+        super().__init__(jid, password, bus=bus)
+        self.allocator = Allocator(teams)
+        self.queue     = DispatchQueue(queue_limit)
+        self.store     = store
+        self.open_incidents = CoalescingTable(coalesce_ttl)   # (zone, risk) -> incident id
+        self.next_incident = 1      # only a queued incident uses an id up
 
     class CoordinateBehaviour(CyclicBehaviour):
         async def run(self):
             msg = await self.receive(timeout=8)
-            if not msg:
-                return
+            if msg:
+                with HANDLING.time(self.agent.name, msg.get_metadata("performative")):
+                    await self.handle(msg)
 
+        async def handle(self, msg):
             perf = msg.get_metadata("performative")
 
             # ── Handle incoming REQUEST from RiskAgent ──
             if perf == "request" and msg.get_metadata("ontology") == "risk-assessment":
-                parts  = dict(p.split(":") for p in msg.body.split(";") if ":" in p)
-                risk   = parts.get("RISK",   "LOW")
-                action = parts.get("ACTION", "CONTINUE_MONITORING")
-
-                log("CoordinatorAgent", "REQUEST(recv)", f"← RiskAgent | {msg.body}")
-
+                try:
+                    assessment = RISK_ASSESSMENT.decode(msg.body)
+                except MessageError as e:
+                    log("CoordinatorAgent", "REQUEST(recv)", "← %s | rejected: %s", msg.sender, e)
+                    return
+                risk   = assessment.risk
+                zone   = msg.get_metadata("zone")
+
+                # Any RiskAgent shard may send this; replies go back to msg.sender
+                log("CoordinatorAgent", "REQUEST(recv)", "← RiskAgent[%s] | %s",
+                    msg.sender.node, msg.body)
+                if not zone:
+                    # REFUSE — nowhere to send a team, and nothing to coalesce on
+                    await self.reply(msg, REFUSE, NO_ZONE[risk], risk)
+                    return
+                incident = Incident(self.agent.next_incident, zone, zone_position(zone),
+                                    risk, assessment.water)
+                store = self.agent.store
+                if store is not None:
+                    store.record_event(risk, zone, assessment.water, assessment.rain,
+                                       source=msg.sender.node, thread=msg.thread)
+
+                now = asyncio.get_running_loop().time()
+                existing = None
                 if risk in ("CRITICAL", "HIGH"):
-                    # AGREE and forward task to RescueAgent
-                    agree = Message(to=str(msg.sender))
-                    agree.set_metadata("performative", "agree")
-                    agree.set_metadata("ontology",     "task-confirmation")
-                    agree.body = f"ACKNOWLEDGED:DISPATCHING;RISK:{risk}"
-                    await self.send(agree)
-                    log("CoordinatorAgent", "AGREE", f"→ RiskAgent | {agree.body}", "→")
-
-                    # Inform RescueAgent
-                    task = Message(to="takyisky.rescue4@xmpp.jp")
-                    task.set_metadata("performative", "inform")
-                    task.set_metadata("ontology",     "rescue-task")
-                    task.body = f"ACTION:{action};RISK:{risk};WATER:{parts.get('WATER')}"
-                    await self.send(task)
-                    log("CoordinatorAgent", "INFORM", f"→ RescueAgent | {task.body}", "→")
+                    existing = self.agent.open_incidents.get((zone, risk), now)
 
-                else:
+                if risk not in ("CRITICAL", "HIGH"):
                     # REFUSE — risk too low to dispatch
-                    refuse = Message(to=str(msg.sender))
-                    refuse.set_metadata("performative", "refuse")
-                    refuse.set_metadata("ontology",     "task-confirmation")
-                    refuse.body = f"REFUSED:RISK_TOO_LOW;RISK:{risk}"
-                    await self.send(refuse)
-                    log("CoordinatorAgent", "REFUSE", f"→ RiskAgent | {refuse.body}", "→")
+                    await self.reply(msg, REFUSE, TOO_LOW[risk], risk)
+
+                elif existing is not None:
+                    # AGREE — already being handled, nothing new to dispatch
+                    SAVED.inc(self.agent.name, "dispatch")
+                    await self.reply(msg, AGREE, f"ACKNOWLEDGED:COALESCED;RISK:{risk};"
+                                                 f"INCIDENT:{existing}", risk)
+
+                elif not self.agent.allocator.can_serve(incident):
+                    # REFUSE — no team has the skills, waiting would not help
+                    await self.reply(msg, REFUSE, NO_TEAM[risk], risk)
+
+                elif self.agent.queue.push((incident, assessment, msg.thread), risk,
+                                           assessment.water):
+                    # AGREE — queued, dispatched when a rescue team is free
+                    self.agent.next_incident += 1
+                    self.agent.open_incidents.put((zone, risk), incident.id, now, hold=True)
+                    if store is not None:
+                        store.open_incident(incident.id, risk, zone, assessment.action,
+                                            assessment.water, assessment.rain, msg.thread)
+                    await self.reply(msg, AGREE, DISPATCHING[risk], risk)
+                    await self.dispatch()
+
+                else:
+                    # REFUSE — backpressure, ask the RiskAgent to retry later
+                    await self.reply(msg, REFUSE, f"REFUSED:QUEUE_FULL;RISK:{risk};"
+                                                  f"RETRY_AFTER:{self.agent.retry_after()}", risk)
 
             # ── Handle INFORM (status update) from RescueAgent ──
             elif perf == "inform" and msg.get_metadata("ontology") == "rescue-status":
-                log("CoordinatorAgent", "INFORM(recv)", f"← RescueAgent | {msg.body}")
+                log("CoordinatorAgent", "INFORM(recv)", "← RescueAgent[%s] | %s",
+                    msg.get_metadata("team"), msg.body)
+                incident_id = msg.get_metadata("incident")
+                if incident_id:
+                    self.agent.allocator.release(int(incident_id))
+                    self.agent.open_incidents.release(int(incident_id),
+                                                      asyncio.get_running_loop().time())
+                    if self.agent.store is not None:
+                        try:
+                            outcome = RESCUE_STATUS.decode(msg.body).status
+                        except MessageError:
+                            outcome = "UNKNOWN"
+                        self.agent.store.close_incident(int(incident_id), outcome)
+                await self.dispatch()
+
+        async def reply(self, msg, template, body, risk):
+            # zone and risk let the RiskAgent match the reply to its request
+            zone = msg.get_metadata("zone")
+            metadata = {"zone": zone, "risk": risk} if zone else {"risk": risk}
+            await self.send(template.make(self.agent.jid, body, msg.thread, to=msg.sender,
+                                          **metadata))
+            log("CoordinatorAgent", template.performative.upper(), "→ RiskAgent | %s", body,
+                direction="→")
+
+        async def dispatch(self):
+            # One request waiting: the free team that arrives soonest. More
+            # (teams were all busy, or a burst came in): re-plan the whole
+            # queue for the least total weighted response time, so an early
+            # request does not take the team a later, heavier one needed
+            agent = self.agent
+            allocator = agent.allocator
+            if not agent.queue or not allocator.free_slots:
+                return
+            if len(agent.queue) == 1:
+                taken = agent.queue.take(lambda item: allocator.assign(item[0]))
+            else:
+                plan = allocator.plan([incident for incident, _, _ in agent.queue.items()])
+                taken = agent.queue.take(
+                    lambda item: allocator.commit(item[0], plan[item[0].id]))
+            for (incident, assessment, thread), team in taken:
+                if agent.store is not None:
+                    agent.store.assign(incident.id, team.id)
+
+                # Inform RescueAgent
+                task = TASK.make(agent.jid, RESCUE_TASK.encode(
+                    RescueTask(assessment.action, assessment.risk, assessment.water)), thread,
+                    zone=incident.zone, team=team.id, incident=str(incident.id))
+                await self.send(task)
+                if logger.isEnabledFor(logging.INFO):
+                    log("CoordinatorAgent", "INFORM", "→ RescueAgent | %s | team %s (%s) → %s, "
+                        "ETA %.0f min", task.body, team.id, skill_names(team.skills), incident.zone,
+                        agent.allocator.eta_hours(incident, team) * 60, direction="→")
+
+    def retry_after(self):
+        """Seconds a refused sender should wait: the recent p95 queue wait"""
+        p95 = percentiles(self.queue.waits).get(95, 0)
+        return max(1, round(p95))
+
+    def status(self):
+        """Queue depth and the incidents still open, queued or with a team"""
+        teams, assigned = self.allocator.teams, self.allocator.assigned
+        return {
+            "queue": self.queue.stats(),
+            "incidents": [{"id": incident, "zone": zone, "risk": risk,
+                           "team": teams[assigned[incident]].id if incident in assigned else None}
+                          for (zone, risk), incident in sorted(self.open_incidents.held(),
+                                                               key=lambda held: held[1])],
+        }
+
+    async def restore(self):
+        """Continue incident ids and re-queue open incidents from the store"""
+        self.next_incident = await self.store.last_incident_id() + 1
+        restored = 0
+        for row in reversed(await self.store.open_incidents()):
+            incident = Incident(row.id, row.zone, zone_position(row.zone), row.risk, row.water)
+            assessment = RiskAssessment(row.risk, row.action, row.water, row.rain)
+            if self.queue.push((incident, assessment, row.thread), row.risk, row.water):
+                self.open_incidents.put((row.zone, row.risk), row.id,
+                                        asyncio.get_running_loop().time(), hold=True)
+                restored += 1
+        if restored:
+            logger.info("[CoordinatorAgent] Restored %d open incidents from the store", restored)
 
     async def setup(self):
-        print(f"[{ts()}] [CoordinatorAgent] Started")
+        logger.info("[CoordinatorAgent] Started")
+        if self.store is not None:
+            await self.restore()
         self.add_behaviour(self.CoordinateBehaviour())
 
 
 # ══════════════════════════════════════════════════════════════
 #  RESCUE AGENT — receives task INFORM, sends status INFORM back
 # ══════════════════════════════════════════════════════════════
-class RescueAgent(Agent):
+class RescueAgent(BusAgent):
+    """Tasks run on a bounded TaskPool so the agent keeps reading its
+    mailbox while earlier rescues are under way. CRITICAL tasks jump the
+    queue; each task is limited to task_timeout seconds."""
+
+    def __init__(self, jid, password, bus=None, max_in_flight=4, task_timeout=10.0):
+        super().__init__(jid, password, bus=bus)
+        self.max_in_flight = max_in_flight
+        self.task_timeout  = task_timeout
+        self.pool = None
 
     class ExecuteBehaviour(CyclicBehaviour):
+        async def on_start(self):
+            self.agent.pool = TaskPool(self.agent.max_in_flight, self.agent.task_timeout,
+                                       on_done=self.report)
+            self.agent.pool.start()
+
+        async def on_end(self):
+            await self.agent.pool.close()
+
         async def run(self):
             msg = await self.receive(timeout=10)
-            if not msg:
-                return
+            if msg:
+                with HANDLING.time(self.agent.name, msg.get_metadata("performative")):
+                    await self.handle(msg)
 
+        async def handle(self, msg):
             if msg.get_metadata("ontology") == "rescue-task":
-                log("RescueAgent", "INFORM(recv)", f"← CoordinatorAgent | {msg.body}")
-
-                parts  = dict(p.split(":") for p in msg.body.split(";") if ":" in p)
-                action = parts.get("ACTION", "CONTINUE_MONITORING")
-                risk   = parts.get("RISK",   "LOW")
-
-                print(f"[{ts()}] [RescueAgent] *** Executing: {action}  (Risk={risk}) ***")
-                await asyncio.sleep(1.5)  # simulate execution
-
-                # Send status update back to coordinator
-                status = Message(to="takyisky.coordinator4@xmpp.jp")
-                status.set_metadata("performative", "inform")
-                status.set_metadata("ontology",     "rescue-status")
-                status.body = f"STATUS:COMPLETE;ACTION:{action};RISK:{risk}"
-                await self.send(status)
-                log("RescueAgent", "INFORM", f"→ CoordinatorAgent | {status.body}", "→")
+                log("RescueAgent", "INFORM(recv)", "← CoordinatorAgent | %s", msg.body)
+
+                try:
+                    task = RESCUE_TASK.decode(msg.body)
+                except MessageError as e:
+                    log("RescueAgent", "INFORM(recv)", "← %s | rejected: %s", msg.sender, e)
+                    return
+
+                team = msg.get_metadata("team")
+                self.agent.pool.submit(lambda: self.agent.execute(task, team),
+                                       priority=TASK_PRIORITY.get(task.risk, 9),
+                                       context=(task, msg))
+
+        async def report(self, outcome, context):
+            # Send status update back to coordinator as each task finishes;
+            # team and incident tell it which team is free again
+            task, request = context
+            status = STATUS.make(self.agent.jid, RESCUE_STATUS.encode(
+                RescueStatus(outcome, task.action, task.risk)), request.thread,
+                **{key: request.get_metadata(key) for key in ("team", "incident")
+                   if request.get_metadata(key)})
+            await self.send(status)
+            log("RescueAgent", "INFORM", "→ CoordinatorAgent | %s", status.body, direction="→")
+
+    async def execute(self, task, team=None):
+        logger.info("[RescueAgent] *** Executing: %s  (Risk=%s, Team=%s) ***",
+                    task.action, task.risk, team)
+        await asyncio.sleep(1.5)  # simulate execution
 
     async def setup(self):
-        print(f"[{ts()}] [RescueAgent] Started")
+        logger.info("[RescueAgent] Started")
         self.add_behaviour(self.ExecuteBehaviour())
 
 
 # ══════════════════════════════════════════════════════════════
 #  MAIN
 # ══════════════════════════════════════════════════════════════
-async def main():
+async def main(local=False, period=4, batch_size=1, flush_ms=500, sensors=1, risk_shards=1,
+               rescue_workers=4, task_timeout=10.0, queue_limit=100, duration=40, store=None,
+               sensors_per_agent=1, start_parallelism=64, capture=None, replay=None,
+               replay_speed=1.0, status=None, sample_budget=None):
     print("=" * 65)
     print("  LAB 4: FIPA-ACL Communication — Flood Response System")
     print("  Performatives: INFORM | REQUEST | AGREE | REFUSE")
     print("=" * 65)
 
-    rescue      = RescueAgent(     "takyisky.rescue4@xmpp.jp",      "rescue123")
-    coordinator = CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123")
-    risk        = RiskAgent(       "takyisky.risk4@xmpp.jp",        "risk123")
-    sensor      = SensorAgent(     "takyisky.sensor4@xmpp.jp",      "sensor123")
+    # --local: route messages in memory instead of through xmpp.jp
+    bus = LocalBus() if local else None
+    # --store PATH: keep events and incidents in a SQLite file across runs
+    store = IncidentStore(store).start() if store else None
+    # --capture PATH: record every message sent; --replay PATH: send a
+    # capture's sensor readings instead of generating them
+    capture = CaptureWriter(capture).start() if capture else None
+
+    rescue      = RescueAgent(     "takyisky.rescue4@xmpp.jp",      "rescue123", bus=bus,
+                                   max_in_flight=rescue_workers, task_timeout=task_timeout)
+    coordinator = CoordinatorAgent("takyisky.coordinator4@xmpp.jp", "coord123",  bus=bus,
+                                   queue_limit=queue_limit, store=store)
+
+    # --risk-shards N: RiskAgents risk4-0 .. risk4-<N-1>, readings routed by
+    # zone; they share the trends and recent requests, which need not move
+    # when the pool is resized
+    if risk_shards > 1:
+        model, requested = RiskModel(), CoalescingTable(30.0)
+        risk_pool = ShardPool(lambda jid: RiskAgent(jid, "risk123", bus=bus, model=model,
+                                                    requested=requested),
+                              "takyisky.risk4-{}@xmpp.jp")
+        risk = None
+    else:
+        risk_pool = None
+        risk = RiskAgent("takyisky.risk4@xmpp.jp", "risk123", bus=bus)
+
+    # --sensors N, one zone each; --sensors-per-agent K hosts K on one agent
+    if sensors_per_agent > 1:
+        sensor_fleet = fleet.FleetSpec(VirtualSensorAgent, sensors, "takyisky.sensor4-{}@xmpp.jp",
+                                       "sensor123", period, per_agent=sensors_per_agent)
+    else:
+        # --sample-budget RATE: each sensor's rate follows its zone's trend,
+        # the whole fleet's held to RATE readings per second
+        budget = SampleBudget(sample_budget) if sample_budget else None
+        sensor_fleet = fleet.FleetSpec(
+            SensorAgent, sensors,
+            "takyisky.sensor4@xmpp.jp" if sensors == 1 else "takyisky.sensor4-{}@xmpp.jp",
+            "sensor123", period, kwargs={"batch_size": batch_size, "flush_ms": flush_ms,
+                                         "budget": budget})
 
     # Start in reverse dependency order
     await rescue.start()
     await coordinator.start()
-    await risk.start()
-    await sensor.start()
-
-    print(f"[{ts()}] [Main] All agents running for 40 seconds...")
-    await asyncio.sleep(40)
-
-    await sensor.stop()
-    await risk.stop()
+    if risk_pool is not None:
+        for _ in range(risk_shards):
+            await risk_pool.add_shard()
+    else:
+        await risk.start()
+    # --status PORT: serve the queue and open incidents over HTTP/WebSocket
+    if status is not None:
+        status = StatusServer(port=status)
+        status.add("coordinator", coordinator.status)
+        # The pool appears once ExecuteBehaviour has started
+        status.add("rescue", lambda: rescue.pool.stats() if rescue.pool is not None else None)
+        await status.start()
+    if replay:
+        # Readings go to the RiskAgent that owns their zone in this run,
+        # whichever one they were sent to when captured
+        async def route(msg):
+            if risk_pool is None:
+                return "takyisky.risk4@xmpp.jp"
+            return await risk_pool.route(msg.get_metadata("zone"))
+
+        replayer = ReplayAgent("takyisky.replay4@xmpp.jp", "replay123", bus=bus, path=replay,
+                               speed=replay_speed, route=route)
+        await replayer.start()
+        sensor_agents = [replayer]
+        logger.info("[Main] Replaying %s...", replay)
+        await replayer.done.wait()
+    else:
+        sensor_agents = await fleet.launch(sensor_fleet, start_parallelism,
+                                           bus=bus, risk_pool=risk_pool)
+
+    logger.info("[Main] All agents running for %g seconds...", duration)
+    await asyncio.sleep(duration)
+
+    if status is not None:
+        await status.stop()
+    await fleet.stop(sensor_agents)
+    if risk_pool is not None:
+        await risk_pool.stop()
+    else:
+        await risk.stop()
     await coordinator.stop()
     await rescue.stop()
-    print(f"[{ts()}] [Main] Simulation complete.")
+    if capture is not None:
+        capture.close()
+    for sensor in sensor_agents:
+        if getattr(sensor, "batcher", None) is not None:
+            logger.info("[Main] %s batches: %s", sensor.name, sensor.batcher.stats())
+    samplers = [sensor.sampler for sensor in sensor_agents
+                if getattr(sensor, "sampler", None) is not None]
+    if samplers:
+        logger.info("[Main] Sensor sampling vs fixed %gs period: %s", period, savings(samplers))
+    agreed  = MESSAGES.get(coordinator.name, "out", "agree")
+    refused = MESSAGES.get(coordinator.name, "out", "refuse")
+    logger.info("[Main] Coordinator: AGREE %d / REFUSE %d (%.0f%% agreed)", agreed, refused,
+                100 * agreed / (agreed + refused) if agreed + refused else 0)
+    logger.info("[Main] Coalesced: %d REQUESTs not sent, %d dispatches saved",
+                sum(n for (_, kind), n in SAVED.values.items() if kind == "message"),
+                SAVED.get(coordinator.name, "dispatch"))
+    logger.info("[Main] Dispatch queue: %s", coordinator.queue.stats())
+    logger.info("[Main] Rescue tasks: %s", rescue.pool.stats())
+    logger.info("[Main] Teams still assigned: %d", len(coordinator.allocator.assigned))
+    if store is not None:
+        await store.flush()
+        recent = await store.open_incidents(risk="CRITICAL", within=600)
+        logger.info("[Main] Store: %d open CRITICAL incidents in the last 10 minutes "
+                    "(%s)", len(recent), ", ".join(sorted({r.zone for r in recent})) or "none")
+        await store.close()
+    logger.info("[Main] Simulation complete.")
+
+
+def topology(workers, sensors=1, period=4, batch_size=1, flush_ms=500, rescue_workers=4,
+             task_timeout=10.0, queue_limit=100):
+    """Placement for --workers N: coordinator and rescue share a process,
+    the sensors share one, and every other worker runs a RiskAgent shard
+    (at least one); with fewer than three workers the groups double up"""
+    shards = [f"takyisky.risk4-{i}@xmpp.jp" for i in range(max(1, workers - 2))]
+    groups = [
+        [{"agent": "lab4_fipa_acl:RescueAgent", "jid": "takyisky.rescue4@xmpp.jp",
+          "password": "rescue123",
+          "kwargs": {"max_in_flight": rescue_workers, "task_timeout": task_timeout}},
+         {"agent": "lab4_fipa_acl:CoordinatorAgent", "jid": "takyisky.coordinator4@xmpp.jp",
+          "password": "coord123", "kwargs": {"queue_limit": queue_limit}}],
+        [{"agent": "lab4_fipa_acl:SensorAgent", "jid": f"takyisky.sensor4-{i}@xmpp.jp",
+          "password": "sensor123",
+          "kwargs": {"period": period, "batch_size": batch_size, "flush_ms": flush_ms,
+                     "zone": f"Zone_{i}"},
+          "routes": {"risk_pool": shards}}
+         for i in range(sensors)],
+    ]
+    groups[1:1] = [[{"agent": "lab4_fipa_acl:RiskAgent", "jid": jid, "password": "risk123"}]
+                   for jid in shards]
+    placed = {f"worker-{i}": [] for i in range(min(workers, len(groups)))}
+    for i, group in enumerate(groups):
+        placed[f"worker-{i % len(placed)}"].extend(group)
+    return {"path": ["lab4"], "workers": placed}
+
+
+def run_workers(topology, duration, log_level="INFO"):
+    """Run a topology in worker processes and log totals across them"""
+    supervisor = runtime.Supervisor(topology, log_level=log_level)
+    logger.info("[Main] %d worker processes running for %g seconds...",
+                len(topology["workers"]), duration)
+    supervisor.run(duration)
+    agreed  = supervisor.total("flood_messages_total", direction="out", performative="agree")
+    refused = supervisor.total("flood_messages_total", direction="out", performative="refuse")
+    risk = [spec["jid"].split("@")[0] for specs in topology["workers"].values()
+            for spec in specs if spec["agent"].endswith(":RiskAgent")]
+    logger.info("[Main] INFORMs assessed by %d RiskAgents: %d", len(risk),
+                sum(supervisor.total("flood_handling_seconds_count", agent=name,
+                                     performative="inform") for name in risk))
+    logger.info("[Main] Coordinator: AGREE %d / REFUSE %d (%.0f%% agreed)", agreed, refused,
+                100 * agreed / (agreed + refused) if agreed + refused else 0)
+    logger.info("[Main] Messages between workers: %d sent, %d lost, %d dropped",
+                supervisor.total("flood_bridge_frames_total", outcome="sent"),
+                supervisor.total("flood_bridge_frames_total", outcome="lost"),
+                supervisor.total("flood_bridge_frames_total", outcome="dropped"))
+    logger.info("[Main] Worker restarts: %d", sum(runtime.RESTARTS.values.values()))
+    supervisor.cleanup()
+    logger.info("[Main] Simulation complete.")
 
 if __name__ == "__main__":
-    spade.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Lab 4 FIPA-ACL flood response")
+    parser.add_argument("--local", action="store_true",
+                        help="run all agents on an in-process bus (no XMPP server)")
+    parser.add_argument("--period", type=float, default=4,
+                        help="seconds between sensor readings (default 4)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="readings per sensor INFORM; 1 disables batching")
+    parser.add_argument("--flush-ms", type=int, default=500,
+                        help="max time a reading waits in a partial batch")
+    parser.add_argument("--sensors", type=int, default=1,
+                        help="number of SensorAgents, one zone each")
+    parser.add_argument("--risk-shards", type=int, default=1,
+                        help="RiskAgent instances, readings routed by zone")
+    parser.add_argument("--sensors-per-agent", type=int, default=1,
+                        help="host this many sensors on each agent (virtual sensors)")
+    parser.add_argument("--start-parallelism", type=int, default=64,
+                        help="sensor agents started at once (default 64)")
+    parser.add_argument("--rescue-workers", type=int, default=4,
+                        help="rescue tasks the RescueAgent runs at once")
+    parser.add_argument("--task-timeout", type=float, default=10.0,
+                        help="seconds before a rescue task is reported as TIMEOUT")
+    parser.add_argument("--queue-limit", type=int, default=100,
+                        help="pending requests the coordinator holds before REFUSEing")
+    parser.add_argument("--duration", type=float, default=40,
+                        help="seconds to run the agents for (default 40)")
+    parser.add_argument("--sim", action="store_true",
+                        help="headless run on a virtual clock (implies --local)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed the random generators for a reproducible run")
+    parser.add_argument("--log-level", default="INFO",
+                        help="DEBUG, INFO, WARNING, ... (default INFO)")
+    parser.add_argument("--store", metavar="PATH",
+                        help="SQLite file to keep events and incidents in across runs")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write a Prometheus text snapshot of the metrics here at exit")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="spread the agents over N processes (one RiskAgent shard "
+                             "per extra worker), bridged over Unix sockets")
+    parser.add_argument("--topology", metavar="PATH",
+                        help="JSON topology placing agents in worker processes "
+                             "(see common/runtime.py); overrides --workers")
+    parser.add_argument("--capture", metavar="PATH",
+                        help="append every message the agents send to this capture file")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="send the sensor readings of a capture instead of random ones "
+                             "(implies --local); runs --duration seconds past its end")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay pace: 1 as recorded, N times faster, 0 as fast as "
+                             "the agents keep up (default 1)")
+    parser.add_argument("--status", type=int, metavar="PORT",
+                        help="serve live status on http://127.0.0.1:PORT/status and "
+                             "ws://127.0.0.1:PORT/ws")
+    parser.add_argument("--sample-budget", type=float, metavar="RATE",
+                        help="adapt each sensor's period to its zone's trend, the whole "
+                             "fleet sending at most RATE readings per second")
+    args = parser.parse_args()
+    multiprocess = args.workers > 0 or args.topology
+    if multiprocess and (args.sim or args.store or args.capture or args.replay
+                         or args.status is not None):
+        parser.error("--workers/--topology cannot be combined with --sim, --store, "
+                     "--capture, --replay or --status")
+    if args.sim and args.status is not None:
+        parser.error("--status needs a real clock; it cannot be combined with --sim")
+    if args.sample_budget and args.sensors_per_agent > 1:
+        parser.error("--sample-budget needs one sensor per agent")
+    if multiprocess and args.sample_budget:
+        parser.error("--sample-budget cannot be combined with --workers/--topology")
+    logs.setup(args.log_level.upper())
+    if multiprocess:
+        placement = runtime.load_topology(args.topology) if args.topology else topology(
+            args.workers, sensors=args.sensors, period=args.period,
+            batch_size=args.batch_size, flush_ms=args.flush_ms,
+            rescue_workers=args.rescue_workers, task_timeout=args.task_timeout,
+            queue_limit=args.queue_limit)
+        run_workers(placement, args.duration, args.log_level.upper())
+        logs.shutdown()
+        sys.exit(0)
+    scenario = main(local=args.local or args.sim or bool(args.replay), period=args.period,
+                    batch_size=args.batch_size, flush_ms=args.flush_ms,
+                    sensors=args.sensors, risk_shards=args.risk_shards,
+                    rescue_workers=args.rescue_workers, task_timeout=args.task_timeout,
+                    queue_limit=args.queue_limit, duration=args.duration, store=args.store,
+                    sensors_per_agent=args.sensors_per_agent,
+                    start_parallelism=args.start_parallelism, capture=args.capture,
+                    replay=args.replay, replay_speed=args.replay_speed,
+                    status=args.status, sample_budget=args.sample_budget)
+    if args.sim:
+        simclock.run(scenario, seed=args.seed)
+    else:
+        if args.seed is not None:
+            simclock.seed_all(args.seed)
+        spade.run(scenario)
+    logs.shutdown()
+    if args.metrics:
+        REGISTRY.write(args.metrics)
\ No newline at end of file